@@ -1,9 +1,15 @@
 # Author: Alex Hemmerlin
 # This file implements A* Search
 
-from NPuzzle import NPuzzle
+from NPuzzle import NPuzzle, geometry
+from PriorityQueues import BinaryHeap
+from Instrumentation import SearchStats, search_stats
+from NodePool import NodePool
 from typing import Any
 import heapq
+import itertools
+import time
+import tracemalloc
 
 class Node:
     """Data class to store an 8 puzzle state and some useful information
@@ -43,117 +49,493 @@ def in_list(item, list):
             return True
     return False
 
-def generate_successor(successor: NPuzzle, parent: Node, fringe: list[Node], closed: list, verbosity: int):
-    """Generates the successor node for the given puzzle and checks the fringe for other paths to it"""
-
-    # Check the closed list for this state: if not in the closed list generate the state
-    if not in_list(successor.state, closed):
-        # Create the node for this state
-        s_node: Node = Node(successor.manhatten_distance()+parent.moves+1, successor, parent, parent.moves+1)
-
-        # Debugging info
-        if verbosity >= 2:
-            print(f'Generating successor:\n{s_node.puzzle.string()}', end="")
-            print(f'With a priority of: {s_node.priority}')
-            if verbosity == 2:
-                print()
-        # check the fringe for this state and value
-        for val in fringe:
-            # if the state is in the fringe with better path to it, just return
-            if s_node.puzzle.state == val.puzzle.state and s_node.priority > val.priority:
-                if verbosity >= 3:
-                    print('Successor NOT added to fringe (a better path has already been found)')
-                return 1
-            # else if this state has the better path, replace it in the fringe
-            elif s_node.puzzle.state == val.puzzle.state and s_node.priority < val.priority:
-                if verbosity >= 3:
-                    print('Successor REPLACES other state/path in the fringe (better than the previoulsy found path)')
-                fringe.remove(val)
-                break
-
-        # Add the node to the fringe
-        if verbosity >= 3:
-            print('Successor added to fringe')
-            if verbosity != 2:
-                print()
-        fringe.append(s_node)
-        # Re organize the fringe (re heap the min heap to keep the priority queue)
-        heapq.heapify(fringe)
-        return 1
-
-    return 0
-
-def AStarSearch(puzzle: NPuzzle, verbosity: int = 0) -> Node:
-    """Performs A* Search on the given puzzle instance using the manhatten distance heuristic
+# How many expansions happen between checks of a search's deadline
+CHECK_EVERY = 256
+
+class BestFirstSearch:
+    """The node store, expansion and successor generation of A*, shared by AStarSearch and the searches
+    of AnytimeSearch.py, which only differ in which node they expand next and what they do with a solution
+
+    A search is run by run(select, push, on_solution):
+    - select() returns the id of the next node to expand, or None to stop
+    - push(parent, children) is given the (id, h) of each successor stored when parent is expanded, to
+      put them in the search's open list(s)
+    - on_solution(node) is called when a goal node is selected and returns True to stop (a goal node
+      is never expanded)
+    With reopen False a state is not generated again once it has been expanded (A* with a consistent
+    heuristic). With reopen a shorter path to an expanded state gives a new node that is pushed again.
+    Successors are stored unless the state already has a node with at most as many moves, or g + h is not
+    under bound (the length of the best solution found, if set).
+
+    - pool: the NodePool of the nodes, with f = g + h
+    - seen: the id of the node with the fewest moves found so far to each state, by state key
+    - root/root_h: the id of the start node and its h
+    - expanded/generated/duplicates/peak_fringe: the counts given to stats by finish()
+    - lowest_h: the lowest h of the successors generated by the last expansion (None if there were none)
+    """
 
-    With a verbosity greater than 0 the program prints out extra information (can be set to 0, 1, 2, or 3)
+    def __init__(self, puzzle: NPuzzle, heuristic=NPuzzle.manhatten_distance, stats: SearchStats = None,
+                 verbosity: int = 0, reopen: bool = False):
+        self.start_time = time.perf_counter()
+        # Instrumentation is only set up (heuristic wrapped, events bound) when there are stats
+        self.stats = search_stats(stats, verbosity)
+        self.on_expand = self.on_generate = self.on_duplicate = None
+        # the pool seeds the boards of expanded nodes with the heuristic itself, that is not an evaluation
+        self.pool = NodePool(puzzle.n, heuristic)
+        if self.stats is not None:
+            heuristic = self.stats.wrap_heuristic(heuristic)
+            self.on_expand, self.on_generate, self.on_duplicate = (self.stats.on_expand, self.stats.on_generate,
+                                                                   self.stats.on_duplicate)
+        self.heuristic = heuristic
+        self.reopen = reopen
+        self.bound = None
+        self.expanded = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.peak_fringe = 0
+        self.lowest_h = None
+
+        self.root_h = heuristic(puzzle)
+        self.root = self.pool.add_puzzle(puzzle, 0, self.root_h)
+        self.seen = {puzzle.key: self.root}
+
+    def is_current(self, node: int) -> bool:
+        """True if node is the node with the fewest moves found to its state (else its entries are stale)"""
+
+        return self.seen[self.pool.states[node]] == node
+
+    def successors(self, parent: int, board: NPuzzle) -> list[tuple[int, int]]:
+        """Generates the successors of node parent (whose board is board) and returns the (id, h) of those stored
+
+        The move back to the parent's parent is not generated.
+        """
+
+        pool = self.pool
+        seen = self.seen
+        heuristic = self.heuristic
+        on_generate = self.on_generate
+        g = pool.g[parent] + 1
+        reverse = (pool.moves[parent] + 2) % 4 if pool.moves[parent] >= 0 else -1
+        children = []
+        self.lowest_h = None
+        for move in range(4):
+            if move == reverse:
+                continue
+            # generate copy of the puzzle to manipulate
+            successor: NPuzzle = board.copy()
+            if not successor.move(move):
+                continue
+            key = successor.key
+            stored = seen.get(key)
+            # Check the closed list for this state: if in the closed list do not generate the state
+            if not self.reopen and stored is not None and pool.closed[stored]:
+                self.duplicates += 1
+                continue
+
+            h = heuristic(successor)
+            self.generated += 1
+            if on_generate is not None:
+                on_generate(successor, g, g + h)
+            if self.lowest_h is None or h < self.lowest_h:
+                self.lowest_h = h
+            if self.bound is not None and g + h >= self.bound:
+                continue
+            # if the state already has a path at least as good, do not add it
+            if stored is not None and pool.g[stored] <= g:
+                self.duplicates += 1
+                if self.on_duplicate is not None:
+                    self.on_duplicate(successor, 'Successor NOT added to fringe (a better path has already been found)')
+                continue
+
+            # Add the node (if the state already had one, that node's entries become stale)
+            child = pool.add_puzzle(successor, g, g + h, parent, move)
+            seen[key] = child
+            children.append((child, h))
+        return children
+
+    def run(self, select, push, on_solution, deadline: float = None, fringe_size=None) -> bool:
+        """Expands the nodes chosen by select until it returns None or on_solution returns True
+
+        deadline is a time.perf_counter() value, checked every CHECK_EVERY expansions
+        fringe_size is an optional function returning the size of the open list(s), for peak_fringe
+        Returns False if the deadline passed, else True.
+        """
+
+        pool = self.pool
+        on_expand = self.on_expand
+        while True:
+            if deadline is not None and self.expanded % CHECK_EVERY == 0 and time.perf_counter() > deadline:
+                return False
+            if fringe_size is not None:
+                size = fringe_size()
+                if size > self.peak_fringe:
+                    self.peak_fringe = size
+
+            node = select()
+            if node is None:
+                return True
+            pool.closed[node] = 1
+            board = pool.board(node)
+            if on_expand is not None:
+                on_expand(board, pool.g[node], pool.f[node])
+            if board.is_solved:
+                if on_solution(node):
+                    return True
+                continue
+            self.expanded += 1
+            push(node, self.successors(node, board))
+
+    def finish(self):
+        """Gives the counts to stats, called when the search ends (or is stopped)"""
+
+        if self.stats is not None:
+            self.stats.record(self.expanded, self.generated, self.duplicates, self.peak_fringe,
+                              time.perf_counter() - self.start_time)
+
+def AStarSearch(puzzle: NPuzzle, verbosity: int = 0, fringe_type=BinaryHeap, heuristic=NPuzzle.manhatten_distance,
+                stats: SearchStats = None) -> Node:
+    """Performs A* Search on the given puzzle instance using the manhatten distance heuristic by default
 
+    With a verbosity greater than 0 the program prints out extra information (can be set to 0, 1, 2, or 3)
+    fringe_type is the priority queue used for the fringe, any class from PriorityQueues.py
+    (BinaryHeap, BucketQueue or TwoLevelBucketQueue) or a function returning a new queue
+    heuristic is any function taking an NPuzzle and returning an admissible estimate of its distance
+    to the goal, such as NPuzzle.manhatten_distance or a PatternDatabase
+    stats is an optional Instrumentation.SearchStats to fill with counters, timers and events
+
+    Nodes are kept in a NodePool (see BestFirstSearch) and the fringe holds their ids, the returned
+    solution node is built from the pool once the goal is found.
     Returns a tuple of three items including (the solution node, number of nodes generated, peak fringe size)
-    If the provided puzzle instance is not solvable, returns False.
+    If the provided puzzle instance is not solvable, returns False without searching.
 
     Loosely based on the psuedocode found here: https://mat.uab.cat/~alseda/MasterOpt/AStar-Algorithm.pdf
     Also based on the discussion of A* in class and the notes from the lecture
     """
 
-    # Initialize the variables to measure runtime and memory
-    num_nodes_generated = 0
-    peak_fringe_size = 0
+    if not puzzle.is_solvable:
+        return False
+
+    search = BestFirstSearch(puzzle, heuristic, stats, verbosity)
+    if search.stats is not None:
+        fringe_type = search.stats.wrap_fringe(fringe_type)
+    pool = search.pool
 
     # Initialize the fringe with the starting state
-    fringe = []
-    fringe.append(Node(puzzle.manhatten_distance(), puzzle, None, 0))
-    # Initialize the closed list
-    closed = []
+    fringe = fringe_type()
+    fringe.push(search.root, search.root_h, search.root_h)
+    solution = None
+
+    def select():
+        # get the best item in the fringe, skipping stale entries (a better path to the state was found later)
+        while len(fringe) > 0:
+            node = fringe.pop()
+            if search.is_current(node):
+                return node
+            search.duplicates += 1
+        return None
+
+    def push(parent, children):
+        for child, h in children:
+            fringe.push(child, pool.f[child], h)
+
+    def on_solution(node):
+        nonlocal solution
+        solution = node
+        return True
+
+    try:
+        search.run(select, push, on_solution, fringe_size=fringe.__len__)
+    finally:
+        search.finish()
+
+    # the fringe can only run out for an unsolvable puzzle, which is rejected above
+    if solution is None:
+        return False
+    return (pool.chain(solution, Node), search.generated, search.peak_fringe)
+
+class BoundedNode(Node):
+    """Node of SMAStarSearch, with what is needed to forget successors and regenerate them later
+
+    - children: the successors currently stored (an empty tuple until the node is expanded)
+    - forgotten: the lowest f of the successors pruned since the node was last expanded (inf if none)
+    - open: True while the node is in the fringe, either not expanded yet or waiting to regenerate
+      forgotten successors
+    - fringe_f: the priority of the node in the fringe
+    - version: bumped each time the node is put in the fringe, older fringe entries for it are stale
+    """
+    children: list
+    forgotten: float
+    open: bool
+    fringe_f: float
+    version: int
+    def __init__(self, priority, puzzle, parent, moves):
+        super().__init__(priority, puzzle, parent, moves)
+        self.children = ()
+        self.forgotten = float('inf')
+        self.open = False
+        self.fringe_f = priority
+        self.version = 0
+    def remove_child(self, child):
+        """Removes child from children (by identity, == on nodes compares priorities)"""
+        for i, stored in enumerate(self.children):
+            if stored is child:
+                del self.children[i]
+                return
+
+# Measured bytes per stored node of SMAStarSearch for each puzzle size
+_node_bytes: dict[int, int] = {}
+
+def node_bytes(n: int) -> int:
+    """Returns the memory one stored node of SMAStarSearch takes for the n-puzzle, measured with tracemalloc
+
+    Counts the node, its puzzle, its entry in the stored node dict, its two fringe entries and
+    its share of the successor lists of expanded nodes. Measured once per puzzle size.
+    """
 
-    # While the fringe is not empty: loop
-    while len(fringe) > 0:
-    
-        # Update the memory tracking variable to measure peak fringe size
-        if len(fringe) > peak_fringe_size:
-            peak_fringe_size = len(fringe)
-
-        # get the best item in the fringe
-        parent: Node = fringe.pop(0)
-
-        # Debugging info
-        if verbosity >= 1:
-            print(f'State removed from fringe:\n{parent.puzzle.string()}', end="")
-            print(f'With a priority of: {parent.priority}')
-            if verbosity >= 2:
-                if parent.parent is not None:
-                    print(f'This states parent is:\n{parent.parent.puzzle.string()}', end="")
-                else:
-                    print(f'This state has no parent (start state)')
-            print()
-
-        # check if it is the goal: if goal -> return
-        if parent.puzzle.is_solved:
-            if verbosity >= 1:
-                print('GOAL FOUND')
-            return (parent, num_nodes_generated, peak_fringe_size)
-
-        # add it to the closed list: we are exploring it
-        closed.append(parent.puzzle.state)
-        if verbosity >= 3:
-            print(f'State added to closed list:\n{parent.puzzle.string()}')
-
-        # Generate Successors (4 possible moves: up, down, left, right)
-        for i in range(4):
-            # generate copy of the puzzle to manipulate
-            successor: NPuzzle = NPuzzle(parent.puzzle.n, parent.puzzle.state)
-            
-            # make the moves and generate the successors
-            if i == 0 and successor.move_up():
-                num_nodes_generated += generate_successor(successor, parent, fringe, closed, verbosity)
-            if i == 1 and successor.move_right():
-                num_nodes_generated += generate_successor(successor, parent, fringe, closed, verbosity)
-            if i == 2 and successor.move_down():
-                num_nodes_generated += generate_successor(successor, parent, fringe, closed, verbosity)
-            if i == 3 and successor.move_left():
-                num_nodes_generated += generate_successor(successor, parent, fringe, closed, verbosity)
-
-    # if the fringe is empty without finding a goal state, then the puzzle is unsolvable so return false
-    return False
+    size = _node_bytes.get(n)
+    if size is None:
+        count = 1000
+        sample = NPuzzle.from_packed(n, geometry(n).goal_packed)
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        # measured twice, the first time also counts one-off allocations (caches, interned objects)
+        for attempt in range(2):
+            before = tracemalloc.get_traced_memory()[0]
+            nodes, best, worst = {}, [], []
+            expanded = [[] for i in range(count // 4)]
+            for i in range(count):
+                puzzle = sample.copy()
+                # a distinct packed state of about the right size, so the key is as big as a real one
+                puzzle.packed = sample.packed + i
+                node = BoundedNode(i, puzzle, None, i)
+                nodes[puzzle.key] = node
+                best.append((i, -i, i, 0, node))
+                worst.append((-i, i, i, 0, node))
+                expanded[i // 4].append(node)
+            size = (tracemalloc.get_traced_memory()[0] - before) // count
+            del nodes, best, worst, expanded
+        if not tracing:
+            tracemalloc.stop()
+        _node_bytes[n] = size
+    return size
+
+def SMAStarSearch(puzzle: NPuzzle, max_nodes: int = None, max_memory: int = None, verbosity: int = 0,
+                  heuristic=NPuzzle.manhatten_distance, stats: SearchStats = None) -> BoundedNode:
+    """Performs memory bounded A* search (SMA*) keeping at most max_nodes nodes, or max_memory bytes of nodes
+
+    Works like A* but, before a node is expanded, the leaves with the highest f (the shallowest of those) are
+    pruned until its successors fit in the budget, and their f is backed up into their parents. The parent goes back into
+    the fringe with the lowest f it forgot, and is expanded again (regenerating what it forgot) if that
+    becomes the best f. Solutions found are still shortest as long as the budget holds the solution path
+    and the heuristic is consistent (all of the heuristics in this project are). At most max_nodes nodes
+    are stored unless the budget cannot hold the path being searched and its successors.
+    With neither max_nodes nor max_memory nothing is pruned.
+    heuristic is any function taking an NPuzzle and returning an admissible estimate of its distance
+    to the goal, such as NPuzzle.manhatten_distance or a PatternDatabase
+    stats is an optional Instrumentation.SearchStats to fill with counters, timers and events
+
+    Returns a tuple of five items including (the solution node, number of nodes generated, peak number
+    of nodes stored, number of nodes pruned, peak memory of the stored nodes in bytes)
+    If the provided puzzle instance is not solvable, returns False without searching.
+    """
+
+    if not puzzle.is_solvable:
+        return False
+    if max_nodes is None and max_memory is not None:
+        max_nodes = max_memory // node_bytes(puzzle.n)
+    if max_nodes is None:
+        max_nodes = float('inf')
+
+    num_nodes_generated = 0
+    num_nodes_expanded = 0
+    num_duplicates = 0
+    num_pruned = 0
+    peak_nodes = 1
+
+    stats = search_stats(stats, verbosity)
+    on_expand = on_generate = on_duplicate = None
+    if stats is not None:
+        start_time = time.perf_counter()
+        heuristic = stats.wrap_heuristic(heuristic)
+        on_expand, on_generate, on_duplicate = stats.on_expand, stats.on_generate, stats.on_duplicate
+
+    # Every stored node by state key. Open nodes are in the best heap (lowest f, deepest first) to be
+    # expanded, open leaves (no stored successors) also in the worst heap (highest f, shallowest first) to be pruned
+    nodes: dict[int, BoundedNode] = {}
+    best = []
+    worst = []
+    counter = itertools.count()
+    open_leaves = 0
+
+    def push(node: BoundedNode, f):
+        """Puts node in the fringe with priority f, replacing any entry it had"""
+
+        nonlocal open_leaves, best, worst
+        if not node.open:
+            node.open = True
+            if not node.children:
+                open_leaves += 1
+        node.version += 1
+        node.fringe_f = f
+        count = next(counter)
+        heapq.heappush(best, (f, -node.moves, count, node.version, node))
+        if not node.children:
+            heapq.heappush(worst, (-f, node.moves, count, node.version, node))
+        # drop stale entries once they are most of a heap, so the heaps stay the size of the stored nodes
+        if len(best) > 2 * len(nodes) + 64:
+            best = [entry for entry in best if entry[4].open and entry[3] == entry[4].version]
+            worst = [entry for entry in worst if entry[4].open and entry[3] == entry[4].version and not entry[4].children]
+            heapq.heapify(best)
+            heapq.heapify(worst)
+
+    def close(node: BoundedNode):
+        """Takes node out of the fringe (its entries become stale)"""
+
+        nonlocal open_leaves
+        if node.open:
+            node.open = False
+            if not node.children:
+                open_leaves -= 1
+
+    def release(node: BoundedNode):
+        """Called when node has just lost its last stored successor. If it is in the fringe (it forgot some)
+        it becomes a leaf that can be pruned, otherwise nothing is left to search below it and it is dropped
+        too. Successors skipped as duplicates do not count, a path at least as short to them is stored."""
+
+        nonlocal open_leaves
+        while node is not None:
+            if node.open:
+                open_leaves += 1
+                push(node, node.fringe_f)
+                return
+            del nodes[node.puzzle.key]
+            parent = node.parent
+            if parent is not None:
+                parent.remove_child(node)
+                if parent.children:
+                    return
+            node = parent
+
+    def forget(leaf: BoundedNode):
+        """Prunes an open leaf, backing its f up into its parent"""
+
+        nonlocal open_leaves
+        close(leaf)
+        del nodes[leaf.puzzle.key]
+        parent = leaf.parent
+        parent.remove_child(leaf)
+        parent.forgotten = min(parent.forgotten, leaf.fringe_f)
+        f = min(parent.fringe_f, parent.forgotten) if parent.open else parent.forgotten
+        if parent.open and not parent.children:
+            open_leaves += 1
+            push(parent, f)
+        elif not parent.open or f < parent.fringe_f:
+            push(parent, f)
+
+    def discard(node: BoundedNode):
+        """Removes node and everything stored below it, after a shorter path to its state was found"""
+
+        parent = node.parent
+        parent.remove_child(node)
+        below = [node]
+        while below:
+            node = below.pop()
+            close(node)
+            del nodes[node.puzzle.key]
+            below.extend(node.children)
+        if not parent.children:
+            release(parent)
+
+    def prune(limit, keep: BoundedNode = None):
+        """Prunes the worst leaves until at most limit nodes are stored (the last open leaf is always kept),
+        leaving out the successors of keep"""
+
+        nonlocal num_pruned
+        kept = []
+        while len(nodes) > limit and open_leaves > 1 and worst:
+            entry = heapq.heappop(worst)
+            leaf = entry[4]
+            if not leaf.open or entry[3] != leaf.version or leaf.children:
+                continue
+            if leaf.parent is keep and keep is not None:
+                kept.append(entry)
+                continue
+            forget(leaf)
+            num_pruned += 1
+        for entry in kept:
+            heapq.heappush(worst, entry)
+
+    neighbors = geometry(puzzle.n).neighbors
+    root = BoundedNode(heuristic(puzzle), puzzle.copy(), None, 0)
+    nodes[root.puzzle.key] = root
+    push(root, root.priority)
+
+    try:
+        while best:
+            f, depth, count, version, node = heapq.heappop(best)
+            if not node.open or version != node.version:
+                continue
+            close(node)
+
+            if on_expand is not None:
+                on_expand(node.puzzle, node.moves, f)
+            if node.puzzle.is_solved:
+                return (node, num_nodes_generated, peak_nodes, num_pruned, peak_nodes * node_bytes(puzzle.n))
+            num_nodes_expanded += 1
+
+            # Make room for the successors first, so no more than max_nodes are ever stored. The node's own
+            # stored successors are not pruned for it, that would only reopen the node being expanded.
+            if max_nodes != float('inf'):
+                room = sum(1 for target in neighbors[node.puzzle.blank] if target >= 0) - len(node.children)
+                if node.parent is not None:
+                    room -= 1
+                prune(max_nodes - room, node)
+
+            # Generate the successors that are not stored (all of them the first time the node is expanded)
+            parent_key = node.parent.puzzle.key if node.parent is not None else None
+            moves = node.moves + 1
+            node.forgotten = float('inf')
+            if not node.children:
+                node.children = []
+            for move in range(4):
+                successor = node.puzzle.copy()
+                if not successor.move(move):
+                    continue
+                key = successor.key
+                # the parent is always stored, so undoing the last move is never useful
+                if key == parent_key:
+                    continue
+                stored = nodes.get(key)
+                if stored is not None:
+                    if stored.moves <= moves:
+                        if stored.parent is not node:
+                            num_duplicates += 1
+                            if on_duplicate is not None:
+                                on_duplicate(successor, 'Successor NOT added (a path at least as short is stored)')
+                        continue
+                    # a shorter path to a stored state: search on from here instead
+                    discard(stored)
+                num_nodes_generated += 1
+                child = BoundedNode(max(moves + heuristic(successor), f), successor, node, moves)
+                if on_generate is not None:
+                    on_generate(successor, moves, child.priority)
+                nodes[key] = child
+                node.children.append(child)
+                push(child, child.priority)
+            if not node.children:
+                release(node)
+
+            if len(nodes) > peak_nodes:
+                peak_nodes = len(nodes)
+            # Room could not be made above when every other leaf is on the path to the node, prune now
+            prune(max_nodes)
+
+        return False
+    finally:
+        if stats is not None:
+            stats.record(num_nodes_expanded, num_nodes_generated, num_duplicates, peak_nodes,
+                         time.perf_counter() - start_time)
 
 def get_path(result: Node):
     path = []
@@ -187,5 +569,11 @@ def main():
     print(f'RUNTIME (TOTAL NUMBER OF NODES GENERATED): {runtime}')
     print(f'MEMORY USAGE (PEAK FRINGE SIZE (NUMBER OF NODES)): {memory}')
 
+    print('SEARCHING WITH SMAStarSearch (AT MOST 6 NODES STORED)')
+    result, runtime, memory, pruned, peak_bytes = SMAStarSearch(puzzle = p1, max_nodes = 6)
+    print(f'PATH LENGTH: {result.moves}')
+    print(f'RUNTIME (TOTAL NUMBER OF NODES GENERATED): {runtime}')
+    print(f'MEMORY USAGE (PEAK NODES STORED): {memory} ({peak_bytes} bytes), NODES PRUNED: {pruned}')
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,345 @@
+# Author: Alex Hemmerlin
+# This file implements bounded suboptimal and anytime versions of A* (Weighted A*, ARA* and EES)
+
+from NPuzzle import NPuzzle, geometry
+from AStarSearch import Node, BestFirstSearch
+from Instrumentation import SearchStats
+import heapq
+import itertools
+import time
+
+
+def top(heap: list, is_open) -> tuple:
+    """Drops the entries of nodes that are no longer open from the top of heap (entries end with the node id)
+    and returns the top entry, None if there are none"""
+
+    while heap and not is_open(heap[0][-1]):
+        heapq.heappop(heap)
+    return heap[0] if heap else None
+
+
+def lowest_f(heap: list, is_open) -> float:
+    """Returns the lowest f of the open nodes in a heap ordered by f, the lower bound on the length of
+    a solution (inf if there are no open nodes)"""
+
+    entry = top(heap, is_open)
+    return entry[0] if entry is not None else float('inf')
+
+
+def proven_bound(cost: int, lower: float) -> float:
+    """Returns how many times longer than a shortest solution a solution of cost can be, given a lower bound"""
+
+    if lower >= cost:
+        return 1.0
+    return cost / lower if lower > 0 else float('inf')
+
+
+def WeightedAStar(puzzle: NPuzzle, w: float = 2.0, timeout: float = None, anytime: bool = True,
+                  heuristic=NPuzzle.manhatten_distance, verbosity: int = 0, stats: SearchStats = None) -> Node:
+    """Performs Weighted A* (priority g + w*h), whose first solution is at most w times longer than a shortest one
+
+    With anytime (Anytime Weighted A*, Hansen and Zhou 2007) the search goes on after the first solution,
+    pruning nodes that cannot beat it and reopening states reached by a shorter path, so each solution
+    found is shorter than the last. It stops when no open node can lead to a shorter solution (the last
+    one is a shortest) or after timeout seconds.
+    heuristic is any function taking an NPuzzle and returning an admissible estimate of its distance
+    to the goal, such as NPuzzle.manhatten_distance or a PatternDatabase
+    stats is an optional Instrumentation.SearchStats to fill with counters, timers and events
+
+    Returns a tuple of four items including (the best solution node or None, number of nodes generated,
+    the proven bound: the best solution is at most that many times longer than a shortest one,
+    a list of (length, seconds, bound) for each solution found)
+    If the provided puzzle instance is not solvable, returns (None, 0, inf, []) without searching.
+    """
+
+    if not puzzle.is_solvable:
+        return None, 0, float('inf'), []
+
+    search = BestFirstSearch(puzzle, heuristic, stats, verbosity, reopen=True)
+    deadline = search.start_time + timeout if timeout is not None else None
+    pool = search.pool
+    h = search.root_h
+    counter = itertools.count()
+    # (g + w*h, h, count, id): ties go to the node closest to the goal. by_f has the same nodes by g + h.
+    fringe = [(w * h, h, next(counter), search.root)]
+    by_f = [(h, search.root)]
+    best = None
+    solutions = []
+
+    def is_open(node: int) -> bool:
+        return not pool.closed[node] and search.is_current(node) and (best is None or pool.f[node] < pool.g[best])
+
+    def select():
+        while fringe:
+            node = heapq.heappop(fringe)[3]
+            if is_open(node):
+                return node
+            search.duplicates += 1
+        return None
+
+    def push(parent, children):
+        # new states, or shorter paths to states (reopened if they were closed)
+        for child, h in children:
+            g = pool.g[child]
+            heapq.heappush(fringe, (g + w * h, h, next(counter), child))
+            heapq.heappush(by_f, (g + h, child))
+
+    def on_solution(node):
+        nonlocal best
+        best = node
+        search.bound = pool.g[node]
+        solutions.append((pool.g[node], time.perf_counter() - search.start_time,
+                          proven_bound(pool.g[node], lowest_f(by_f, is_open))))
+        return not anytime
+
+    try:
+        search.run(select, push, on_solution, deadline, lambda: len(fringe))
+    finally:
+        search.finish()
+
+    if best is None:
+        return None, search.generated, float('inf'), solutions
+    return (pool.chain(best, Node), search.generated,
+            proven_bound(pool.g[best], lowest_f(by_f, is_open)), solutions)
+
+
+def ARAStar(puzzle: NPuzzle, w: float = 3.0, timeout: float = None, step: float = 0.5,
+            heuristic=NPuzzle.manhatten_distance, verbosity: int = 0, stats: SearchStats = None) -> Node:
+    """Performs Anytime Repairing A* (Likhachev, Gordon and Thrun 2003)
+
+    Runs weighted A* with weight w, then lowers w by step (down to 1) and repairs the search instead of
+    starting again: states whose path got shorter after they were expanded in this round are kept aside
+    (INCONS) and put back in the fringe, re-sorted with the new weight, for the next round. Every round
+    gives a solution at most w times longer than a shortest one, and the last round (w = 1) a shortest one.
+    Stops after timeout seconds with the best solution found so far.
+    heuristic is any function taking an NPuzzle and returning an admissible estimate of its distance
+    to the goal, such as NPuzzle.manhatten_distance or a PatternDatabase
+    stats is an optional Instrumentation.SearchStats to fill with counters, timers and events
+
+    Returns a tuple of four items including (the best solution node or None, number of nodes generated,
+    the proven bound: the best solution is at most that many times longer than a shortest one,
+    a list of (length, seconds, bound) for each solution found)
+    If the provided puzzle instance is not solvable, returns (None, 0, inf, []) without searching.
+    """
+
+    if not puzzle.is_solvable:
+        return None, 0, float('inf'), []
+
+    search = BestFirstSearch(puzzle, heuristic, stats, verbosity, reopen=True)
+    deadline = search.start_time + timeout if timeout is not None else None
+    pool = search.pool
+    seen = search.seen
+    goal_key = geometry(puzzle.n).goal_packed
+    h = search.root_h
+    counter = itertools.count()
+    fringe = [(w * h, h, next(counter), search.root)]
+    # every node not expanded yet (in the fringe or INCONS) by g + h, for the lower bound
+    by_f = [(h, search.root)]
+    # states expanded in this round, and nodes of states expanded in this round that have since been improved
+    closed = set()
+    incons = []
+    solutions = []
+    timed_out = False
+
+    def is_open(node: int) -> bool:
+        return search.is_current(node) and pool.states[node] not in closed
+
+    def not_expanded(node: int) -> bool:
+        return search.is_current(node) and not pool.closed[node]
+
+    def select():
+        """Returns the next node of the round, None once the goal has no larger priority than any node in the fringe"""
+
+        while fringe:
+            entry = fringe[0]
+            if not is_open(entry[3]):
+                heapq.heappop(fringe)
+                continue
+            goal = seen.get(goal_key)
+            if goal is not None and pool.g[goal] <= entry[0]:
+                return None
+            heapq.heappop(fringe)
+            closed.add(pool.states[entry[3]])
+            return entry[3]
+        return None
+
+    def push(parent, children):
+        for child, h in children:
+            heapq.heappush(by_f, (pool.f[child], child))
+            if pool.states[child] in closed:
+                incons.append(child)
+            else:
+                heapq.heappush(fringe, (pool.g[child] + w * h, h, next(counter), child))
+
+    def on_solution(node):
+        # never reached, the round ends before the goal is selected
+        return True
+
+    def publish(round_w: float):
+        """Records the best solution so far, with its bound (round_w is the weight of the last finished round)"""
+
+        goal = seen.get(goal_key)
+        if goal is None:
+            return
+        bound = min(round_w, proven_bound(pool.g[goal], lowest_f(by_f, not_expanded)))
+        if not solutions or pool.g[goal] < solutions[-1][0] or bound < solutions[-1][2]:
+            solutions.append((pool.g[goal], time.perf_counter() - search.start_time, bound))
+
+    try:
+        while True:
+            timed_out = not search.run(select, push, on_solution, deadline, lambda: len(fringe) + len(incons))
+            if timed_out:
+                break
+            publish(w)
+            if not solutions or solutions[-1][2] <= 1 or w <= 1:
+                break
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            w = max(1.0, w - step)
+            # Move INCONS into the fringe and re-sort it for the new weight, starting a new round
+            nodes = {entry[3] for entry in fringe if is_open(entry[3])}
+            nodes.update(node for node in incons if search.is_current(node))
+            incons = []
+            closed.clear()
+            fringe = [(pool.g[node] + w * (pool.f[node] - pool.g[node]), pool.f[node] - pool.g[node], next(counter), node)
+                      for node in nodes]
+            heapq.heapify(fringe)
+    finally:
+        search.finish()
+
+    goal = seen.get(goal_key)
+    if goal is None:
+        return None, search.generated, float('inf'), solutions
+    if timed_out:
+        # the goal may have been reached by a shorter path during the unfinished round, whose w is not proven yet
+        publish(solutions[-1][2] if solutions else float('inf'))
+    return pool.chain(goal, Node), search.generated, solutions[-1][2], solutions
+
+
+def EES(puzzle: NPuzzle, w: float = 2.0, timeout: float = None, anytime: bool = True,
+        heuristic=NPuzzle.manhatten_distance, verbosity: int = 0, stats: SearchStats = None) -> Node:
+    """Performs Explicit Estimation Search (Thayer and Ruml 2011), whose first solution is at most w times
+    longer than a shortest one
+
+    Besides the admissible h, EES keeps an inadmissible estimate h_hat of the distance to the goal: h
+    corrected by the average amount h falls short over a single move, learned as the search goes. Each
+    expansion picks, in order of preference:
+    - the node with the lowest h_hat among those with f_hat = g + h_hat within w of the lowest f_hat
+      (the one that looks closest to a solution good enough), if its f_hat is within w of the lowest f
+    - the node with the lowest f_hat, if that is within w of the lowest f
+    - the node with the lowest f, which raises the lower bound
+    With anytime the search goes on after the first solution like WeightedAStar, pruning nodes that cannot
+    beat it, until it is proven shortest or timeout seconds have passed.
+    heuristic is any function taking an NPuzzle and returning an admissible estimate of its distance
+    to the goal, such as NPuzzle.manhatten_distance or a PatternDatabase
+    stats is an optional Instrumentation.SearchStats to fill with counters, timers and events
+
+    Returns a tuple of four items including (the best solution node or None, number of nodes generated,
+    the proven bound: the best solution is at most that many times longer than a shortest one,
+    a list of (length, seconds, bound) for each solution found)
+    If the provided puzzle instance is not solvable, returns (None, 0, inf, []) without searching.
+    """
+
+    if not puzzle.is_solvable:
+        return None, 0, float('inf'), []
+
+    search = BestFirstSearch(puzzle, heuristic, stats, verbosity, reopen=True)
+    deadline = search.start_time + timeout if timeout is not None else None
+    pool = search.pool
+    h = search.root_h
+    root = search.root
+    counter = itertools.count()
+    # The three orders: by f, by f_hat, and the focal list (f_hat within w of the lowest f_hat) by h_hat.
+    # Nodes over the focal limit wait by f_hat until the limit rises past them. Entries of closed or
+    # replaced nodes are dropped when they reach the top.
+    by_f = [(h, 0, next(counter), root)]
+    by_f_hat = [(h, h, next(counter), root)]
+    focal = [(h, h, next(counter), root)]
+    waiting = []
+    # running total of the one move error of h (h of the best successor + 1 - h of the parent)
+    error_sum = 0
+    error_count = 0
+    best = None
+    solutions = []
+
+    def is_open(node: int) -> bool:
+        return not pool.closed[node] and search.is_current(node) and (best is None or pool.f[node] < pool.g[best])
+
+    def select():
+        best_f = top(by_f, is_open)
+        if best_f is None:
+            return None
+        best_f_hat = top(by_f_hat, is_open)
+        # Move the nodes now within the focal limit out of waiting
+        limit = w * best_f_hat[0]
+        while waiting and (not is_open(waiting[0][3]) or waiting[0][0] <= limit):
+            entry = heapq.heappop(waiting)
+            if is_open(entry[3]):
+                heapq.heappush(focal, (entry[1], entry[0], entry[2], entry[3]))
+        # The focal limit can fall when a better f_hat is found: nodes over it go back to waiting
+        best_d = top(focal, is_open)
+        while best_d is not None and best_d[1] > limit:
+            heapq.heappop(focal)
+            heapq.heappush(waiting, (best_d[1], best_d[0], best_d[2], best_d[3]))
+            best_d = top(focal, is_open)
+
+        if best_d is not None and best_d[1] <= w * best_f[0]:
+            return best_d[3]
+        if best_f_hat[0] <= w * best_f[0]:
+            return best_f_hat[3]
+        return best_f[3]
+
+    def push(parent, children):
+        nonlocal error_sum, error_count
+        # learn the one move error from the best successor (h never drops by more than 1 a move)
+        if search.lowest_h is not None:
+            error_sum += search.lowest_h + 1 - (pool.f[parent] - pool.g[parent])
+            error_count += 1
+        error = error_sum / error_count if error_count else 0
+        for child, h in children:
+            # over the rest of the path h falls short by the mean error per move, about h / (1 - error) in all.
+            # With the manhatten distance the error is often close to 1, so h_hat is kept within w * h: larger
+            # estimates put almost every node over the w * f limit and EES would expand in f order like A*
+            h_hat = min(h / (1 - error) if error < 1 else float('inf'), w * h)
+            g = pool.g[child]
+            count = next(counter)
+            heapq.heappush(by_f, (g + h, -g, count, child))
+            heapq.heappush(by_f_hat, (g + h_hat, h_hat, count, child))
+            heapq.heappush(waiting, (g + h_hat, h_hat, count, child))
+
+    def on_solution(node):
+        nonlocal best
+        best = node
+        search.bound = pool.g[node]
+        solutions.append((pool.g[node], time.perf_counter() - search.start_time,
+                          proven_bound(pool.g[node], lowest_f(by_f, is_open))))
+        return not anytime
+
+    try:
+        search.run(select, push, on_solution, deadline, lambda: len(by_f))
+    finally:
+        search.finish()
+
+    if best is None:
+        return None, search.generated, float('inf'), solutions
+    return (pool.chain(best, Node), search.generated,
+            proven_bound(pool.g[best], lowest_f(by_f, is_open)), solutions)
+
+
+def main():
+    # a hard 15-puzzle instance (the first of Korf's 100, in this project's goal convention)
+    p1 = NPuzzle(15, [[13, 6, 8, 12], [15, 14, 0, 10], [11, 7, 4, 5], [9, 1, 3, 2]])
+
+    print('STARTING STATE:')
+    print(p1.string())
+
+    for search in (WeightedAStar, ARAStar, EES):
+        print(f'SEARCHING WITH {search.__name__} (W = 3, 10 SECONDS)')
+        result, runtime, bound, solutions = search(puzzle=p1, w=3, timeout=10)
+        for length, seconds, solution_bound in solutions:
+            print(f'  {length} moves after {seconds:.2f}s, at most {solution_bound:.3f} times a shortest solution')
+        print(f'PATH LENGTH: {result.moves} (PROVEN BOUND {bound:.3f})')
+        print(f'RUNTIME (TOTAL NUMBER OF NODES GENERATED): {runtime}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+# Author: Alex Hemmerlin
+# This file implements solving batches of puzzles in parallel over a process pool
+
+from NPuzzle import NPuzzle, HEURISTICS
+from AStarSearch import AStarSearch, SMAStarSearch
+from RBFS import RBFS_Search
+from IDAStar import IDAStar_Search
+from BidirectionalSearch import MMSearch, manhatten_to
+from AnytimeSearch import WeightedAStar, ARAStar, EES
+from StateSpace import OracleSearch
+from SolutionCache import SolutionCache, moves_of
+from TranspositionTable import TranspositionTable
+from RBFS import build_path
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterable, Iterator
+import argparse
+import itertools
+import json
+import math
+import os
+import resource
+import sys
+import time
+
+# The search engines that can be chosen by name
+ENGINES = {
+    'astar': AStarSearch,
+    'rbfs': RBFS_Search,
+    'idastar': IDAStar_Search,
+    'mm': MMSearch,
+    'smastar': SMAStarSearch,
+    'wastar': WeightedAStar,
+    'ara': ARAStar,
+    'ees': EES,
+    'oracle': OracleSearch,
+}
+
+# The engines that may return a solution that is not the shortest, with the bound they proved on it.
+# They take the timeout and weight themselves so they can return the best solution found when time runs out.
+ANYTIME_ENGINES = {'wastar', 'ara', 'ees'}
+
+# The engines that can use a TranspositionTable
+TABLE_ENGINES = {'idastar', 'rbfs'}
+
+
+class SearchLimitExceeded(Exception):
+    """Raised inside a search when it goes over its time, node or memory limit
+
+    - reason: 'timeout', 'node_limit' or 'memory_limit'
+    """
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def current_memory() -> int:
+    """Returns the resident memory of this process in bytes (the peak if the current value is not available)"""
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class LimitedHeuristic:
+    """Wraps a heuristic to stop a search that goes over its limits
+
+    Every search evaluates the heuristic once per node it generates, so the number of calls is used
+    as the node count. The deadline and memory are checked every check_every calls.
+    Raises SearchLimitExceeded when a limit is passed.
+    """
+
+    def __init__(self, heuristic, timeout: float = None, max_nodes: int = None, max_memory: int = None,
+                 check_every: int = 1024):
+        self.heuristic = heuristic
+        # lets NPuzzle.seed_heuristic see which heuristic is being limited
+        self.__wrapped__ = heuristic
+        self.deadline = time.time() + timeout if timeout is not None else None
+        self.max_nodes = max_nodes
+        self.max_memory = max_memory
+        self.check_every = check_every
+        self.evaluations = 0
+        self.next_check = self.__next_check__()
+
+    def __next_check__(self) -> int:
+        next_check = self.evaluations + self.check_every
+        # the call after the max_nodes-th is the first one over the limit
+        if self.max_nodes is not None and self.max_nodes + 1 < next_check:
+            next_check = self.max_nodes + 1
+        return next_check
+
+    def __count__(self):
+        """Counts one evaluation and raises SearchLimitExceeded if a limit is passed"""
+
+        self.evaluations += 1
+        if self.evaluations >= self.next_check:
+            if self.max_nodes is not None and self.evaluations > self.max_nodes:
+                raise SearchLimitExceeded('node_limit')
+            if self.deadline is not None and time.time() > self.deadline:
+                raise SearchLimitExceeded('timeout')
+            if self.max_memory is not None and current_memory() > self.max_memory:
+                raise SearchLimitExceeded('memory_limit')
+            self.next_check = self.__next_check__()
+
+    def __call__(self, puzzle: NPuzzle) -> int:
+        self.__count__()
+        return self.heuristic(puzzle)
+
+    def limit(self, heuristic):
+        """Returns another heuristic whose calls count against the same limits, for searches with two of them"""
+
+        limits = self
+
+        def limited(puzzle: NPuzzle) -> int:
+            limits.__count__()
+            return heuristic(puzzle)
+        limited.__wrapped__ = heuristic
+        return limited
+
+
+def load_heuristic(name: str):
+    """Returns the heuristic with the given name
+
+    One of the names in NPuzzle.HEURISTICS, or pdb:<partition> for a PatternDatabase (for example pdb:15-555)
+    """
+
+    if name.startswith('pdb:'):
+        from PatternDatabase import PatternDatabase
+        return PatternDatabase.load(name[4:])
+    return HEURISTICS[name]
+
+
+class BatchResult:
+    """Data class for the result of one puzzle of a batch
+
+    - index: the position of the puzzle in the batch
+    - status: 'solved', 'unsolvable', 'timeout', 'node_limit', 'memory_limit', 'unsolved', 'invalid: <message>'
+      (the board could not be parsed or is not a legal layout) or 'error: <message>'
+    - result: what the engine returned (for example (node, nodes generated, peak fringe size) for astar),
+      or None if the search did not finish
+    - wall_time: the time spent on this puzzle in seconds
+    - cached: True if the solution came from a SolutionCache, result is then (node, 0)
+    """
+    index: int
+    status: str
+    result: tuple
+    wall_time: float
+    cached: bool
+    def __init__(self, index, status, result, wall_time, cached=False):
+        self.index = index
+        self.status = status
+        self.result = result
+        self.wall_time = wall_time
+        self.cached = cached
+
+
+# Set in each worker process by __init_worker__ so the heuristic (and pattern database) is loaded once per process
+_worker_heuristic = None
+_worker_cache = None
+# The TranspositionTable of this process for each puzzle size, made the first time it is needed (see worker_table)
+_worker_tables: dict[int, TranspositionTable] = {}
+
+
+def __init_worker__(heuristic: str, cache: str = None):
+    global _worker_heuristic, _worker_cache
+    _worker_heuristic = load_heuristic(heuristic)
+    if cache is not None:
+        _worker_cache = SolutionCache(path=cache)
+
+
+def worker_table(n: int, max_bytes: int) -> TranspositionTable:
+    """Returns this process's TranspositionTable for the n-puzzle, made with max_bytes the first time
+
+    The table is reused by every puzzle of that size the process solves (each search empties it first).
+    """
+
+    table = _worker_tables.get(n)
+    if table is None:
+        table = TranspositionTable(n, max_bytes)
+        _worker_tables[n] = table
+    return table
+
+
+def solve_one(index: int, puzzle: NPuzzle, engine: str, heuristic, timeout: float = None, max_nodes: int = None,
+              max_memory: int = None, stats=None, cache: SolutionCache = None, weight: float = None,
+              table_memory: int = None) -> BatchResult:
+    """Solves one puzzle with the named engine, stopping at the given limits
+
+    puzzle may also be a board string (see parse_board), so boards are parsed in the worker.
+    Illegal and unsolvable boards are reported without searching.
+    stats is an optional Instrumentation.SearchStats passed on to the engine
+    cache is an optional SolutionCache looked in before searching and given every solution found
+    (anytime engines only store solutions proven shortest)
+    weight is the suboptimality bound w of the anytime engines (their default if None)
+    table_memory is the bytes of the TranspositionTable given to idastar and rbfs (none if None)
+    With smastar, most of the memory left under max_memory is given to the search as its node budget,
+    so it prunes nodes instead of going over the limit.
+    """
+
+    start = time.time()
+    if isinstance(puzzle, str):
+        try:
+            puzzle = parse_board(puzzle)
+        except ValueError as e:
+            return BatchResult(index, f'invalid: {e}', None, time.time() - start)
+    if not puzzle.is_solvable:
+        return BatchResult(index, 'unsolvable', None, time.time() - start)
+    if cache is not None:
+        moves = cache.get(puzzle)
+        if moves is not None:
+            return BatchResult(index, 'solved', (build_path(puzzle, moves, heuristic), 0), time.time() - start, True)
+    options = {}
+    if engine in ANYTIME_ENGINES:
+        options['timeout'] = timeout
+        timeout = None
+        if weight is not None:
+            options['w'] = weight
+    if engine in TABLE_ENGINES and table_memory is not None:
+        options['table'] = worker_table(puzzle.n, table_memory)
+    limited = LimitedHeuristic(heuristic, timeout, max_nodes, max_memory)
+    if engine == 'mm':
+        # the backward half generates nodes too, so it is limited along with the forward one
+        options['backward_heuristic'] = limited.limit(manhatten_to(puzzle))
+    if engine == 'smastar' and max_memory is not None:
+        # a quarter of the headroom is left for the path, the heuristic and the Python heap itself
+        options['max_memory'] = max(max_memory - current_memory(), 0) * 3 // 4
+    try:
+        result = ENGINES[engine](puzzle, heuristic=limited, stats=stats, **options)
+        # A* returns False instead of a tuple when it runs out of states
+        status = 'solved' if result and result[0] else 'unsolved'
+        if status == 'unsolved' and engine in ANYTIME_ENGINES:
+            # they only stop without a solution when time runs out
+            status = 'timeout'
+    except SearchLimitExceeded as e:
+        result, status = None, e.reason
+    except MemoryError:
+        result, status = None, 'memory_limit'
+    except Exception as e:
+        result, status = None, f'error: {e!r}'
+    if status == 'solved' and cache is not None and (engine not in ANYTIME_ENGINES or result[2] == 1):
+        cache.put(puzzle, moves_of(result[0]))
+    return BatchResult(index, status, result, time.time() - start)
+
+
+def __solve_chunk__(chunk: list, engine: str, timeout: float, max_nodes: int, max_memory: int,
+                    weight: float = None, table_memory: int = None) -> list[BatchResult]:
+    """Runs in a worker process: solves every (index, puzzle) pair of the chunk"""
+
+    return [solve_one(index, puzzle, engine, _worker_heuristic, timeout, max_nodes, max_memory, cache=_worker_cache,
+                      weight=weight, table_memory=table_memory)
+            for index, puzzle in chunk]
+
+
+def solve_batch(puzzles: Iterable[NPuzzle], engine: str = 'idastar', heuristic: str = 'manhatten', workers: int = None,
+                chunksize: int = 4, timeout: float = None, max_nodes: int = None,
+                max_memory: int = None, cache: str = None, weight: float = None,
+                table_memory: int = None) -> Iterator[BatchResult]:
+    """Solves a stream of puzzles (or board strings, see parse_board) over a pool of worker processes
+
+    The puzzles are sent to the workers in chunks of chunksize and only a few chunks per worker are
+    in flight at once, so puzzles can come from a generator or file of any length. Results are
+    yielded as soon as their chunk finishes, so they may come back out of order (use BatchResult.index).
+
+    engine is a name from ENGINES and heuristic a name accepted by load_heuristic.
+    timeout (seconds), max_nodes and max_memory (bytes of resident memory of the worker) apply to each
+    puzzle on its own.
+    cache is the path of a SQLite file every worker keeps a SolutionCache in, so boards solved before
+    (or their transposes, or states on their solutions) are not searched again.
+    weight is the suboptimality bound of the anytime engines (wastar, ara, ees), which return the best
+    solution found when the timeout is reached instead of stopping with no solution.
+    table_memory is the bytes of the TranspositionTable each worker keeps for idastar and rbfs.
+    """
+
+    if engine not in ENGINES:
+        raise ValueError(f'unknown engine {engine}, choose from {", ".join(ENGINES)}')
+    workers = workers or os.cpu_count() or 1
+    numbered = enumerate(puzzles)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=__init_worker__, initargs=(heuristic, cache)) as pool:
+        pending = set()
+
+        def submit_next() -> bool:
+            chunk = list(itertools.islice(numbered, chunksize))
+            if chunk:
+                pending.add(pool.submit(__solve_chunk__, chunk, engine, timeout, max_nodes, max_memory, weight,
+                                           table_memory))
+            return bool(chunk)
+
+        # keep two chunks per worker in flight so no worker waits for the next one
+        for i in range(2 * workers):
+            if not submit_next():
+                break
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                submit_next()
+                yield from future.result()
+
+
+def parse_board(line: str) -> NPuzzle:
+    """Parses a board written as its tiles in row major order, separated by spaces or commas
+
+    Raises ValueError if the line is not a legal board.
+    """
+
+    tiles = [int(t) for t in line.replace(',', ' ').split()]
+    side = math.isqrt(len(tiles))
+    if len(tiles) < 4 or side * side != len(tiles):
+        raise ValueError(f'{len(tiles)} tiles is not a square board')
+    return NPuzzle(len(tiles) - 1, [tiles[row * side:(row + 1) * side] for row in range(side)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Solves n-puzzles (one per line, tiles in row major order) in parallel')
+    parser.add_argument('input', nargs='?', default='-', help='file of boards, - for standard input')
+    parser.add_argument('--engine', default='idastar', choices=sorted(ENGINES))
+    parser.add_argument('--heuristic', default='manhatten', help=f'one of {", ".join(HEURISTICS)} or pdb:<partition>')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: one per core)')
+    parser.add_argument('--chunksize', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=None, help='seconds allowed per puzzle')
+    parser.add_argument('--max-nodes', type=int, default=None, help='nodes allowed per puzzle')
+    parser.add_argument('--max-memory', type=int, default=None, help='MB of worker memory allowed per puzzle')
+    parser.add_argument('--cache', default=None, help='SQLite file of solutions to reuse and add to')
+    parser.add_argument('--weight', type=float, default=None,
+                        help='suboptimality bound of the anytime engines (wastar, ara, ees)')
+    parser.add_argument('--table', type=int, default=None,
+                        help='MB of transposition table per worker for idastar and rbfs')
+    args = parser.parse_args()
+
+    f = sys.stdin if args.input == '-' else open(args.input)
+    # the boards are parsed in the workers, so a bad line is reported in its result instead of stopping the batch
+    puzzles = (line.strip() for line in f if line.strip() and not line.startswith('#'))
+    max_memory = args.max_memory * 1024 * 1024 if args.max_memory is not None else None
+    table_memory = args.table * 1024 * 1024 if args.table is not None else None
+
+    # One line of JSON per puzzle, in the order they finish
+    for r in solve_batch(puzzles, args.engine, args.heuristic, args.workers, args.chunksize, args.timeout,
+                         args.max_nodes, max_memory, args.cache, args.weight, table_memory):
+        line = {'index': r.index, 'status': r.status, 'wall_time': round(r.wall_time, 6)}
+        if r.status == 'solved':
+            line['moves'] = r.result[0].moves
+            line['nodes_generated'] = r.result[1]
+            line['cached'] = r.cached
+            if args.engine in ANYTIME_ENGINES and not r.cached:
+                line['bound'] = r.result[2]
+        print(json.dumps(line), flush=True)
+
+
+if __name__ == '__main__':
+    main()
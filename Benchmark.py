@@ -0,0 +1,247 @@
+# Author: Alex Hemmerlin
+# This file implements a benchmark of the solvers on fixed, reproducible sets of puzzles
+
+from NPuzzle import NPuzzle, geometry, HEURISTICS
+from BatchSolver import ENGINES, load_heuristic, solve_one
+from Instrumentation import SearchStats
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import sys
+
+KORF100_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'korf100.txt')
+
+# The metrics compared against a baseline, and whether a larger value is worse
+COMPARED_METRICS = {
+    'nodes_generated': True,
+    'nodes_expanded': True,
+    'peak_open': True,
+    'peak_rss_kb': True,
+    'wall_time': True,
+    'nodes_per_second': False,
+}
+
+
+def random_walk_suite(n: int, depth: int, count: int, seed: int = 0) -> list[NPuzzle]:
+    """Returns count puzzles made by depth random moves from the goal (never undoing the last move)
+
+    The same arguments always give the same puzzles. Their solutions are at most depth moves long.
+    """
+
+    rng = random.Random(f'{n}:{depth}:{count}:{seed}')
+    puzzles = []
+    for i in range(count):
+        puzzle = NPuzzle.from_packed(n, geometry(n).goal_packed)
+        last = -1
+        made = 0
+        while made < depth:
+            move = rng.randrange(4)
+            if move != (last + 2) % 4 and puzzle.move(move):
+                last = move
+                made += 1
+        puzzles.append(puzzle)
+    return puzzles
+
+
+def korf100(path: str = KORF100_PATH) -> list[NPuzzle]:
+    """Returns Korf's 100 15-puzzle instances in this project's goal convention
+
+    Korf's goal has the blank in the top left. Rotating his boards 180 degrees and renaming
+    tile t to 16 - t turns his goal into ours without changing any solution length.
+    """
+
+    puzzles = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            korf = [int(t) for t in line.split()]
+            tiles = [16 - t if t else 0 for t in reversed(korf)]
+            puzzles.append(NPuzzle(15, [tiles[row * 4:(row + 1) * 4] for row in range(4)]))
+    return puzzles
+
+
+def load_suite(spec: str) -> list[NPuzzle]:
+    """Returns the puzzles of a suite given as walk:<n>:<depth>:<count>[:<seed>], korf100 or korf100:<first k>"""
+
+    parts = spec.split(':')
+    if parts[0] == 'walk':
+        return random_walk_suite(*(int(p) for p in parts[1:]))
+    if parts[0] == 'korf100':
+        puzzles = korf100()
+        return puzzles[:int(parts[1])] if len(parts) > 1 else puzzles
+    raise ValueError(f'unknown suite {spec}')
+
+
+def __run_instance__(puzzle: NPuzzle, engine: str, heuristic: str, timeout: float, max_nodes: int) -> dict:
+    """Runs in a fresh worker process: solves one puzzle and returns its metrics"""
+
+    # evaluate the heuristic once first so building its tables is not timed
+    h = load_heuristic(heuristic)
+    h(puzzle.copy())
+    stats = SearchStats()
+    result = solve_one(0, puzzle, engine, h, timeout, max_nodes, stats=stats)
+    metrics = {
+        'status': result.status,
+        'moves': None,
+        'nodes_generated': None,
+        'nodes_expanded': None,
+        'peak_open': None,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'wall_time': result.wall_time,
+        'nodes_per_second': None,
+    }
+    if result.status == 'solved':
+        metrics['moves'] = result.result[0].moves
+        metrics['nodes_generated'] = result.result[1]
+        metrics['nodes_expanded'] = stats.expanded
+        # the largest fringe for A*, the deepest stack for RBFS and IDA*
+        metrics['peak_open'] = stats.peak_fringe
+        if result.wall_time > 0:
+            metrics['nodes_per_second'] = result.result[1] / result.wall_time
+    return metrics
+
+
+def run(suites: list[str], engines: list[str], heuristics: list[str], timeout: float = None,
+        max_nodes: int = None, verbosity: int = 1) -> dict:
+    """Runs every engine with every heuristic on every puzzle of every suite
+
+    Each puzzle is solved in a new process so the peak memory of one solve is not mixed up with another.
+    Returns the report (metadata, one record per solve and a summary per suite/engine/heuristic)
+    that is written to JSON.
+    """
+
+    records = []
+    with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+        for suite in suites:
+            puzzles = load_suite(suite)
+            for engine in engines:
+                for heuristic in heuristics:
+                    for index, puzzle in enumerate(puzzles):
+                        metrics = pool.submit(__run_instance__, puzzle, engine, heuristic, timeout, max_nodes).result()
+                        record = {'suite': suite, 'instance': index, 'engine': engine, 'heuristic': heuristic}
+                        record.update(metrics)
+                        records.append(record)
+                        if verbosity >= 1:
+                            print(f'{suite} #{index} {engine}/{heuristic}: {metrics["status"]}, {metrics["moves"]} moves, '
+                                  f'{metrics["nodes_generated"]} nodes, {metrics["wall_time"]:.3f}s', flush=True)
+
+    return {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'timeout': timeout,
+            'max_nodes': max_nodes,
+        },
+        'results': records,
+        'summary': summarize(records),
+    }
+
+
+def summarize(records: list[dict]) -> dict:
+    """Totals the metrics of each suite/engine/heuristic combination
+
+    Sums are only over solved puzzles, peaks are the largest over them and nodes_per_second is the total
+    nodes generated over the total wall time.
+    """
+
+    summary = {}
+    for record in records:
+        key = f'{record["suite"]}/{record["engine"]}/{record["heuristic"]}'
+        entry = summary.setdefault(key, {'instances': 0, 'solved': 0, 'nodes_generated': 0, 'nodes_expanded': None,
+                                         'peak_open': None, 'peak_rss_kb': 0, 'wall_time': 0.0, 'nodes_per_second': None})
+        entry['instances'] += 1
+        if record['status'] != 'solved':
+            continue
+        entry['solved'] += 1
+        entry['nodes_generated'] += record['nodes_generated']
+        entry['wall_time'] += record['wall_time']
+        entry['peak_rss_kb'] = max(entry['peak_rss_kb'], record['peak_rss_kb'])
+        if record['nodes_expanded'] is not None:
+            entry['nodes_expanded'] = (entry['nodes_expanded'] or 0) + record['nodes_expanded']
+        if record['peak_open'] is not None:
+            entry['peak_open'] = max(entry['peak_open'] or 0, record['peak_open'])
+    for entry in summary.values():
+        if entry['wall_time'] > 0:
+            entry['nodes_per_second'] = entry['nodes_generated'] / entry['wall_time']
+    return summary
+
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.1) -> list[str]:
+    """Compares the summary of a report to a baseline report
+
+    A metric is a regression when it is worse than the baseline by more than tolerance (a fraction),
+    or when fewer puzzles were solved. Returns a description of every regression found.
+    """
+
+    regressions = []
+    for key, entry in report['summary'].items():
+        base = baseline['summary'].get(key)
+        if base is None:
+            continue
+        if entry['solved'] < base['solved']:
+            regressions.append(f'{key}: solved {entry["solved"]}, baseline solved {base["solved"]}')
+        for metric, larger_is_worse in COMPARED_METRICS.items():
+            new, old = entry.get(metric), base.get(metric)
+            if new is None or old is None or old == 0:
+                continue
+            change = (new - old) / old
+            if (change > tolerance) if larger_is_worse else (change < -tolerance):
+                regressions.append(f'{key}: {metric} {old:.6g} -> {new:.6g} ({change:+.1%})')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the n-puzzle solvers on reproducible puzzle sets')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmark and write the report to JSON')
+    run_parser.add_argument('--suite', action='append', default=None,
+                            help='walk:<n>:<depth>:<count>[:<seed>], korf100 or korf100:<first k> (repeatable)')
+    run_parser.add_argument('--engines', default='astar,rbfs,idastar', help=f'comma separated, from {", ".join(ENGINES)}')
+    run_parser.add_argument('--heuristics', default='manhatten,linear_conflict,walking_distance',
+                            help=f'comma separated, from {", ".join(HEURISTICS)} or pdb:<partition>')
+    run_parser.add_argument('--timeout', type=float, default=None, help='seconds allowed per puzzle')
+    run_parser.add_argument('--max-nodes', type=int, default=None, help='nodes allowed per puzzle')
+    run_parser.add_argument('--out', default='benchmark.json', help='file to write the report to')
+    run_parser.add_argument('--baseline', default=None, help='report to compare the run against')
+    run_parser.add_argument('--tolerance', type=float, default=0.1)
+
+    compare_parser = commands.add_parser('compare', help='compare a report against a baseline report')
+    compare_parser.add_argument('report')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('--tolerance', type=float, default=0.1)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        suites = args.suite or ['walk:8:30:20', 'walk:15:30:20']
+        report = run(suites, args.engines.split(','), args.heuristics.split(','), args.timeout, args.max_nodes)
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f'Report written to {args.out}')
+        if args.baseline is None:
+            return
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    else:
+        with open(args.report) as f:
+            report = json.load(f)
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = compare(report, baseline, args.tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if regressions:
+        sys.exit(1)
+    print('No regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+# Author: Alex Hemmerlin
+# This file implements bidirectional searches that meet in the middle (bidirectional BFS and MM)
+
+from NPuzzle import NPuzzle, geometry
+from PriorityQueues import BinaryHeap
+from RBFS import Node, build_path, get_path
+from Instrumentation import SearchStats, search_stats
+import time
+
+# Index of each direction in the tuples of the searches below
+FORWARD = 0
+BACKWARD = 1
+
+
+def manhatten_to(target: NPuzzle):
+    """Returns a heuristic giving the manhatten distance from a puzzle to target instead of to the goal
+
+    Used as the heuristic of the backward direction, which searches from the goal towards the start.
+    """
+
+    side = target.side
+    cells = target.geometry.cells
+    where = [0] * cells
+    for cell, tile in enumerate(target.tiles):
+        where[tile] = cell
+    distances = [(0,) * cells]
+    for tile in range(1, cells):
+        row, col = divmod(where[tile], side)
+        distances.append(tuple(abs(cell // side - row) + abs(cell % side - col) for cell in range(cells)))
+
+    def heuristic(puzzle: NPuzzle) -> int:
+        return sum(distances[tile][cell] for cell, tile in enumerate(puzzle.tiles))
+    return heuristic
+
+
+def join_moves(puzzle: NPuzzle, meet: int, seen: tuple[dict, dict]) -> list[int]:
+    """Returns the moves from puzzle to the goal through the state with key meet
+
+    seen[FORWARD] and seen[BACKWARD] map the key of every state reached in that direction to
+    (moves from the start of that direction, the move that reached it, -1 for the start).
+    """
+
+    # Walk back to the start, undoing the forward moves
+    state = NPuzzle.from_packed(puzzle.n, meet)
+    forward = []
+    move = seen[FORWARD][meet][1]
+    while move != -1:
+        forward.append(move)
+        state.move((move + 2) % 4)
+        move = seen[FORWARD][state.key][1]
+    forward.reverse()
+
+    # Walk on to the goal: undoing each backward move is the next move of the path
+    state = NPuzzle.from_packed(puzzle.n, meet)
+    backward = []
+    move = seen[BACKWARD][meet][1]
+    while move != -1:
+        backward.append((move + 2) % 4)
+        state.move((move + 2) % 4)
+        move = seen[BACKWARD][state.key][1]
+    return forward + backward
+
+
+def BidirectionalBFS(puzzle: NPuzzle, verbosity: int = 0, heuristic=NPuzzle.manhatten_distance,
+                     stats: SearchStats = None) -> Node:
+    """Performs breadth first search from the start and the goal at the same time, finding a shortest solution
+
+    Each step expands the whole next layer of the direction with the smaller frontier. The search stops at the
+    end of the first layer that reaches a state the other direction has seen, with the shortest path through
+    any such state. This explores about the square root of the states a one directional breadth first search
+    would, so it is used to check optimal solution lengths on small boards.
+    heuristic is only used for the priorities of the returned nodes.
+    stats is an optional Instrumentation.SearchStats to fill with counters, timers and events
+
+    Returns a tuple of (the solution node, number of nodes generated)
+    If the provided puzzle instance is not solvable, returns (None, 0) without searching.
+    """
+
+    if not puzzle.is_solvable:
+        return None, 0
+
+    stats = search_stats(stats, verbosity)
+    on_expand = on_generate = on_duplicate = None
+    if stats is not None:
+        start_time = time.perf_counter()
+        on_expand, on_generate, on_duplicate = stats.on_expand, stats.on_generate, stats.on_duplicate
+
+    goal = NPuzzle.from_packed(puzzle.n, geometry(puzzle.n).goal_packed)
+    seen = ({puzzle.key: (0, -1)}, {goal.key: (0, -1)})
+    layers = [[puzzle.copy()], [goal]]
+    num_nodes_generated = 0
+    num_nodes_expanded = 0
+    num_duplicates = 0
+    peak_layers = 2
+    best = float('inf')
+    meet = puzzle.key if puzzle.is_solved else None
+
+    try:
+        while meet is None and layers[FORWARD] and layers[BACKWARD]:
+            side = FORWARD if len(layers[FORWARD]) <= len(layers[BACKWARD]) else BACKWARD
+            reached = seen[side]
+            other = seen[1 - side]
+            next_layer = []
+            for state in layers[side]:
+                g = reached[state.key][0] + 1
+                num_nodes_expanded += 1
+                if on_expand is not None:
+                    on_expand(state, g - 1, g - 1)
+                for move in range(4):
+                    successor = state.copy()
+                    if not successor.move(move):
+                        continue
+                    num_nodes_generated += 1
+                    if on_generate is not None:
+                        on_generate(successor, g, g)
+                    key = successor.key
+                    if key in reached:
+                        num_duplicates += 1
+                        if on_duplicate is not None:
+                            on_duplicate(successor, 'Successor NOT added (already reached in this direction)')
+                        continue
+                    reached[key] = (g, move)
+                    next_layer.append(successor)
+                    met = other.get(key)
+                    if met is not None and g + met[0] < best:
+                        best, meet = g + met[0], key
+            layers[side] = next_layer
+            peak_layers = max(peak_layers, len(layers[FORWARD]) + len(layers[BACKWARD]))
+    finally:
+        if stats is not None:
+            stats.record(num_nodes_expanded, num_nodes_generated, num_duplicates, peak_layers,
+                         time.perf_counter() - start_time)
+
+    if meet is None:
+        return None, num_nodes_generated
+    return build_path(puzzle, join_moves(puzzle, meet, seen), heuristic), num_nodes_generated
+
+
+def MMSearch(puzzle: NPuzzle, verbosity: int = 0, heuristic=NPuzzle.manhatten_distance, backward_heuristic=None,
+             fringe_type=BinaryHeap, stats: SearchStats = None) -> Node:
+    """Performs MM bidirectional heuristic search (Holte et al. 2016), finding a shortest solution
+
+    A* runs forward from the start with heuristic and backward from the goal with backward_heuristic
+    (the manhatten distance to the start by default). Nodes are prioritised by max(f, 2g), so neither
+    direction goes past the middle of the solution before the other, and the direction with the lower
+    priority is expanded. When a successor has been reached by the other direction the path through
+    it is a candidate. The search stops when the best candidate is no longer than the lowest priority.
+    heuristic is any function taking an NPuzzle and returning an admissible estimate of its distance
+    to the goal, such as NPuzzle.manhatten_distance or a PatternDatabase
+    fringe_type is the priority queue used for both fringes, any class from PriorityQueues.py
+    stats is an optional Instrumentation.SearchStats to fill with counters, timers and events
+
+    Returns a tuple of (the solution node, number of nodes generated)
+    If the provided puzzle instance is not solvable, returns (None, 0) without searching.
+    """
+
+    if not puzzle.is_solvable:
+        return None, 0
+
+    if backward_heuristic is None:
+        backward_heuristic = manhatten_to(puzzle)
+    stats = search_stats(stats, verbosity)
+    on_expand = on_generate = on_duplicate = None
+    search_heuristic = heuristic
+    if stats is not None:
+        start_time = time.perf_counter()
+        search_heuristic = stats.wrap_heuristic(heuristic)
+        backward_heuristic = stats.wrap_heuristic(backward_heuristic)
+        fringe_type = stats.wrap_fringe(fringe_type)
+        on_expand, on_generate, on_duplicate = stats.on_expand, stats.on_generate, stats.on_duplicate
+
+    goal = NPuzzle.from_packed(puzzle.n, geometry(puzzle.n).goal_packed)
+    heuristics = (search_heuristic, backward_heuristic)
+    seen = ({puzzle.key: (0, -1)}, {goal.key: (0, -1)})
+    fringes = (fringe_type(), fringe_type())
+    for side, state in ((FORWARD, puzzle.copy()), (BACKWARD, goal)):
+        h = heuristics[side](state)
+        fringes[side].push(Node(h, state, None, 0), h, h)
+    num_nodes_generated = 0
+    num_nodes_expanded = 0
+    num_duplicates = 0
+    peak_fringe_size = 2
+    best = float('inf')
+    meet = None
+    if puzzle.is_solved:
+        best, meet = 0, puzzle.key
+
+    try:
+        while fringes[FORWARD] and fringes[BACKWARD]:
+            # Stale entries may make a lowest priority too low, that only makes the search stop later
+            forward_min = fringes[FORWARD].min_priority()
+            backward_min = fringes[BACKWARD].min_priority()
+            if best <= min(forward_min, backward_min):
+                break
+            side = FORWARD if forward_min <= backward_min else BACKWARD
+            reached = seen[side]
+            other = seen[1 - side]
+
+            node: Node = fringes[side].pop()
+            key = node.puzzle.key
+            if node.moves > reached[key][0]:
+                # a shorter path to this state was found after this entry was added
+                num_duplicates += 1
+                continue
+            num_nodes_expanded += 1
+            if on_expand is not None:
+                on_expand(node.puzzle, node.moves, node.priority)
+
+            g = node.moves + 1
+            for move in range(4):
+                successor = node.puzzle.copy()
+                if not successor.move(move):
+                    continue
+                num_nodes_generated += 1
+                key = successor.key
+                previous = reached.get(key)
+                if previous is not None and previous[0] <= g:
+                    num_duplicates += 1
+                    if on_duplicate is not None:
+                        on_duplicate(successor, 'Successor NOT added to fringe (a better path has already been found)')
+                    continue
+                reached[key] = (g, move)
+                h = heuristics[side](successor)
+                priority = max(g + h, 2 * g)
+                if on_generate is not None:
+                    on_generate(successor, g, priority)
+                fringes[side].push(Node(priority, successor, node, g), priority, h)
+                met = other.get(key)
+                if met is not None and g + met[0] < best:
+                    best, meet = g + met[0], key
+            peak_fringe_size = max(peak_fringe_size, len(fringes[FORWARD]) + len(fringes[BACKWARD]))
+    finally:
+        if stats is not None:
+            stats.record(num_nodes_expanded, num_nodes_generated, num_duplicates, peak_fringe_size,
+                         time.perf_counter() - start_time)
+
+    if meet is None:
+        return None, num_nodes_generated
+    return build_path(puzzle, join_moves(puzzle, meet, seen), heuristic), num_nodes_generated
+
+
+def main():
+    p1 = NPuzzle(8, [[1,2,3],[4,8,5],[7,0,6]])
+
+    print('STARTING STATE:')
+    print(p1.string())
+
+    for search in (BidirectionalBFS, MMSearch):
+        print(f'SEARCHING WITH {search.__name__}')
+
+        # TODO: CHANGE VERBOSITY PARAMETER TO SEE MORE DETAILED ALGORITHM INFORMATION (Ranges from [0,3])
+        result, runtime = search(puzzle=p1, verbosity=0)
+
+        print('SEARCH COMPLETE')
+        path = get_path(result)
+
+        print(f'PATH LENGTH: {result.moves}')
+        print('PATH:')
+        while len(path) > 0:
+            print(path.pop(len(path) - 1).string())
+        print(f'RUNTIME (TOTAL NUMBER OF NODES GENERATED): {runtime}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+# Author: Alex Hemmerlin
+# This file implements NumPy versions of successor generation and the heuristics for whole batches of boards
+
+from NPuzzle import NPuzzle, geometry
+from typing import Iterator
+
+# NumPy is optional: only the batched code paths need it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def require_numpy():
+    """Raises ImportError with an explanation if NumPy is not installed"""
+
+    if np is None:
+        raise ImportError('the batched board functions need NumPy (pip install numpy)')
+
+
+class BatchGeometry:
+    """NumPy copies of the PuzzleGeometry tables, used to gather values for a whole batch at once
+
+    Use batch_geometry(n) to get the shared instance for a puzzle size rather than creating one.
+
+    - neighbors: int64 array [cell, direction] of the cell the blank space moves to, or -1 if off the board
+    - distances: int64 array [tile, cell] of manhatten distances (0 for the blank)
+    - row_digits/col_digits: int64 arrays [tile, cell] of the line digits already multiplied by the
+      line power of the cell, so summing a row (column) of cells gives its line_conflicts key
+    - line_conflicts: int64 array of the conflicts of each line key
+    - shifts: uint64 array of the bit offset of each cell in a packed state
+    """
+
+    def __init__(self, n: int):
+        require_numpy()
+        geo = geometry(n)
+        side = geo.side
+        cells = geo.cells
+        self.n = n
+        self.side = side
+        self.cells = cells
+        self.bits = geo.bits
+        self.neighbors = np.array(geo.neighbors, dtype=np.int64)
+        self.distances = np.array(geo.distances, dtype=np.int64)
+        row_powers = np.array([geo.line_powers[cell % side] for cell in range(cells)], dtype=np.int64)
+        col_powers = np.array([geo.line_powers[cell // side] for cell in range(cells)], dtype=np.int64)
+        self.row_digits = np.array(geo.row_digits, dtype=np.int64) * row_powers
+        self.col_digits = np.array(geo.col_digits, dtype=np.int64) * col_powers
+        self.line_conflicts = np.array(geo.line_conflicts, dtype=np.int64)
+        self.cell_index = np.arange(cells)
+        self.shifts = np.arange(cells, dtype=np.uint64) * np.uint64(geo.bits)
+        self.goal_packed = geo.goal_packed
+
+
+# The shared batch geometry of every puzzle size used so far
+_batch_geometries: dict[int, BatchGeometry] = {}
+
+
+def batch_geometry(n: int) -> BatchGeometry:
+    """Returns the shared BatchGeometry for the n-puzzle, building it the first time"""
+
+    geo = _batch_geometries.get(n)
+    if geo is None:
+        geo = BatchGeometry(n)
+        _batch_geometries[n] = geo
+    return geo
+
+
+def to_batch(puzzles: list[NPuzzle]):
+    """Returns (tiles, blanks) for a list of puzzles of the same size
+
+    tiles is a uint8 array with one row per puzzle (its tiles in row major order) and blanks
+    the int64 array of the cell the blank space is in.
+    """
+
+    require_numpy()
+    tiles = np.array([puzzle.tiles for puzzle in puzzles], dtype=np.uint8)
+    blanks = np.array([puzzle.blank for puzzle in puzzles], dtype=np.int64)
+    return tiles, blanks
+
+
+def from_batch(n: int, tiles) -> list[NPuzzle]:
+    """Returns an NPuzzle for every row of a batch of boards"""
+
+    bits = geometry(n).bits
+    puzzles = []
+    for row in tiles.tolist():
+        packed = 0
+        for cell, tile in enumerate(row):
+            packed |= tile << (cell * bits)
+        puzzles.append(NPuzzle.from_packed(n, packed, row.index(0)))
+    return puzzles
+
+
+def pack_batch(n: int, tiles):
+    """Returns the packed state (the same int as NPuzzle.packed) of every board as a uint64 array
+
+    Only possible when a packed state fits in 64 bits (the 8 and 15 puzzles).
+    """
+
+    geo = batch_geometry(n)
+    if geo.cells * geo.bits > 64:
+        raise ValueError(f'a packed {n}-puzzle state does not fit in 64 bits')
+    return np.bitwise_or.reduce(tiles.astype(np.uint64) << geo.shifts, axis=1)
+
+
+def unpack_batch(n: int, packed):
+    """Inverse of pack_batch: returns (tiles, blanks) for a uint64 array of packed states"""
+
+    geo = batch_geometry(n)
+    mask = np.uint64((1 << geo.bits) - 1)
+    tiles = ((packed[:, None] >> geo.shifts) & mask).astype(np.uint8)
+    return tiles, np.argmin(tiles, axis=1)
+
+
+def distinct(values):
+    """Returns the distinct values of an array, sorted (np.unique without its slower general cases)"""
+
+    values = np.sort(values)
+    if len(values) < 2:
+        return values
+    keep = np.empty(len(values), dtype=bool)
+    keep[0] = True
+    np.not_equal(values[1:], values[:-1], out=keep[1:])
+    return values[keep]
+
+
+def difference(values, others):
+    """Returns the values not in others, where others is sorted"""
+
+    if len(others) == 0:
+        return values
+    where = np.minimum(np.searchsorted(others, values), len(others) - 1)
+    return values[others[where] != values]
+
+
+def expand_batch(n: int, tiles, blanks, last_moves=None):
+    """Generates the successors of every board in a batch
+
+    Each move direction is applied to all the boards it is legal for at once by swapping the blank
+    with the neighboring cell. With last_moves (the move that made each board, -1 for none) the
+    move undoing it is not generated.
+
+    Returns (successor tiles, successor blanks, index of each successor's parent, move made)
+    """
+
+    geo = batch_geometry(n)
+    parents = np.arange(len(tiles))
+    out_tiles, out_blanks, out_parents, out_moves = [], [], [], []
+    for move in range(4):
+        targets = geo.neighbors[blanks, move]
+        legal = targets >= 0
+        if last_moves is not None:
+            legal &= last_moves != (move + 2) % 4
+        selected = parents[legal]
+        source = blanks[legal]
+        target = targets[legal]
+        successors = tiles[selected]
+        rows = np.arange(len(selected))
+        successors[rows, source] = successors[rows, target]
+        successors[rows, target] = 0
+        out_tiles.append(successors)
+        out_blanks.append(target)
+        out_parents.append(selected)
+        out_moves.append(np.full(len(selected), move, dtype=np.int8))
+    return np.concatenate(out_tiles), np.concatenate(out_blanks), np.concatenate(out_parents), np.concatenate(out_moves)
+
+
+def manhatten_batch(n: int, tiles):
+    """Returns the manhatten distance of every board in a batch (the same as NPuzzle.manhatten_distance)"""
+
+    geo = batch_geometry(n)
+    return geo.distances[tiles, geo.cell_index].sum(axis=1)
+
+
+def linear_conflict_batch(n: int, tiles):
+    """Returns the linear conflict heuristic of every board in a batch (the same as NPuzzle.linear_conflict)"""
+
+    geo = batch_geometry(n)
+    side = geo.side
+    shape = (len(tiles), side, side)
+    rows = geo.row_digits[tiles, geo.cell_index].reshape(shape).sum(axis=2)
+    cols = geo.col_digits[tiles, geo.cell_index].reshape(shape).sum(axis=1)
+    conflicts = geo.line_conflicts[rows].sum(axis=1) + geo.line_conflicts[cols].sum(axis=1)
+    return manhatten_batch(n, tiles) + 2 * conflicts
+
+
+def rank_batch(positions, cells: int):
+    """Returns StateSpace.rank_positions of every row of an int64 array of positions"""
+
+    rank = np.zeros(len(positions), dtype=np.int64)
+    for i in range(positions.shape[1]):
+        p = positions[:, i]
+        smaller = (positions[:, :i] < p[:, None]).sum(axis=1)
+        rank = rank * (cells - i) + p - smaller
+    return rank
+
+
+def unrank_batch(ranks, k: int, cells: int):
+    """Returns StateSpace.unrank_positions of every rank in an int64 array, as a (len(ranks), k) array"""
+
+    digits = [None] * k
+    ranks = ranks.astype(np.int64)
+    for i in range(k - 1, -1, -1):
+        ranks, digits[i] = np.divmod(ranks, cells - i)
+    positions = np.empty((len(ranks), k), dtype=np.int64)
+    for i in range(k):
+        # the digit-th cell not used by an earlier position: step over the used cells in ascending order
+        p = digits[i].copy()
+        for used in np.sort(positions[:, :i], axis=1).T:
+            p += used <= p
+        positions[:, i] = p
+    return positions
+
+
+def bfs_layers(puzzle: NPuzzle, max_depth: int = None) -> Iterator:
+    """Breadth first search from puzzle over whole layers at once, yielding (depth, packed states of the layer)
+
+    Every move can be undone, so a new state can only be a duplicate of a state in the current or
+    previous layer and only those two layers are kept. States are packed into uint64 (see pack_batch),
+    so this works for the 8 and 15 puzzles. Each layer is sorted. Stops after max_depth or when the whole
+    space is enumerated.
+    """
+
+    n = puzzle.n
+    tiles, blanks = to_batch([puzzle])
+    layer = pack_batch(n, tiles)
+    previous = np.empty(0, dtype=np.uint64)
+    depth = 0
+    while len(layer):
+        yield depth, layer
+        if depth == max_depth:
+            return
+        tiles, blanks = unpack_batch(n, layer)
+        successors = distinct(pack_batch(n, expand_batch(n, tiles, blanks)[0]))
+        successors = difference(difference(successors, layer), previous)
+        previous, layer = layer, successors
+        depth += 1
+
+
+def main():
+    require_numpy()
+    n = 8
+    puzzles = [NPuzzle(n) for i in range(5)]
+    tiles, blanks = to_batch(puzzles)
+    print('MANHATTEN', manhatten_batch(n, tiles).tolist(), [p.manhatten_distance() for p in puzzles])
+    print('LINEAR CONFLICT', linear_conflict_batch(n, tiles).tolist(), [p.linear_conflict() for p in puzzles])
+    successors = expand_batch(n, tiles, blanks)[0]
+    print(f'{len(successors)} SUCCESSORS OF {len(puzzles)} BOARDS')
+
+    print('BREADTH FIRST ENUMERATION OF THE 8-PUZZLE')
+    total = 0
+    for depth, layer in bfs_layers(NPuzzle.from_packed(n, geometry(n).goal_packed)):
+        total += len(layer)
+        print(f'  depth {depth}: {len(layer)} states')
+    print(f'TOTAL STATES: {total}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,364 @@
+# Author: Alex Hemmerlin
+# This file implements breadth first search with delayed duplicate detection, keeping its layers on disk
+
+from NPuzzle import geometry, pack_tiles
+from array import array
+import argparse
+import heapq
+import json
+import os
+import sys
+import time
+import zlib
+
+# How many states go into one compressed block of a run or layer file
+BLOCK_STATES = 1 << 16
+
+CHECKPOINT = 'checkpoint.json'
+
+
+class IOCounters:
+    """Bytes moved to and from disk by an external search and the time spent moving them
+
+    - bytes_written/bytes_read: compressed bytes of the files
+    - states_written/states_read: records in those bytes (8 or more bytes each before compression)
+    - write_time/read_time: seconds spent compressing and writing (reading and decompressing)
+    """
+
+    def __init__(self):
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.states_written = 0
+        self.states_read = 0
+        self.write_time = 0.0
+        self.read_time = 0.0
+
+    def report(self) -> dict:
+        """Returns the counters by name, with the throughput of each direction in MB/s of compressed data"""
+
+        megabyte = 1024 * 1024
+        return {
+            'bytes_written': self.bytes_written,
+            'bytes_read': self.bytes_read,
+            'states_written': self.states_written,
+            'states_read': self.states_read,
+            'write_time': self.write_time,
+            'read_time': self.read_time,
+            'write_mb_per_s': self.bytes_written / megabyte / self.write_time if self.write_time else None,
+            'read_mb_per_s': self.bytes_read / megabyte / self.read_time if self.read_time else None,
+        }
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'IOCounters':
+        counters = cls()
+        vars(counters).update(values)
+        return counters
+
+
+class RunWriter:
+    """Writes an ascending sequence of distinct states to a compressed file
+
+    States are stored as the difference from the previous state, width bytes each, so the high bytes
+    are mostly 0 and compress well. Each block is a 4 byte length then zlib data.
+    """
+
+    def __init__(self, path: str, width: int, counters: IOCounters):
+        self.path = path
+        self.width = width
+        self.counters = counters
+        self.file = open(path + '.tmp', 'wb')
+        self.block = []
+        self.last = 0
+        self.count = 0
+
+    def write(self, state: int):
+        self.block.append(state - self.last)
+        self.last = state
+        self.count += 1
+        if len(self.block) >= BLOCK_STATES:
+            self.__flush__()
+
+    def __flush__(self):
+        start = time.perf_counter()
+        if self.width == 8:
+            raw = array('Q', self.block).tobytes()
+        else:
+            raw = b''.join(delta.to_bytes(self.width, 'little') for delta in self.block)
+        data = zlib.compress(raw, 1)
+        self.file.write(len(data).to_bytes(4, 'little'))
+        self.file.write(data)
+        self.counters.bytes_written += len(data) + 4
+        self.counters.states_written += len(self.block)
+        self.counters.write_time += time.perf_counter() - start
+        self.block = []
+
+    def close(self) -> int:
+        """Finishes the file (it only gets its name once complete) and returns the number of states written"""
+
+        if self.block:
+            self.__flush__()
+        self.file.close()
+        os.replace(self.path + '.tmp', self.path)
+        return self.count
+
+
+def read_run(path: str, width: int, counters: IOCounters = None):
+    """Yields the states of a file written by RunWriter in ascending order"""
+
+    counters = counters or IOCounters()
+    with open(path, 'rb') as f:
+        state = 0
+        while True:
+            start = time.perf_counter()
+            header = f.read(4)
+            if not header:
+                break
+            data = f.read(int.from_bytes(header, 'little'))
+            raw = zlib.decompress(data)
+            if width == 8:
+                deltas = array('Q')
+                deltas.frombytes(raw)
+            else:
+                deltas = [int.from_bytes(raw[i:i + width], 'little') for i in range(0, len(raw), width)]
+            counters.bytes_read += len(data) + 4
+            counters.states_read += len(deltas)
+            counters.read_time += time.perf_counter() - start
+            for delta in deltas:
+                state += delta
+                yield state
+
+
+def without(states, *earlier):
+    """Yields the distinct states of an ascending stream that are in none of the ascending streams earlier"""
+
+    heads = []
+    for stream in earlier:
+        head = next(stream, None)
+        heads.append([head, stream])
+    last = None
+    for state in states:
+        if state == last:
+            continue
+        last = state
+        duplicate = False
+        for entry in heads:
+            while entry[0] is not None and entry[0] < state:
+                entry[0] = next(entry[1], None)
+            if entry[0] == state:
+                duplicate = True
+        if not duplicate:
+            yield state
+
+
+def start_board(n: int, pattern=None) -> int:
+    """Returns the packed goal board, with every tile not in pattern relabelled to one 'any tile' label
+
+    With a pattern the search runs on the abstract space where only the pattern tiles and the blank
+    can be told apart, so its depths are a (non additive) pattern database of those tiles.
+    """
+
+    geo = geometry(n)
+    tiles = list(geo.goal_tiles)
+    if pattern is not None:
+        pattern = set(pattern)
+        if not pattern or not pattern <= set(range(1, n + 1)):
+            raise ValueError(f'the pattern must be a set of tiles from 1 to {n}')
+        others = [tile for tile in range(1, n + 1) if tile not in pattern]
+        if others:
+            label = others[0]
+            tiles = [label if tile in others else tile for tile in tiles]
+    return pack_tiles(tiles, geo.bits)
+
+
+class ExternalBFS:
+    """Breadth first search from the goal of the n-puzzle (or its abstraction to a pattern of tiles) that
+    keeps its layers in files in directory instead of memory
+
+    Each layer is a file of the packed boards (see NPuzzle.packed) at that depth, sorted and compressed.
+    Expanding a layer fills a buffer of buffer_states successors; each full buffer is sorted and written
+    out as a run. The runs are then merged, and states in the layer expanded or the one before it are
+    dropped (every move can be undone, so a successor of depth d is at depth d - 1, d or d + 1). Memory is bounded by
+    the buffer and one block per open file.
+
+    A checkpoint is written after every layer, so a search that is stopped (or given max_depth) carries
+    on from its last complete layer when run again with the same directory.
+
+    - histogram: the number of states at each depth done so far
+    - counters: the IOCounters of the files read and written
+    """
+
+    def __init__(self, n: int, directory: str, pattern=None, buffer_states: int = 1 << 20, keep_layers: bool = True):
+        geo = geometry(n)
+        self.n = n
+        self.directory = directory
+        self.pattern = sorted(pattern) if pattern is not None else None
+        self.buffer_states = buffer_states
+        self.keep_layers = keep_layers
+        self.width = max(8, (geo.cells * geo.bits + 7) // 8)
+        self.histogram = []
+        self.counters = IOCounters()
+        self.wall_time = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self.__resume__()
+
+    def layer_path(self, depth: int) -> str:
+        return os.path.join(self.directory, f'layer-{depth:03d}.bin')
+
+    def read_layer(self, depth: int):
+        """Yields the packed boards at depth in ascending order (the layer must be kept on disk)"""
+
+        return read_run(self.layer_path(depth), self.width, self.counters)
+
+    def __resume__(self):
+        """Loads the checkpoint if there is one for the same search, else starts over with layer 0"""
+
+        path = os.path.join(self.directory, CHECKPOINT)
+        if os.path.exists(path):
+            with open(path) as f:
+                checkpoint = json.load(f)
+            if checkpoint['n'] != self.n or checkpoint['pattern'] != self.pattern:
+                raise ValueError(f'{self.directory} holds a search of another puzzle or pattern')
+            self.histogram = checkpoint['histogram']
+            self.counters = IOCounters.from_dict(checkpoint['counters'])
+            self.wall_time = checkpoint['wall_time']
+        # runs and files left unfinished by a search that was stopped part way through a layer
+        for name in os.listdir(self.directory):
+            if name.startswith('run-') or name.endswith('.tmp'):
+                os.remove(os.path.join(self.directory, name))
+        # a layer that a search stopped right after its checkpoint did not get to drop
+        depth = len(self.histogram) - 1
+        if not self.keep_layers and depth >= 2:
+            self.__remove_layer__(depth - 2)
+        if not self.histogram:
+            writer = RunWriter(self.layer_path(0), self.width, self.counters)
+            writer.write(start_board(self.n, self.pattern))
+            self.histogram = [writer.close()]
+            self.__checkpoint__()
+
+    def __remove_layer__(self, depth: int):
+        """Deletes a layer that is no longer needed, if it is still there"""
+
+        try:
+            os.remove(self.layer_path(depth))
+        except FileNotFoundError:
+            pass
+
+    def __checkpoint__(self):
+        path = os.path.join(self.directory, CHECKPOINT)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'n': self.n, 'pattern': self.pattern, 'histogram': self.histogram,
+                       'counters': self.counters.to_dict(), 'wall_time': self.wall_time}, f)
+        os.replace(path + '.tmp', path)
+
+    @property
+    def done(self) -> bool:
+        """True once a layer with no states has been reached (the whole space has been searched)"""
+
+        return self.histogram[-1] == 0
+
+    def __successors__(self, depth: int):
+        """Yields every successor of every state at depth"""
+
+        geo = geometry(self.n)
+        bits = geo.bits
+        mask = geo.mask
+        neighbors = geo.neighbors
+        for packed in self.read_layer(depth):
+            blank = 0
+            while (packed >> (blank * bits)) & mask:
+                blank += 1
+            for target in neighbors[blank]:
+                if target < 0:
+                    continue
+                tile = (packed >> (target * bits)) & mask
+                yield packed + (tile << (blank * bits)) - (tile << (target * bits))
+
+    def expand_layer(self, verbosity: int = 0) -> int:
+        """Builds the next layer from the last one and returns its number of states"""
+
+        start = time.perf_counter()
+        depth = len(self.histogram) - 1
+        runs = []
+        buffer = set()
+
+        def write_run():
+            path = os.path.join(self.directory, f'run-{depth + 1:03d}-{len(runs):05d}.bin')
+            writer = RunWriter(path, self.width, self.counters)
+            for state in sorted(buffer):
+                writer.write(state)
+            writer.close()
+            runs.append(path)
+            buffer.clear()
+
+        for successor in self.__successors__(depth):
+            buffer.add(successor)
+            if len(buffer) >= self.buffer_states:
+                write_run()
+        if buffer:
+            write_run()
+
+        merged = heapq.merge(*(read_run(path, self.width, self.counters) for path in runs))
+        earlier = [self.read_layer(d) for d in (depth, depth - 1) if d >= 0]
+        writer = RunWriter(self.layer_path(depth + 1), self.width, self.counters)
+        for state in without(merged, *earlier):
+            writer.write(state)
+        count = writer.close()
+
+        # the checkpoint goes first, so files are only removed once a resumed search no longer needs them
+        self.histogram.append(count)
+        self.wall_time += time.perf_counter() - start
+        self.__checkpoint__()
+        for path in runs:
+            os.remove(path)
+        if not self.keep_layers and depth >= 1:
+            self.__remove_layer__(depth - 1)
+        if verbosity >= 1:
+            print(f'  depth {depth + 1}: {count} states from {len(runs)} runs, {self.wall_time:.1f}s', flush=True)
+        return count
+
+    def run(self, max_depth: int = None, verbosity: int = 0) -> list[int]:
+        """Expands layers until the space is exhausted (or max_depth is done) and returns the histogram"""
+
+        while not self.done and (max_depth is None or len(self.histogram) - 1 < max_depth):
+            self.expand_layer(verbosity)
+        return self.histogram
+
+    def report(self) -> dict:
+        """Returns the depth histogram, the number of states and the I/O counters"""
+
+        histogram = self.histogram[:-1] if self.done else self.histogram
+        report = {
+            'depth': len(histogram) - 1,
+            'states': sum(histogram),
+            'histogram': histogram,
+            'done': self.done,
+            'wall_time': self.wall_time,
+        }
+        report.update(self.counters.report())
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Breadth first search of the n-puzzle with its layers on disk')
+    parser.add_argument('n', type=int, nargs='?', default=8)
+    parser.add_argument('--dir', default='bfs', help='directory for the layers and checkpoint (resumed if it has one)')
+    parser.add_argument('--pattern', default=None, help='comma separated tiles to search the abstract space of')
+    parser.add_argument('--buffer', type=int, default=1 << 20, help='states sorted in memory per run')
+    parser.add_argument('--max-depth', type=int, default=None, help='stop after this layer (run again to resume)')
+    parser.add_argument('--drop-layers', action='store_true', help='delete layers once they are no longer needed')
+    args = parser.parse_args()
+
+    pattern = [int(tile) for tile in args.pattern.split(',')] if args.pattern else None
+    search = ExternalBFS(args.n, args.dir, pattern, args.buffer, not args.drop_layers)
+    if len(search.histogram) > 1:
+        print(f'Resuming from depth {len(search.histogram) - 1}', flush=True)
+    search.run(args.max_depth, verbosity=1)
+    json.dump(search.report(), sys.stdout, indent=1)
+    print()
+
+
+if __name__ == '__main__':
+    main()
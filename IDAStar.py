@@ -0,0 +1,180 @@
+# Author: Alex Hemmerlin
+# This file implements Iterative Deepening A* (IDA*) Search
+
+from NPuzzle import NPuzzle
+from RBFS import Node, build_path, get_path
+from Instrumentation import SearchStats, search_stats
+from TranspositionTable import TranspositionTable
+import time
+
+
+def IDAStar(puzzle: NPuzzle, bound: int, heuristic=NPuzzle.manhatten_distance, on_expand=None,
+            on_generate=None, table: TranspositionTable = None) -> tuple[list[int], int, int, float, int]:
+    """Runs one depth first iteration of IDA* with the given f-bound
+
+    The search is done in place on puzzle with an explicit stack: moves are made on the way
+    down and undone on the way back up, so only one board exists. The move that would undo
+    the previous move is never generated.
+    on_expand and on_generate are the SearchStats event callbacks (None when not observed).
+    With a table, a state's heuristic is raised to the bound stored for it, and once a state's
+    successors have all been searched the lowest f found below it (less its g) is stored for it.
+
+    Returns a tuple of (the moves to the goal or None, nodes generated, nodes expanded,
+    the smallest f over the bound, the deepest the stack got)
+    If the goal is found the puzzle is left in the goal state, otherwise it is back in the start state.
+    """
+
+    num_nodes_generated = 0
+    num_nodes_expanded = 1
+    max_depth = 0
+    next_bound = float('inf')
+    if on_expand is not None:
+        on_expand(puzzle, 0, bound)
+
+    # moves[i] is the move made at depth i, next_move[i] is the next move to try at depth i
+    moves = []
+    next_move = [0]
+    # with a table, lowest[i] is the lowest f over the bound found below the state at depth i, less its g
+    lowest = [float('inf')]
+
+    while next_move:
+        move = next_move[-1]
+
+        # All moves from this state have been tried: backtrack
+        if move == 4:
+            next_move.pop()
+            if moves:
+                if table is not None:
+                    below = lowest.pop()
+                    table.store(puzzle, len(moves), below)
+                    if below + 1 < lowest[-1]:
+                        lowest[-1] = below + 1
+                puzzle.move((moves.pop() + 2) % 4)
+            continue
+        next_move[-1] = move + 1
+
+        # Don't undo the previous move (parent pruning)
+        if moves and move == (moves[-1] + 2) % 4:
+            continue
+        if not puzzle.move(move):
+            continue
+        num_nodes_generated += 1
+
+        h = heuristic(puzzle)
+        if table is not None:
+            stored = table.probe(puzzle, len(moves) + 1)
+            if stored > h:
+                h = stored
+        f = len(moves) + 1 + h
+        if on_generate is not None:
+            on_generate(puzzle, len(moves) + 1, f)
+        if f > bound:
+            # Over the bound: remember the smallest f for the next iteration and undo the move
+            if f < next_bound:
+                next_bound = f
+            if table is not None and h + 1 < lowest[-1]:
+                lowest[-1] = h + 1
+            puzzle.move((move + 2) % 4)
+            continue
+
+        moves.append(move)
+        if puzzle.is_solved:
+            return moves, num_nodes_generated, num_nodes_expanded, f, max(max_depth, len(moves))
+        next_move.append(0)
+        if table is not None:
+            lowest.append(float('inf'))
+        num_nodes_expanded += 1
+        if len(moves) > max_depth:
+            max_depth = len(moves)
+        if on_expand is not None:
+            on_expand(puzzle, len(moves), f)
+
+    return None, num_nodes_generated, num_nodes_expanded, next_bound, max_depth
+
+
+def IDAStar_Search(puzzle: NPuzzle, verbosity: int = 0, heuristic=NPuzzle.manhatten_distance,
+                   stats: SearchStats = None, table: TranspositionTable = None) -> Node:
+    """Performs Iterative Deepening A* Search on the given puzzle instance using the manhatten distance heuristic by default
+
+    With a verbosity greater than 0 the program prints out extra information (can be set to 0, 1 or 2)
+    heuristic is any function taking an NPuzzle and returning an admissible estimate of its distance
+    to the goal, such as NPuzzle.manhatten_distance or a PatternDatabase
+    stats is an optional Instrumentation.SearchStats to fill with counters, timers and events
+    table is an optional TranspositionTable for the puzzle's size, kept between iterations so states
+    already searched below are cut off instead of being searched again
+
+    Returns a tuple of three items including (the solution node, number of nodes generated,
+    a list of (f-bound, nodes generated) for each iteration)
+    If the provided puzzle instance is not solvable, returns (None, 0, []) without searching.
+    """
+
+    if not puzzle.is_solvable:
+        return None, 0, []
+
+    # Instrumentation is only set up (heuristic wrapped, events bound) when there are stats
+    stats = search_stats(stats, verbosity)
+    search_heuristic = heuristic
+    on_expand = on_generate = None
+    if stats is not None:
+        start_time = time.perf_counter()
+        search_heuristic = stats.wrap_heuristic(heuristic)
+        on_expand, on_generate = stats.on_expand, stats.on_generate
+
+    if table is not None:
+        table.begin(puzzle)
+
+    # Search on a copy so the given puzzle is not changed
+    board = puzzle.copy()
+    bound = search_heuristic(board)
+    num_nodes_generated = 0
+    num_nodes_expanded = 0
+    max_depth = 0
+    iterations = []
+
+    try:
+        if board.is_solved:
+            return build_path(puzzle, [], heuristic), num_nodes_generated, iterations
+
+        while True:
+            moves, generated, expanded, next_bound, depth = IDAStar(board, bound, search_heuristic, on_expand, on_generate,
+                                                                table)
+            num_nodes_generated += generated
+            num_nodes_expanded += expanded
+            max_depth = max(max_depth, depth)
+            iterations.append((bound, generated))
+            if verbosity >= 1:
+                print(f'f-bound {bound}: {generated} nodes generated')
+
+            if moves is not None:
+                return build_path(puzzle, moves, heuristic), num_nodes_generated, iterations
+            if next_bound == float('inf'):
+                return None, num_nodes_generated, iterations
+            bound = next_bound
+    finally:
+        if stats is not None:
+            stats.record(num_nodes_expanded, num_nodes_generated, 0, max_depth, time.perf_counter() - start_time)
+
+
+def main():
+    p1 = NPuzzle(8, [[1,2,3],[4,8,5],[7,0,6]])
+
+    print('STARTING STATE:')
+    print(p1.string())
+
+    print('SEARCHING')
+
+    # TODO: CHANGE VERBOSITY PARAMETER TO SEE MORE DETAILED ALGORITHM INFORMATION (Ranges from [0,2])
+    result, runtime, iterations = IDAStar_Search(puzzle=p1, verbosity=1)
+
+    print('SEARCH COMPLETE')
+    path = get_path(result)
+
+    print(f'PATH LENGTH: {result.moves}')
+    print('PATH:')
+    while len(path) > 0:
+        print(path.pop(len(path) - 1).string())
+    print(f'RUNTIME (TOTAL NUMBER OF NODES GENERATED): {runtime}')
+    print(f'ITERATIONS: {len(iterations)}')
+
+if __name__ == '__main__':
+    main()
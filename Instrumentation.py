@@ -0,0 +1,261 @@
+# Author: Alex Hemmerlin
+# This file implements the counters, timers, event callbacks and profiling used to look inside a search
+
+from typing import Callable
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+
+
+class SearchStats:
+    """Counters, timers and event callbacks for one search
+
+    Pass an instance as the stats parameter of AStarSearch, RBFS_Search or IDAStar_Search. With no stats
+    (the default) a search only keeps its usual counts in local variables. With stats it fills in:
+
+    - expanded: states whose successors were generated
+    - generated: successor states generated
+    - duplicates: successors (or fringe entries) dropped because the state was already seen with a path at least as short
+    - peak_fringe: the largest fringe (A*) or stack depth (RBFS, IDA*)
+    - fringe_pushes/fringe_pops: fringe operations (A* only)
+    - heuristic_evaluations: calls to the heuristic
+    - wall_time: seconds spent in the search
+    - heuristic_time/fringe_time: seconds spent in the heuristic / fringe, only if time_heuristic / time_fringe is set
+
+    Observers (see add_observer) get on_expand, on_generate and on_duplicate events. With sample_every > 1
+    they only see every sample_every-th event of each kind. With no observers the events are never raised.
+    """
+
+    def __init__(self, sample_every: int = 1, time_heuristic: bool = False, time_fringe: bool = False):
+        self.sample_every = sample_every
+        self.time_heuristic = time_heuristic
+        self.time_fringe = time_fringe
+        self.observers = []
+        self.on_expand = None
+        self.on_generate = None
+        self.on_duplicate = None
+
+        self.expanded = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.peak_fringe = 0
+        self.fringe_pushes = 0
+        self.fringe_pops = 0
+        self.heuristic_evaluations = 0
+        self.wall_time = 0.0
+        self.heuristic_time = 0.0
+        self.fringe_time = 0.0
+
+    def add_observer(self, observer):
+        """Adds an object whose on_expand(puzzle, g, f), on_generate(puzzle, g, f) and on_duplicate(puzzle, message)
+        methods (any of them may be missing or None) are called on those events"""
+
+        self.observers.append(observer)
+        self.on_expand = self.__event__('on_expand')
+        self.on_generate = self.__event__('on_generate')
+        self.on_duplicate = self.__event__('on_duplicate')
+
+    def __event__(self, name: str) -> Callable:
+        """Returns one callback calling every observer that has the method name, or None if none do"""
+
+        callbacks = [getattr(observer, name, None) for observer in self.observers]
+        callbacks = [callback for callback in callbacks if callback is not None]
+        if not callbacks:
+            return None
+        if len(callbacks) == 1 and self.sample_every == 1:
+            return callbacks[0]
+        sample_every = self.sample_every
+        count = 0
+
+        def event(*args):
+            nonlocal count
+            count += 1
+            if count % sample_every == 0:
+                for callback in callbacks:
+                    callback(*args)
+        return event
+
+    def wrap_heuristic(self, heuristic: Callable) -> Callable:
+        """Returns the heuristic wrapped to count (and time if time_heuristic is set) its evaluations"""
+
+        stats = self
+        if not self.time_heuristic:
+            def counted(puzzle):
+                stats.heuristic_evaluations += 1
+                return heuristic(puzzle)
+            return counted
+
+        def timed(puzzle):
+            stats.heuristic_evaluations += 1
+            start = time.perf_counter()
+            h = heuristic(puzzle)
+            stats.heuristic_time += time.perf_counter() - start
+            return h
+        return timed
+
+    def wrap_fringe(self, fringe_type: Callable) -> Callable:
+        """Returns a fringe_type whose queues count (and time if time_fringe is set) their pushes and pops"""
+
+        stats = self
+
+        def make_fringe():
+            return InstrumentedQueue(fringe_type(), stats)
+        return make_fringe
+
+    def record(self, expanded: int, generated: int, duplicates: int, peak_fringe: int, wall_time: float):
+        """Called by a search when it finishes (or is stopped) with its final counts"""
+
+        self.expanded += expanded
+        self.generated += generated
+        self.duplicates += duplicates
+        self.peak_fringe = max(self.peak_fringe, peak_fringe)
+        self.wall_time += wall_time
+
+    def report(self) -> dict:
+        """Returns every counter and timer by name"""
+
+        return {
+            'expanded': self.expanded,
+            'generated': self.generated,
+            'duplicates': self.duplicates,
+            'peak_fringe': self.peak_fringe,
+            'fringe_pushes': self.fringe_pushes,
+            'fringe_pops': self.fringe_pops,
+            'heuristic_evaluations': self.heuristic_evaluations,
+            'wall_time': self.wall_time,
+            'heuristic_time': self.heuristic_time,
+            'fringe_time': self.fringe_time,
+            'nodes_per_second': self.generated / self.wall_time if self.wall_time > 0 else None,
+        }
+
+
+class InstrumentedQueue:
+    """Priority queue wrapper counting (and optionally timing) the pushes and pops of another queue"""
+
+    def __init__(self, queue, stats: SearchStats):
+        self.queue = queue
+        self.stats = stats
+
+    def push(self, item, f, h: int = 0):
+        self.stats.fringe_pushes += 1
+        if self.stats.time_fringe:
+            start = time.perf_counter()
+            self.queue.push(item, f, h)
+            self.stats.fringe_time += time.perf_counter() - start
+        else:
+            self.queue.push(item, f, h)
+
+    def pop(self):
+        self.stats.fringe_pops += 1
+        if self.stats.time_fringe:
+            start = time.perf_counter()
+            item = self.queue.pop()
+            self.stats.fringe_time += time.perf_counter() - start
+            return item
+        return self.queue.pop()
+
+    def min_priority(self):
+        return self.queue.min_priority()
+
+    def __len__(self):
+        return len(self.queue)
+
+
+class VerbosePrinter:
+    """Observer printing the search as it runs, used for the verbosity parameter of the searches
+
+    - 1: states taken for expansion
+    - 2: also every successor generated
+    - 3: also successors dropped as duplicates
+    """
+
+    def __init__(self, verbosity: int):
+        self.verbosity = verbosity
+        if verbosity < 2:
+            self.on_generate = None
+        if verbosity < 3:
+            self.on_duplicate = None
+
+    def on_expand(self, puzzle, g: int, f):
+        print(f'State removed from fringe:\n{puzzle.string()}', end="")
+        print(f'With a priority of: {f} ({g} moves from the start)\n')
+
+    def on_generate(self, puzzle, g: int, f):
+        print(f'Generating successor:\n{puzzle.string()}', end="")
+        print(f'With a priority of: {f}\n')
+
+    def on_duplicate(self, puzzle, message: str):
+        print(f'{message}:\n{puzzle.string()}')
+
+
+def search_stats(stats: SearchStats, verbosity: int) -> SearchStats:
+    """Returns the stats a search should use: the given stats, with a VerbosePrinter added if verbosity > 0"""
+
+    if verbosity > 0:
+        if stats is None:
+            stats = SearchStats()
+        stats.add_observer(VerbosePrinter(verbosity))
+    return stats
+
+
+def profile_solve(search: Callable, puzzle, report_path: str, trace_memory: bool = True, **kwargs):
+    """Runs search(puzzle, **kwargs) under cProfile (and tracemalloc if trace_memory) and writes a report
+
+    The report has the search's SearchStats, the functions taking the most time and, with trace_memory,
+    the peak traced memory and the lines that allocated the most. Returns what the search returned.
+    """
+
+    stats = kwargs.pop('stats', None) or SearchStats()
+    profiler = cProfile.Profile()
+    if trace_memory:
+        tracemalloc.start()
+    profiler.enable()
+    try:
+        result = search(puzzle, stats=stats, **kwargs)
+    finally:
+        profiler.disable()
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    out = io.StringIO()
+    out.write(f'{getattr(search, "__name__", search)} on:\n{puzzle.string()}\n')
+    out.write('SEARCH STATS\n')
+    for name, value in stats.report().items():
+        out.write(f'  {name}: {value}\n')
+    out.write('\nTIME (cProfile, sorted by cumulative time)\n')
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(30)
+    if trace_memory:
+        out.write(f'MEMORY (tracemalloc)\n  peak: {peak / 1024:.1f} KiB\n  still allocated at the end: {current / 1024:.1f} KiB\n')
+        for line in snapshot.statistics('lineno')[:20]:
+            out.write(f'  {line}\n')
+    with open(report_path, 'w') as f:
+        f.write(out.getvalue())
+    return result
+
+
+def main():
+    import argparse
+    from BatchSolver import ENGINES, load_heuristic, parse_board
+
+    parser = argparse.ArgumentParser(description='Profiles one solve and writes a time and memory report')
+    parser.add_argument('board', help='tiles in row major order, separated by spaces or commas')
+    parser.add_argument('--engine', default='idastar', choices=sorted(ENGINES))
+    parser.add_argument('--heuristic', default='manhatten')
+    parser.add_argument('--report', default='profile.txt')
+    parser.add_argument('--no-memory', action='store_true', help='do not trace memory (tracemalloc is slow)')
+    args = parser.parse_args()
+
+    stats = SearchStats(time_heuristic=True, time_fringe=True)
+    profile_solve(ENGINES[args.engine], parse_board(args.board), args.report, not args.no_memory,
+                  heuristic=load_heuristic(args.heuristic), stats=stats)
+    print(f'Report written to {args.report}')
+    for name, value in stats.report().items():
+        print(f'{name}: {value}')
+
+
+if __name__ == '__main__':
+    main()
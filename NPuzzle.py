@@ -2,7 +2,263 @@
 
 import math
 import random
-import copy
+
+# Directions the blank space (0) can be moved in. The order matches the order the
+# searches generate successors in, and the opposite of a move is (move + 2) % 4.
+UP = 0
+RIGHT = 1
+DOWN = 2
+LEFT = 3
+MOVE_NAMES = ('up', 'right', 'down', 'left')
+# The move on the transposed board (see NPuzzle.transposed) matching each move, the blank moving up moves left there
+TRANSPOSED_MOVES = (LEFT, DOWN, RIGHT, UP)
+# The largest side the walking distance table is built for. The 24-puzzle's table has too many entries
+# to build in memory (see PuzzleGeometry.walking_distances)
+MAX_WALKING_DISTANCE_SIDE = 4
+
+def tile_bits(n: int) -> int:
+    """Returns the number of bits used to store one tile in a packed n-puzzle state.
+
+    4 bits per tile for the 8 and 15 puzzles (a 15-puzzle fits in 64 bits), more for larger puzzles.
+    """
+
+    return max(4, n.bit_length())
+
+
+def pack_tiles(tiles, bits: int) -> int:
+    """Packs a flat sequence of tiles into an int, cell i is stored at bits [i*bits, (i+1)*bits)"""
+
+    packed = 0
+    for cell, tile in enumerate(tiles):
+        packed |= tile << (cell * bits)
+    return packed
+
+
+def unpack_tiles(packed: int, cells: int, bits: int) -> tuple[int, ...]:
+    """Unpacks a packed state into a flat tuple of tiles (row major)"""
+
+    mask = (1 << bits) - 1
+    return tuple((packed >> (cell * bits)) & mask for cell in range(cells))
+
+
+def count_inversions(values) -> int:
+    """Returns the number of pairs of values that are out of order (a larger value before a smaller one)
+
+    The values must be positive ints. Counted in O(n log n) with a Fenwick tree of the values seen so far.
+    """
+
+    size = max(values, default=0)
+    tree = [0] * (size + 1)
+    inversions = 0
+    for seen, value in enumerate(values):
+        # earlier values larger than this one = values seen - earlier values not larger
+        not_larger = 0
+        i = value
+        while i > 0:
+            not_larger += tree[i]
+            i -= i & -i
+        inversions += seen - not_larger
+        i = value
+        while i <= size:
+            tree[i] += 1
+            i += i & -i
+    return inversions
+
+
+def validate_state(n: int, state: list[list[int]]):
+    """Raises ValueError if state is not a legal n-puzzle layout
+
+    A legal layout is side rows of side ints holding each of the tiles 0..n exactly once.
+    """
+
+    side = geometry(n).side
+    if len(state) != side or any(len(row) != side for row in state):
+        raise ValueError(f'an {n}-puzzle state must be {side} rows of {side} tiles')
+    tiles = [tile for row in state for tile in row]
+    if any(not isinstance(tile, int) for tile in tiles) or sorted(tiles) != list(range(n + 1)):
+        raise ValueError(f'an {n}-puzzle state must hold each of the tiles 0 to {n} exactly once')
+
+
+class PuzzleGeometry:
+    """Everything about an n-puzzle that only depends on n, built once and shared.
+
+    Use geometry(n) to get the shared instance for a puzzle size rather than creating one.
+
+    - side: the side length of the board
+    - cells: the number of cells on the board (n + 1)
+    - bits/mask: the number of bits per tile in a packed state and a mask for one tile
+    - goal_state: the goal layout as a list of rows (shared, do not modify)
+    - goal_tiles/goal_packed: the goal layout as a flat tuple and packed into an int
+    - solved_positions: dict mapping each tile to its solved (row, column)
+    - neighbors: entry [cell][direction] is the cell the blank space moves to from cell, or -1 if off the board
+    - distances: entry [tile][cell] is the manhatten distance from cell to the solved position of tile (0 for the blank)
+    - goal_rows/goal_cols: the solved row and column of each tile
+    - row_digits/col_digits: entry [tile][cell] is the solved column (row) of tile + 1 if tile is solved in the
+      row (column) through cell, else 0. A line's key is the sum of its digits times line_powers[position in line]
+    - line_conflicts: the number of tiles that must leave a line for the rest to be in order, indexed by line key
+    - line_key_bits: the bits a line key takes when the keys of all the rows (or columns) are packed into one int
+    - transpose_cells: the cell each cell is mirrored to across the main diagonal
+    - transpose_tiles: the tile each tile is relabelled to on the transposed board (the tile solved in its mirrored cell)
+    - zobrist: entry [tile][cell] is a random 64 bit int, the Zobrist key of a board is the XOR of the entries of
+      its tiles. The blank space's entries are 0 (its cell follows from the other tiles), so a move changes the key
+      by two XORs. The table comes from a fixed seed, so every process builds the same one
+    - walking_distances(): the walking distance table, only built the first time it is used
+    """
+
+    def __init__(self, n: int):
+        if not math.sqrt(n + 1).is_integer():
+            raise Exception("n+1 must be a perfect square")
+        side = math.isqrt(n + 1)
+        cells = n + 1
+        self.n = n
+        self.side = side
+        self.cells = cells
+        self.bits = tile_bits(n)
+        self.mask = (1 << self.bits) - 1
+
+        # The goal has the tiles in ascending order with the blank space (0) in the bottom right corner
+        self.goal_tiles = tuple(range(1, cells)) + (0,)
+        self.goal_state = [list(self.goal_tiles[row * side:(row + 1) * side]) for row in range(side)]
+        self.goal_packed = pack_tiles(self.goal_tiles, self.bits)
+        self.solved_positions = {tile: divmod(tile - 1, side) for tile in range(1, cells)}
+
+        neighbors = []
+        for cell in range(cells):
+            row, col = divmod(cell, side)
+            neighbors.append((
+                cell - side if row > 0 else -1,
+                cell + 1 if col < side - 1 else -1,
+                cell + side if row < side - 1 else -1,
+                cell - 1 if col > 0 else -1,
+            ))
+        self.neighbors = tuple(neighbors)
+
+        distances = [(0,) * cells]
+        for tile in range(1, cells):
+            goal_row, goal_col = self.solved_positions[tile]
+            distances.append(tuple(abs(cell // side - goal_row) + abs(cell % side - goal_col) for cell in range(cells)))
+        self.distances = tuple(distances)
+
+        # The blank space has no solved row or column, it is given the last line so walking distance keys are simple
+        self.goal_rows = (side - 1,) + tuple(self.solved_positions[tile][0] for tile in range(1, cells))
+        self.goal_cols = (side - 1,) + tuple(self.solved_positions[tile][1] for tile in range(1, cells))
+
+        # Linear conflict tables
+        self.line_powers = tuple((side + 1) ** i for i in range(side))
+        row_digits = [(0,) * cells]
+        col_digits = [(0,) * cells]
+        for tile in range(1, cells):
+            goal_row, goal_col = self.solved_positions[tile]
+            row_digits.append(tuple(goal_col + 1 if cell // side == goal_row else 0 for cell in range(cells)))
+            col_digits.append(tuple(goal_row + 1 if cell % side == goal_col else 0 for cell in range(cells)))
+        self.row_digits = tuple(row_digits)
+        self.col_digits = tuple(col_digits)
+        conflicts = []
+        for key in range((side + 1) ** side):
+            # solved positions (in line order) of the tiles in this line that belong to it
+            order = []
+            for i in range(side):
+                key, digit = divmod(key, side + 1)
+                if digit:
+                    order.append(digit)
+            # tiles that must move out = tiles - longest increasing subsequence
+            longest = [1] * len(order)
+            for i in range(len(order)):
+                for j in range(i):
+                    if order[j] < order[i] and longest[j] + 1 > longest[i]:
+                        longest[i] = longest[j] + 1
+            conflicts.append(len(order) - max(longest, default=0))
+        self.line_conflicts = tuple(conflicts)
+        self.line_key_bits = (len(conflicts) - 1).bit_length()
+
+        self.transpose_cells = tuple((cell % side) * side + cell // side for cell in range(cells))
+        self.transpose_tiles = (0,) + tuple(self.transpose_cells[tile - 1] + 1 for tile in range(1, cells))
+
+        rng = random.Random(n)
+        self.zobrist = ((0,) * cells,) + tuple(tuple(rng.getrandbits(64) for cell in range(cells))
+                                               for tile in range(1, cells))
+
+        self._walking_distances = None
+
+    def walking_distance_key(self, counts: list[list[int]], blank_line: int) -> int:
+        """Returns the walking distance key of a count matrix and the line the blank space is in
+
+        counts[line][goal] is the number of tiles in line (row or column) that are solved in line goal.
+        Each count is stored in 3 bits at 3*(line*side + goal), the blank line above all of them, so a
+        count can be at most 7 and the side at most 7.
+        """
+
+        side = self.side
+        assert side < 8, 'walking distance counts are packed in 3 bits'
+        key = blank_line << (3 * side * side)
+        for line in range(side):
+            for goal in range(side):
+                key |= counts[line][goal] << (3 * (line * side + goal))
+        return key
+
+    def walking_distances(self) -> dict[int, int]:
+        """Returns the walking distance table, building it the first time.
+
+        Maps the walking distance key of every reachable (count matrix, blank line) to the number of
+        moves between neighboring lines needed to get every tile to its solved line. Rows and columns
+        share the table because the goal is symmetric.
+        Raises ValueError for puzzles wider than MAX_WALKING_DISTANCE_SIDE (the 24-puzzle's table does not
+        fit in memory as a dict).
+        """
+
+        if self._walking_distances is None:
+            side = self.side
+            if side > MAX_WALKING_DISTANCE_SIDE:
+                raise ValueError(f'walking distance is only available up to the '
+                                 f'{MAX_WALKING_DISTANCE_SIDE ** 2 - 1}-puzzle, not the {self.n}-puzzle')
+            blank_shift = 3 * side * side
+            goal_counts = [[side if goal == line else 0 for goal in range(side)] for line in range(side)]
+            goal_counts[side - 1][side - 1] = side - 1
+            start = self.walking_distance_key(goal_counts, side - 1)
+            table = {start: 0}
+            layer = [start]
+            depth = 0
+            while layer:
+                depth += 1
+                next_layer = []
+                for key in layer:
+                    blank_line = key >> blank_shift
+                    for line in (blank_line - 1, blank_line + 1):
+                        if line < 0 or line >= side:
+                            continue
+                        # a tile solved in line goal moves from line into the blank line
+                        for goal in range(side):
+                            if (key >> (3 * (line * side + goal))) & 7:
+                                moved = (key + (1 << (3 * (blank_line * side + goal))) - (1 << (3 * (line * side + goal)))
+                                         + ((line - blank_line) << blank_shift))
+                                if moved not in table:
+                                    table[moved] = depth
+                                    next_layer.append(moved)
+                layer = next_layer
+            self._walking_distances = table
+        return self._walking_distances
+
+
+def unwrap_heuristic(heuristic):
+    """Returns the heuristic inside wrappers marked with __wrapped__ (such as BatchSolver.LimitedHeuristic)"""
+
+    while hasattr(heuristic, '__wrapped__'):
+        heuristic = heuristic.__wrapped__
+    return heuristic
+
+
+# The shared geometry of every puzzle size used so far
+_geometries: dict[int, PuzzleGeometry] = {}
+
+
+def geometry(n: int) -> PuzzleGeometry:
+    """Returns the shared PuzzleGeometry for the n-puzzle, building it the first time"""
+
+    geo = _geometries.get(n)
+    if geo is None:
+        geo = PuzzleGeometry(n)
+        _geometries[n] = geo
+    return geo
 
 
 class NPuzzle:
@@ -12,56 +268,284 @@ class NPuzzle:
     that is guarenteed to be solvable. May also initialize the puzzle
     with a chosen state specified by the input arguments.*
 
+    The board is stored packed into a single int (see pack_tiles) along with the
+    flat index of the blank space, so moves and copies are O(1). The list of lists
+    state is still available as a view over the packed board. Once a heuristic
+    (manhatten distance, linear conflict or walking distance) or the Zobrist key has been
+    calculated it is kept up to date by every move and copy.
+
     *Note: n+1 must be a perfect square.
-    *Note: When given a starting state, init DOES NOT check for illegal states. So be sure to
-    check that the assigned state is a legal n-puzzle format. Any given state is not guarenteed
-    to be solvable. Undefined behaviour may occur if given an illegal/improper starting instance.
-    *Note: When given a starting state, a deep copy is made
+    *Note: When given a starting state, init raises ValueError if it is not a legal n-puzzle
+    layout (see validate_state). A legal state is not guarenteed to be solvable, check is_solvable.
+    *Note: When given a starting state, the state is packed so later changes to the given lists
+    do not affect the puzzle
     """
 
-    state: list[list[int]]
     n: int
+    side: int
+    packed: int
+    blank: int
 
     def __init__(self, n: int, state: list[list[int]] = None):
         self.n = n
-        if not math.sqrt(n + 1).is_integer():
-            raise Exception("n+1 must be a perfect square")
+        self.geometry = geometry(n)
+        self.side = self.geometry.side
         if state is not None:
-            self.state = copy.deepcopy(state)
+            self.state = state
         else:
             self.state = self.goal_state
             self.__randomize__()
 
+    @classmethod
+    def from_packed(cls, n: int, packed: int, blank: int = None, zobrist: int = None,
+                    manhatten: int = None) -> 'NPuzzle':
+        """Creates a puzzle directly from a packed state (and blank index, Zobrist key and manhatten distance
+        if already known)."""
+
+        puzzle = cls.__new__(cls)
+        puzzle.n = n
+        puzzle.geometry = geometry(n)
+        puzzle.side = puzzle.geometry.side
+        puzzle.packed = packed
+        if blank is None:
+            blank = unpack_tiles(packed, n + 1, puzzle.geometry.bits).index(0)
+        puzzle.blank = blank
+        puzzle._reset_heuristics()
+        puzzle._manhatten = manhatten
+        puzzle._zobrist = zobrist
+        return puzzle
+
+    def heuristic_keys(self, heuristic) -> tuple[int, int]:
+        """Returns the values besides h that seed_heuristic needs to set up another board in this state for
+        heuristic, as a pair of ints, or None if h is enough. heuristic must have been evaluated on this board.
+
+        - linear conflict: the keys of the rows and the keys of the columns, each packed into one int
+        - walking distance: the vertical and horizontal walking distance keys
+        - anything else (such as a pattern database): the manhatten distance and 0
+        """
+
+        heuristic = unwrap_heuristic(heuristic)
+        if heuristic is NPuzzle.manhatten_distance:
+            return None
+        if heuristic is NPuzzle.linear_conflict:
+            bits = self.geometry.line_key_bits
+            rows = cols = 0
+            for line in range(self.side):
+                rows |= self._conflict_rows[line] << (line * bits)
+                cols |= self._conflict_cols[line] << (line * bits)
+            return rows, cols
+        if heuristic is NPuzzle.walking_distance:
+            return self._walking_rows, self._walking_cols
+        return self.manhatten_distance(), 0
+
+    def seed_heuristic(self, heuristic, h: int, keys: tuple[int, int] = None):
+        """Gets a board made from a packed state ready for its successors' heuristic values to be updated
+        incrementally, given the value h of heuristic for it and the keys heuristic_keys gave for the state
+
+        Nothing is recalculated: the manhatten distance is simply set to h, and the other heuristics' values
+        are unpacked from keys. Without keys a heuristic other than the manhatten distance is evaluated once.
+        Wrappers marked with __wrapped__ (such as BatchSolver.LimitedHeuristic) are looked through.
+        """
+
+        heuristic = unwrap_heuristic(heuristic)
+        if heuristic is NPuzzle.manhatten_distance:
+            self._manhatten = h
+        elif keys is None:
+            heuristic(self)
+        elif heuristic is NPuzzle.linear_conflict:
+            geo = self.geometry
+            bits = geo.line_key_bits
+            mask = (1 << bits) - 1
+            self._conflict_rows = [(keys[0] >> (line * bits)) & mask for line in range(self.side)]
+            self._conflict_cols = [(keys[1] >> (line * bits)) & mask for line in range(self.side)]
+            self._conflicts = (sum(geo.line_conflicts[key] for key in self._conflict_rows)
+                               + sum(geo.line_conflicts[key] for key in self._conflict_cols))
+            self._manhatten = h - 2 * self._conflicts
+        elif heuristic is NPuzzle.walking_distance:
+            self._walking_rows, self._walking_cols = keys
+        else:
+            self._manhatten = keys[0]
+
+    def _reset_heuristics(self):
+        """Forgets the incrementally kept heuristic values (they are recalculated when next used)"""
+
+        self._manhatten = None
+        self._conflicts = None
+        self._conflict_rows = None
+        self._conflict_cols = None
+        self._walking_rows = None
+        self._walking_cols = None
+
+    @property
+    def state(self) -> list[list[int]]:
+        """The state of the puzzle as a list of rows.
+
+        This is a fresh list built from the packed board, editing it does not change the puzzle.
+        Assign to state to change the board.
+        """
+
+        tiles = self.tiles
+        side = self.side
+        return [list(tiles[row * side:(row + 1) * side]) for row in range(side)]
+
+    @state.setter
+    def state(self, state: list[list[int]]):
+        validate_state(self.n, state)
+        tiles = [val for row in state for val in row]
+        self.packed = pack_tiles(tiles, self.geometry.bits)
+        self.blank = tiles.index(0)
+        self._reset_heuristics()
+        self._zobrist = None
+
+    @property
+    def tiles(self) -> tuple[int, ...]:
+        """The state of the puzzle as a flat tuple of tiles (row major)"""
+
+        return unpack_tiles(self.packed, self.n + 1, self.geometry.bits)
+
+    @property
+    def key(self) -> int:
+        """Hashable key identifying the state of the puzzle (the packed board)
+
+        Unlike zobrist two different states never share a key, so searches use it for their closed lists.
+        """
+
+        return self.packed
+
+    @property
+    def zobrist(self) -> int:
+        """The Zobrist key of the state, a 64 bit hash of the board (see PuzzleGeometry.zobrist)
+
+        It is only calculated in full the first time, after that moves update it with two XORs and copies
+        of the puzzle inherit it. Different states can share a key, though it is very unlikely, so use it to
+        spread states evenly (over workers or table slots) and key to tell states apart.
+        """
+
+        if self._zobrist is None:
+            table = self.geometry.zobrist
+            zobrist = 0
+            for cell, tile in enumerate(self.tiles):
+                zobrist ^= table[tile][cell]
+            self._zobrist = zobrist
+        return self._zobrist
+
+    def __eq__(self, other) -> bool:
+        """Two puzzles are equal when they are the same size with the same board"""
+
+        return isinstance(other, NPuzzle) and self.n == other.n and self.packed == other.packed
+
+    def __hash__(self) -> int:
+        """Hashes the puzzle by its Zobrist key, so do not move a puzzle while it is in a set or dict"""
+
+        return self.zobrist
+
     @property
     def goal_state(self) -> list[list[int]]:
         """Returns the goal state of the n-puzzle.
 
         The goal state is defined as all of the numbers are arranged in ascending order
         left to right and top to bottom with the blank space (0) in the bottom right corner.
+        Returns a copy of the goal layout cached in the puzzle's geometry.
         """
 
-        base = int(math.sqrt(self.n + 1))
-        goal_state = []
-        for i in range(base):
-            goal_state.append([])
-        val = 1
-        for row in goal_state:
-            for i in range(base):
-                if val == self.n + 1:
-                    row.append(0)
-                else:
-                    row.append(val)
-                val += 1
-        return goal_state
+        return [list(row) for row in self.geometry.goal_state]
 
     @property
     def is_solved(self) -> bool:
         """Returns True if the n-puzzle is in the goal state."""
 
-        if self.state == self.goal_state:
-            return True
-        else:
+        return self.packed == self.geometry.goal_packed
+
+    @property
+    def is_solvable(self) -> bool:
+        """Returns True if the goal state can be reached from this state.
+
+        Every move keeps the parity of the number of inversions (pairs of tiles out of order, reading
+        the board row by row without the blank) for odd sides. For even sides a vertical move changes
+        it along with the row of the blank, so their sum keeps its parity. A state is solvable when that
+        parity matches the goal's. O(n log n).
+        """
+
+        inversions = count_inversions([tile for tile in self.tiles if tile != 0])
+        if self.side % 2 == 1:
+            return inversions % 2 == 0
+        return (inversions + self.blank // self.side) % 2 == (self.side - 1) % 2
+
+    def move(self, direction: int) -> bool:
+        """Moves the blank space (0) one cell in the given direction (UP, RIGHT, DOWN or LEFT)
+
+        Returns True if the move succeeds.
+        Returns False if the blank space cannot be moved that way (it is on that edge of the puzzle).
+        """
+
+        geo = self.geometry
+        target = geo.neighbors[self.blank][direction]
+        if target < 0:
             return False
+        # Slide the tile in the target cell into the blank cell
+        shift = target * geo.bits
+        tile = (self.packed >> shift) & geo.mask
+        self.packed += (tile << (self.blank * geo.bits)) - (tile << shift)
+        # The tile moved from target to the old blank cell, update the manhatten distance for it
+        if self._manhatten is not None:
+            dist = geo.distances[tile]
+            self._manhatten += dist[self.blank] - dist[target]
+        if self._conflicts is not None:
+            self.__move_conflicts__(tile, target, self.blank)
+        if self._walking_rows is not None:
+            self.__move_walking__(tile, target, self.blank)
+        if self._zobrist is not None:
+            self._zobrist ^= geo.zobrist[tile][target] ^ geo.zobrist[tile][self.blank]
+        self.blank = target
+        return True
+
+    def __move_conflicts__(self, tile: int, source: int, dest: int):
+        """Updates the linear conflict line keys and total for tile moving from cell source to cell dest"""
+
+        geo = self.geometry
+        table = geo.line_conflicts
+        powers = geo.line_powers
+        rows = self._conflict_rows
+        cols = self._conflict_cols
+        source_row, source_col = divmod(source, geo.side)
+        dest_row, dest_col = divmod(dest, geo.side)
+
+        # take out the old values of the lines the tile leaves and enters
+        changed_rows = (source_row,) if source_row == dest_row else (source_row, dest_row)
+        changed_cols = (source_col,) if source_col == dest_col else (source_col, dest_col)
+        conflicts = self._conflicts
+        for row in changed_rows:
+            conflicts -= table[rows[row]]
+        for col in changed_cols:
+            conflicts -= table[cols[col]]
+
+        rows[source_row] -= geo.row_digits[tile][source] * powers[source_col]
+        rows[dest_row] += geo.row_digits[tile][dest] * powers[dest_col]
+        cols[source_col] -= geo.col_digits[tile][source] * powers[source_row]
+        cols[dest_col] += geo.col_digits[tile][dest] * powers[dest_row]
+
+        for row in changed_rows:
+            conflicts += table[rows[row]]
+        for col in changed_cols:
+            conflicts += table[cols[col]]
+        self._conflicts = conflicts
+
+    def __move_walking__(self, tile: int, source: int, dest: int):
+        """Updates the walking distance keys for tile moving from cell source to cell dest (the blank space)"""
+
+        geo = self.geometry
+        side = geo.side
+        blank_shift = 3 * side * side
+        source_row, source_col = divmod(source, side)
+        dest_row, dest_col = divmod(dest, side)
+        if source_row != dest_row:
+            goal = geo.goal_rows[tile]
+            self._walking_rows += ((1 << (3 * (dest_row * side + goal))) - (1 << (3 * (source_row * side + goal)))
+                                   + ((source_row - dest_row) << blank_shift))
+        else:
+            goal = geo.goal_cols[tile]
+            self._walking_cols += ((1 << (3 * (dest_col * side + goal))) - (1 << (3 * (source_col * side + goal)))
+                                   + ((source_col - dest_col) << blank_shift))
 
     def move_up(self) -> bool:
         """Moves the blank space (0) up by one
@@ -71,16 +555,7 @@ class NPuzzle:
         if the blank space is already at the top of the puzzle.
         """
 
-        zero_loc = self.__find_tile__(0)
-        above_zero = (zero_loc[0] - 1, zero_loc[1])
-        # Checks if the blank space is at the top of the puzzle
-        if above_zero[0] < 0:
-            return False
-        # Moves the space
-        val_above = self.state[above_zero[0]][above_zero[1]]
-        self.state[above_zero[0]][above_zero[1]] = 0
-        self.state[zero_loc[0]][zero_loc[1]] = val_above
-        return True
+        return self.move(UP)
 
     def move_down(self) -> bool:
         """Moves the blank space (0) down by one
@@ -90,16 +565,7 @@ class NPuzzle:
         if the blank space is already at the bottom of the puzzle.
         """
 
-        zero_loc = self.__find_tile__(0)
-        below_zero = (zero_loc[0] + 1, zero_loc[1])
-        # Checks if the blank space is at the bottom of the puzzle
-        if below_zero[0] > math.sqrt(self.n + 1) - 1:
-            return False
-        # Moves the space
-        val_below = self.state[below_zero[0]][below_zero[1]]
-        self.state[below_zero[0]][below_zero[1]] = 0
-        self.state[zero_loc[0]][zero_loc[1]] = val_below
-        return True
+        return self.move(DOWN)
 
     def move_left(self) -> bool:
         """Moves the blank space (0) left by one
@@ -109,16 +575,7 @@ class NPuzzle:
         if the blank space is already at the far left of the puzzle.
         """
 
-        zero_loc = self.__find_tile__(0)
-        left_of_zero = (zero_loc[0], zero_loc[1] - 1)
-        # Checks if the blank space is at the far left of the puzzle
-        if left_of_zero[1] < 0:
-            return False
-        # Moves the space
-        val_left = self.state[left_of_zero[0]][left_of_zero[1]]
-        self.state[left_of_zero[0]][left_of_zero[1]] = 0
-        self.state[zero_loc[0]][zero_loc[1]] = val_left
-        return True
+        return self.move(LEFT)
 
     def move_right(self) -> bool:
         """Moves the blank space (0) right by one
@@ -128,16 +585,7 @@ class NPuzzle:
         if the blank space is already at the far right of the puzzle.
         """
 
-        zero_loc = self.__find_tile__(0)
-        right_of_zero = (zero_loc[0], zero_loc[1] + 1)
-        # Checks if the blank space is at the far right of the puzzle
-        if right_of_zero[1] > math.sqrt(self.n + 1) - 1:
-            return False
-        # Moves the space
-        val_right = self.state[right_of_zero[0]][right_of_zero[1]]
-        self.state[right_of_zero[0]][right_of_zero[1]] = 0
-        self.state[zero_loc[0]][zero_loc[1]] = val_right
-        return True
+        return self.move(RIGHT)
 
     def __find_tile__(self, tile: int) -> tuple[int, int]:
         """Returns the location of the specified tile in the puzzle.
@@ -145,10 +593,9 @@ class NPuzzle:
         Location is in the form of (row, column), zero indexed.
         """
 
-        for row in self.state:
-            for val in row:
-                if val == tile:
-                    return (self.state.index(row), row.index(val))
+        if tile == 0:
+            return divmod(self.blank, self.side)
+        return divmod(self.tiles.index(tile), self.side)
 
     def __randomize__(self):
         """Randomizes the state of the puzzle.
@@ -171,20 +618,69 @@ class NPuzzle:
         """Returns the total manhatten distance of the combined tiles
 
         Calculates the manhatten distance of each tile and returns the sum of the distances.
+        The sum is only calculated in full the first time, after that moves update it in O(1)
+        and copies of the puzzle inherit it.
+        """
+
+        if self._manhatten is None:
+            distances = self.geometry.distances
+            self._manhatten = sum(distances[tile][cell] for cell, tile in enumerate(self.tiles))
+        return self._manhatten
+
+    def linear_conflict(self) -> int:
+        """Returns the manhatten distance plus 2 for every tile that has to leave its row or column to let
+        the other tiles that belong in that line pass it
+
+        Each row and column is looked up in the geometry's line_conflicts table. After the first call
+        moves only update the lines they change and copies of the puzzle inherit the values.
         """
 
-        dist = 0
-        for tile in range(1, self.n + 1):
-            dist += self.__manhatten_helper__(tile)
-        return dist
+        if self._conflicts is None:
+            geo = self.geometry
+            side = geo.side
+            powers = geo.line_powers
+            rows = [0] * side
+            cols = [0] * side
+            for cell, tile in enumerate(self.tiles):
+                row, col = divmod(cell, side)
+                rows[row] += geo.row_digits[tile][cell] * powers[col]
+                cols[col] += geo.col_digits[tile][cell] * powers[row]
+            self._conflict_rows = rows
+            self._conflict_cols = cols
+            self._conflicts = sum(geo.line_conflicts[key] for key in rows) + sum(geo.line_conflicts[key] for key in cols)
+        return self.manhatten_distance() + 2 * self._conflicts
+
+    def walking_distance(self) -> int:
+        """Returns the walking distance of the puzzle
+
+        The vertical walking distance is the number of moves needed to get every tile into its solved row when
+        only the row a tile is in (not its column) is tracked, and the same for columns. Their sum is looked up
+        in the geometry's walking distance table and is never less than the manhatten distance.
+        After the first call moves update the table keys in O(1) and copies of the puzzle inherit them.
+        Raises ValueError for puzzles larger than the 15-puzzle (see PuzzleGeometry.walking_distances).
+        """
+
+        table = self.geometry.walking_distances()
+        if self._walking_rows is None:
+            geo = self.geometry
+            side = geo.side
+            rows = [[0] * side for i in range(side)]
+            cols = [[0] * side for i in range(side)]
+            for cell, tile in enumerate(self.tiles):
+                if tile != 0:
+                    row, col = divmod(cell, side)
+                    rows[row][geo.goal_rows[tile]] += 1
+                    cols[col][geo.goal_cols[tile]] += 1
+            blank_row, blank_col = divmod(self.blank, side)
+            self._walking_rows = geo.walking_distance_key(rows, blank_row)
+            self._walking_cols = geo.walking_distance_key(cols, blank_col)
+        return table[self._walking_rows] + table[self._walking_cols]
 
     def __manhatten_helper__(self, tile: int) -> int:
         """Calculates and returns the manhatten distance for the specified tile."""
 
-        tile_loc = self.__find_tile__(tile)
-        dist = abs(tile_loc[0] - self.solved_positions[tile][0]) + abs(tile_loc[1] - self.solved_positions[tile][1])
-        # print(f'Tile: {tile} Dist: {dist}')
-        return dist
+        row, col = self.__find_tile__(tile)
+        return self.geometry.distances[tile][row * self.side + col]
 
     def string(self):
         """Returns a string representation of the n-puzzle state"""
@@ -202,19 +698,63 @@ class NPuzzle:
         """The positions of each tile when the puzzle is solved.
 
         A dictionary mapping int (tile) to its solved position (tuple[int, int])
+        The dictionary is shared by every puzzle of this size, do not modify it.
+        """
+
+        return self.geometry.solved_positions
+
+    def transposed(self) -> 'NPuzzle':
+        """Returns the puzzle mirrored across its main diagonal, with each tile relabelled to the tile solved
+        in its mirrored cell
+
+        The goal is its own transpose, so the transposed puzzle is exactly as far from the goal and its
+        solutions are this puzzle's solutions with each move replaced by TRANSPOSED_MOVES[move].
         """
 
-        solved_positions = {}
-        t = 1
-        for row in range(0, int(math.sqrt(self.n + 1))):
-            for col in range(0, int(math.sqrt(self.n + 1))):
-                solved_positions[t] = (row, col)
-                t += 1
-        return solved_positions
+        geo = self.geometry
+        tiles = [0] * geo.cells
+        for cell, tile in enumerate(self.tiles):
+            tiles[geo.transpose_cells[cell]] = geo.transpose_tiles[tile]
+        return NPuzzle.from_packed(self.n, pack_tiles(tiles, geo.bits), geo.transpose_cells[self.blank])
+
+    def __reduce__(self):
+        """Pickles the puzzle as just its size and packed board (for sending puzzles between processes)"""
+
+        return (NPuzzle.from_packed, (self.n, self.packed, self.blank))
 
     def copy(self):
-        """Creates a deep copy of the NPuzzle instance."""
-        return NPuzzle(self.n, self.state)
+        """Creates a copy of the NPuzzle instance.
+
+        Only the packed board, the Zobrist key and the heuristic values kept so far are copied, so this is O(1)
+        (O(side) once linear conflict has been used).
+        """
+
+        clone = NPuzzle.__new__(NPuzzle)
+        clone.n = self.n
+        clone.geometry = self.geometry
+        clone.side = self.side
+        clone._manhatten = self._manhatten
+        clone._conflicts = self._conflicts
+        if self._conflicts is not None:
+            clone._conflict_rows = list(self._conflict_rows)
+            clone._conflict_cols = list(self._conflict_cols)
+        else:
+            clone._conflict_rows = None
+            clone._conflict_cols = None
+        clone._walking_rows = self._walking_rows
+        clone._walking_cols = self._walking_cols
+        clone._zobrist = self._zobrist
+        clone.packed = self.packed
+        clone.blank = self.blank
+        return clone
+
+
+# The heuristics an NPuzzle provides, by name. Any of them can be passed as the heuristic of a search.
+HEURISTICS = {
+    'manhatten': NPuzzle.manhatten_distance,
+    'linear_conflict': NPuzzle.linear_conflict,
+    'walking_distance': NPuzzle.walking_distance,
+}
 
 
 if __name__ == '__main__':
@@ -0,0 +1,123 @@
+# Author: Alex Hemmerlin
+# This file implements a store of search nodes kept in parallel arrays and referred to by integer id
+
+from NPuzzle import NPuzzle, geometry, unwrap_heuristic
+from array import array
+
+
+class NodePool:
+    """Search nodes of one n-puzzle search stored column by column in parallel arrays
+
+    A node is the index (id) of its row, so it takes a few bytes in each array instead of a Python
+    object holding an NPuzzle. The board of a node is only made into an NPuzzle when it is needed.
+
+    - states: the packed board of each node (an array of 64 bit ints when a packed board fits, else a list)
+    - blanks: the cell of the blank space
+    - g: the number of moves from the start
+    - f: the priority the node was given (g + h, see board)
+    - parents: the id of the node's parent, -1 for the start
+    - moves: the move (UP, RIGHT, DOWN or LEFT) that made the node from its parent, -1 for the start
+    - closed: 1 once the node has been expanded
+    - row_keys/col_keys: the two values NPuzzle.heuristic_keys gives for the node's board, only kept for a
+      heuristic other than the manhatten distance (keyed is then True), so board() never evaluates it again
+    """
+
+    def __init__(self, n: int, heuristic=NPuzzle.manhatten_distance):
+        geo = geometry(n)
+        self.n = n
+        self.heuristic = heuristic
+        self.keyed = unwrap_heuristic(heuristic) is not NPuzzle.manhatten_distance
+        # line keys of a board wider than 4 do not fit in 64 bits, walking distance keys always do
+        self.row_keys = array('Q') if geo.side * geo.line_key_bits <= 64 else []
+        self.col_keys = array('Q') if geo.side * geo.line_key_bits <= 64 else []
+        self.states = array('Q') if geo.cells * geo.bits <= 64 else []
+        self.blanks = array('B')
+        self.g = array('H')
+        self.f = array('H')
+        self.parents = array('i')
+        self.moves = array('b')
+        self.closed = bytearray()
+
+    def add(self, packed: int, blank: int, g: int, f: int, parent: int = -1, move: int = -1,
+            keys: tuple[int, int] = None) -> int:
+        """Stores a new node and returns its id, keys are the board's heuristic keys if the pool is keyed"""
+
+        self.states.append(packed)
+        self.blanks.append(blank)
+        self.g.append(g)
+        self.f.append(f)
+        self.parents.append(parent)
+        self.moves.append(move)
+        self.closed.append(0)
+        if self.keyed:
+            self.row_keys.append(keys[0])
+            self.col_keys.append(keys[1])
+        return len(self.blanks) - 1
+
+    def add_puzzle(self, puzzle: NPuzzle, g: int, f: int, parent: int = -1, move: int = -1) -> int:
+        """Stores a new node for the state of puzzle (which the heuristic has been evaluated on) and returns its id"""
+
+        keys = puzzle.heuristic_keys(self.heuristic) if self.keyed else None
+        return self.add(puzzle.packed, puzzle.blank, g, f, parent, move, keys)
+
+    def puzzle(self, node: int) -> NPuzzle:
+        """Returns a new NPuzzle in the state of the node"""
+
+        return NPuzzle.from_packed(self.n, self.states[node], self.blanks[node])
+
+    def board(self, node: int) -> NPuzzle:
+        """Returns a new NPuzzle in the state of the node to expand, ready for the successors' heuristic values
+        to be updated incrementally (see NPuzzle.seed_heuristic)
+
+        The node's h is f - g, so f must have been stored as g + h.
+        """
+
+        board = NPuzzle.from_packed(self.n, self.states[node], self.blanks[node])
+        keys = (self.row_keys[node], self.col_keys[node]) if self.keyed else None
+        board.seed_heuristic(self.heuristic, self.f[node] - self.g[node], keys)
+        return board
+
+    def moves_to(self, node: int) -> list[int]:
+        """Returns the moves from the start to the node, walking up the parent ids"""
+
+        moves = []
+        while self.parents[node] != -1:
+            moves.append(self.moves[node])
+            node = self.parents[node]
+        moves.reverse()
+        return moves
+
+    def path(self, node: int) -> list[NPuzzle]:
+        """Returns the puzzles from the node back to the start (the same order as get_path)"""
+
+        path = []
+        while node != -1:
+            path.append(self.puzzle(node))
+            node = self.parents[node]
+        return path
+
+    def chain(self, node: int, node_type):
+        """Returns the node as a chain of node_type(priority, puzzle, parent, moves) objects back to the start,
+        such as AStarSearch.Node, for code that walks the parent links of a result"""
+
+        ids = []
+        while node != -1:
+            ids.append(node)
+            node = self.parents[node]
+        result = None
+        for node in reversed(ids):
+            result = node_type(self.f[node], self.puzzle(node), result, self.g[node])
+        return result
+
+    def bytes_per_node(self) -> int:
+        """Returns the bytes each node takes in the arrays (for a list of states only the reference is counted)"""
+
+        states = self.states.itemsize if isinstance(self.states, array) else 8
+        keys = 0
+        if self.keyed:
+            keys = 2 * (self.row_keys.itemsize if isinstance(self.row_keys, array) else 8)
+        return (states + self.blanks.itemsize + self.g.itemsize + self.f.itemsize + self.parents.itemsize
+                + self.moves.itemsize + 1 + keys)
+
+    def __len__(self):
+        return len(self.blanks)
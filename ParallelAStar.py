@@ -0,0 +1,404 @@
+# Author: Alex Hemmerlin
+# This file implements Hash Distributed A* (HDA*), one A* search spread over several worker processes
+
+from NPuzzle import NPuzzle, geometry
+from RBFS import build_path
+from Instrumentation import SearchStats
+import heapq
+import multiprocessing
+import os
+import queue
+import random
+import time
+import traceback
+
+# How many nodes a worker expands between looking at its inbox and sending the successors it has batched
+EXPAND_ROUND = 256
+
+# How long the coordinator waits between looks at the workers' counters, in seconds
+POLL_INTERVAL = 0.002
+
+# How long the coordinator waits for a message from the workers before checking they are still running, in seconds
+RESULT_TIMEOUT = 0.1
+
+
+class WorkerError(Exception):
+    """Raised by HDAStarSearch when a worker process fails or dies
+
+    - errors: a (worker, traceback or exit code message) tuple for each worker that failed
+    """
+
+    def __init__(self, errors: list[tuple[int, str]]):
+        super().__init__('; '.join(f'worker {me}: {details}' for me, details in errors))
+        self.errors = errors
+
+
+def __hda_worker__(me: int, workers: int, start: NPuzzle, heuristic, batch_size: int,
+                   inboxes: list, results, counters, incumbent):
+    """Runs one HDA* worker: it owns the states whose Zobrist key % workers == me and keeps their open and closed lists
+
+    Messages in the inbox are ('nodes', [(packed, blank, g, h, key, move, keys), ...]) from other workers,
+    ('trace', packed) asking for the move into an owned state (answered on results) and ('stop',).
+    counters holds sent, received and idle for every worker, each worker only writes its own.
+    If anything goes wrong ('error', me, traceback) is put on results and the worker stops.
+    """
+
+    try:
+        __hda_run__(me, workers, start, heuristic, batch_size, inboxes, results, counters, incumbent)
+    except Exception:
+        results.put(('error', me, traceback.format_exc()))
+
+
+def __hda_run__(me: int, workers: int, start: NPuzzle, heuristic, batch_size: int,
+                inboxes: list, results, counters, incumbent):
+    """The body of __hda_worker__"""
+
+    n = start.n
+    geo = geometry(n)
+    neighbors = geo.neighbors
+    goal = geo.goal_packed
+    inbox = inboxes[me]
+    sent_slot, received_slot, idle_slot = me, workers + me, 2 * workers + me
+
+    fringe = []
+    # the fewest moves found to each owned state and the move made into it (-1 for the start)
+    seen: dict[int, tuple[int, int]] = {}
+    outgoing = [[] for i in range(workers)]
+    counts = {'expanded': 0, 'generated': 0, 'duplicates': 0, 'pruned': 0, 'messages': 0, 'nodes_sent': 0,
+              'nodes_received': 0, 'local': 0, 'peak_fringe': 0, 'idle_time': 0.0}
+    bound = incumbent.value
+
+    def receive(packed, blank, g, h, key, move, keys):
+        old = seen.get(packed)
+        if old is not None and old[0] <= g:
+            counts['duplicates'] += 1
+            return
+        if g + h >= bound:
+            counts['pruned'] += 1
+            return
+        seen[packed] = (g, move)
+        # keys are the heuristic keys (NPuzzle.heuristic_keys) that seed the board when the node is expanded
+        heapq.heappush(fringe, (g + h, h, packed, blank, key, keys))
+
+    def send(owner):
+        counters[sent_slot] += 1
+        counts['messages'] += 1
+        counts['nodes_sent'] += len(outgoing[owner])
+        inboxes[owner].put(('nodes', outgoing[owner]))
+        outgoing[owner] = []
+
+    def handle(message) -> bool:
+        """Acts on a message, returns False once told to stop"""
+
+        if message[0] == 'nodes':
+            counters[idle_slot] = 0
+            counters[received_slot] += 1
+            counts['nodes_received'] += len(message[1])
+            for node in message[1]:
+                receive(*node)
+        elif message[0] == 'trace':
+            results.put(('trace', message[1], seen[message[1]]))
+        else:
+            return False
+        return True
+
+    if start.zobrist % workers == me:
+        receive(start.packed, start.blank, 0, heuristic(start), start.zobrist, -1, start.heuristic_keys(heuristic))
+
+    while True:
+        bound = incumbent.value
+        try:
+            while True:
+                if not handle(inbox.get_nowait()):
+                    break
+        except queue.Empty:
+            pass
+        else:
+            break
+
+        # expand a round of nodes
+        expanded = 0
+        while fringe and expanded < EXPAND_ROUND:
+            f, h, packed, blank, key, keys = heapq.heappop(fringe)
+            g = f - h
+            if seen[packed][0] != g:
+                # stale entry, a shorter path to the state was found later
+                counts['duplicates'] += 1
+                continue
+            if f >= bound:
+                # nothing left can beat the solution found
+                counts['pruned'] += len(fringe) + 1
+                fringe.clear()
+                break
+            if packed == goal:
+                with incumbent.get_lock():
+                    if g < incumbent.value:
+                        incumbent.value = g
+                bound = incumbent.value
+                continue
+
+            expanded += 1
+            board = NPuzzle.from_packed(n, packed, blank, key)
+            board.seed_heuristic(heuristic, h, keys)
+            reverse = (seen[packed][1] + 2) % 4 if seen[packed][1] >= 0 else -1
+            for move in range(4):
+                target = neighbors[blank][move]
+                if target < 0 or move == reverse:
+                    continue
+                successor = board.copy()
+                successor.move(move)
+                counts['generated'] += 1
+                node = (successor.packed, target, g + 1, heuristic(successor), successor.zobrist, move,
+                        successor.heuristic_keys(heuristic))
+                owner = successor.zobrist % workers
+                if owner == me:
+                    counts['local'] += 1
+                    receive(*node)
+                else:
+                    outgoing[owner].append(node)
+                    if len(outgoing[owner]) >= batch_size:
+                        send(owner)
+        counts['expanded'] += expanded
+        counts['peak_fringe'] = max(counts['peak_fringe'], len(fringe))
+
+        # send the partly filled batches so other workers are not left waiting for them
+        for owner in range(workers):
+            if outgoing[owner]:
+                send(owner)
+
+        if not fringe:
+            # wait for more nodes (or for the coordinator to trace the solution or stop the search)
+            counters[idle_slot] = 1
+            waited = time.perf_counter()
+            message = inbox.get()
+            counts['idle_time'] += time.perf_counter() - waited
+            if not handle(message):
+                break
+
+    results.put(('counts', me, counts))
+
+
+def HDAStarSearch(puzzle: NPuzzle, workers: int = None, heuristic=NPuzzle.manhatten_distance, batch_size: int = 64,
+                  timeout: float = None, stats: SearchStats = None):
+    """Performs Hash Distributed A* Search on the given puzzle instance over several worker processes
+
+    Every state is owned by one worker, chosen by its Zobrist key (NPuzzle.zobrist) modulo the number
+    of workers, and each worker keeps the open and closed lists of the states it owns. A worker sends
+    the successors it generates to their owners in batches of up to batch_size nodes. Once a solution
+    is found its length is shared, and workers drop nodes that cannot beat it. The search ends when
+    every worker has run out of nodes and every batch sent has been received. The solution path is then
+    traced back one owner at a time.
+
+    workers is the number of worker processes (default: one per core)
+    heuristic is any function taking an NPuzzle and returning a consistent estimate of its distance to the goal
+    (it is pickled for the workers, so a PatternDatabase should be loaded from a file)
+    timeout is the most seconds to search for
+    stats is an optional Instrumentation.SearchStats given the summed counts of the workers
+    Raises WorkerError if a worker raises an exception or dies (the other workers are stopped first).
+
+    Returns a tuple of three items including (the solution node, number of nodes generated, report)
+    where report holds the counts of every worker (see HDAStarReport). The node is None if the timeout
+    is reached. If the provided puzzle instance is not solvable, returns False without searching.
+    """
+
+    if not puzzle.is_solvable:
+        return False
+
+    workers = workers or os.cpu_count()
+    start_time = time.perf_counter()
+    deadline = time.time() + timeout if timeout is not None else None
+
+    inboxes = [multiprocessing.Queue() for i in range(workers)]
+    results = multiprocessing.Queue()
+    # sent, received and idle flag of every worker in shared memory, read by the coordinator to detect the end
+    counters = multiprocessing.Array('q', 3 * workers, lock=False)
+    incumbent = multiprocessing.Value('i', 2 ** 31 - 1)
+    processes = [multiprocessing.Process(target=__hda_worker__, daemon=True,
+                                         args=(me, workers, puzzle, heuristic, batch_size, inboxes,
+                                               results, counters, incumbent))
+                 for me in range(workers)]
+    for process in processes:
+        process.start()
+
+    node = None
+    try:
+        if __wait_for_end__(counters, workers, deadline, processes):
+            node = build_path(puzzle, __trace__(puzzle, workers, inboxes, results, processes), heuristic)
+    finally:
+        for inbox in inboxes:
+            inbox.put(('stop',))
+        worker_counts, errors = __collect__(results, processes)
+        for process in processes:
+            process.join()
+    if errors:
+        raise WorkerError(errors)
+
+    report = HDAStarReport(worker_counts, time.perf_counter() - start_time)
+    if stats is not None:
+        stats.record(report.expanded, report.generated, report.duplicates, report.peak_fringe, report.wall_time)
+    return (node, report.generated, report)
+
+
+def __wait_for_end__(counters, workers: int, deadline: float, processes: list) -> bool:
+    """Waits until every worker is idle with no batch in flight, returns False if the deadline passes or a
+    worker stops first
+
+    The idle flags and message counts are read twice and must not change in between, so a batch sent and
+    received between two reads of the counters cannot be missed.
+    """
+
+    def snapshot():
+        idle = all(counters[2 * workers + me] for me in range(workers))
+        received = sum(counters[workers:2 * workers])
+        sent = sum(counters[:workers])
+        return idle, sent, received
+
+    last = None
+    while True:
+        time.sleep(POLL_INTERVAL)
+        if deadline is not None and time.time() > deadline:
+            return False
+        if not all(process.is_alive() for process in processes):
+            return False
+        current = snapshot()
+        if current[0] and current[1] == current[2] and current == last:
+            return True
+        last = current
+
+
+def __receive__(results, processes: list) -> tuple:
+    """Returns the next message from the workers, raising WorkerError if one reports an error or has stopped"""
+
+    while True:
+        try:
+            message = results.get(timeout=RESULT_TIMEOUT)
+        except queue.Empty:
+            for me, process in enumerate(processes):
+                if not process.is_alive():
+                    raise WorkerError([(me, f'exited with code {process.exitcode}')])
+            continue
+        if message[0] == 'error':
+            raise WorkerError([(message[1], message[2])])
+        return message
+
+
+def __collect__(results, processes: list) -> tuple[list[dict], list[tuple[int, str]]]:
+    """Waits for every stopped worker's counts, returns (counts of each worker, errors)
+
+    A worker that dies without a message is given up on once it has exited and nothing more arrives.
+    """
+
+    worker_counts = [None] * len(processes)
+    errors = []
+    missing = set(range(len(processes)))
+    while missing:
+        try:
+            message = results.get(timeout=RESULT_TIMEOUT)
+        except queue.Empty:
+            if all(processes[me].exitcode is not None for me in missing):
+                # a worker flushes its messages before it exits, so these never sent theirs
+                errors.extend((me, f'exited with code {processes[me].exitcode}') for me in sorted(missing))
+                break
+            continue
+        if message[0] == 'counts':
+            worker_counts[message[1]] = message[2]
+            missing.discard(message[1])
+        elif message[0] == 'error':
+            errors.append((message[1], message[2]))
+            missing.discard(message[1])
+    return worker_counts, errors
+
+
+def __trace__(puzzle: NPuzzle, workers: int, inboxes: list, results, processes: list) -> list[int]:
+    """Returns the moves of the solution, asking the owner of each state on it for the move made into it"""
+
+    geo = geometry(puzzle.n)
+    board = NPuzzle.from_packed(puzzle.n, geo.goal_packed, geo.cells - 1)
+    moves = []
+    while board.packed != puzzle.packed:
+        inboxes[board.zobrist % workers].put(('trace', board.packed))
+        message = __receive__(results, processes)
+        g, move = message[2]
+        moves.append(move)
+        board.move((move + 2) % 4)
+    moves.reverse()
+    return moves
+
+
+class HDAStarReport:
+    """The counts of one HDAStarSearch, summed over the workers and kept per worker
+
+    - workers: the counts of each worker (expanded, generated, duplicates, pruned, messages, nodes_sent,
+      nodes_received, local, peak_fringe, idle_time)
+    - expanded/generated/duplicates/messages/nodes_sent: the sums over the workers
+    - peak_fringe: the sum of the workers' peak fringe sizes
+    - wall_time: seconds from starting the workers until they stopped
+    """
+
+    def __init__(self, workers: list[dict], wall_time: float):
+        self.workers = workers
+        self.wall_time = wall_time
+        self.expanded = sum(counts['expanded'] for counts in workers)
+        self.generated = sum(counts['generated'] for counts in workers)
+        self.duplicates = sum(counts['duplicates'] for counts in workers)
+        self.messages = sum(counts['messages'] for counts in workers)
+        self.nodes_sent = sum(counts['nodes_sent'] for counts in workers)
+        self.peak_fringe = sum(counts['peak_fringe'] for counts in workers)
+
+    def summary(self, serial_time: float = None, serial_expanded: int = None) -> dict:
+        """Returns the totals and the ratios used to tune the number of workers and batch_size
+
+        - nodes_per_message: the average batch size actually sent
+        - remote_fraction: the share of generated nodes that had to be sent to another worker
+        - load_balance: the most nodes a worker expanded over the average (1.0 is a perfect split)
+        - idle_fraction: the share of the workers' time spent waiting for nodes
+        - speedup/search_overhead: the serial time over the wall time and the expanded nodes over the serial
+          search's, when the serial search's time and expansions are given
+        """
+
+        workers = len(self.workers)
+        expanded = [counts['expanded'] for counts in self.workers]
+        summary = {
+            'workers': workers,
+            'wall_time': self.wall_time,
+            'expanded': self.expanded,
+            'generated': self.generated,
+            'duplicates': self.duplicates,
+            'messages': self.messages,
+            'nodes_sent': self.nodes_sent,
+            'nodes_per_message': self.nodes_sent / self.messages if self.messages else 0.0,
+            'remote_fraction': self.nodes_sent / self.generated if self.generated else 0.0,
+            'load_balance': max(expanded) * workers / self.expanded if self.expanded else 1.0,
+            'idle_fraction': sum(counts['idle_time'] for counts in self.workers) / (workers * self.wall_time),
+        }
+        if serial_time is not None:
+            summary['speedup'] = serial_time / self.wall_time
+        if serial_expanded:
+            summary['search_overhead'] = self.expanded / serial_expanded
+        return summary
+
+
+def main():
+    from AStarSearch import AStarSearch
+
+    p1 = NPuzzle(15, [[5,1,3,4],[9,2,7,8],[13,6,10,12],[0,14,11,15]])
+    random.seed(3)
+    for i in range(60):
+        p1.move(random.randrange(4))
+
+    print('STARTING STATE:')
+    print(p1.string())
+
+    serial = SearchStats()
+    AStarSearch(p1, stats=serial)
+    print(f'A*: {serial.expanded} NODES EXPANDED IN {serial.wall_time:.2f} SECONDS')
+
+    for workers in (1, 2, 4):
+        result, generated, report = HDAStarSearch(p1, workers=workers)
+        print(f'HDA* WITH {workers} WORKERS: PATH LENGTH {result.moves}')
+        for name, value in report.summary(serial.wall_time, serial.expanded).items():
+            print(f'  {name}: {value:.3f}' if isinstance(value, float) else f'  {name}: {value}')
+
+
+if __name__ == '__main__':
+    main()
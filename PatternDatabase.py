@@ -0,0 +1,314 @@
+# Author: Alex Hemmerlin
+# This file implements disjoint additive pattern database heuristics
+
+from NPuzzle import NPuzzle, geometry
+from BoardBatch import np, batch_geometry, distinct, rank_batch, unrank_batch
+from StateSpace import breadth_first, rank_positions, unrank_positions
+import argparse
+import math
+import mmap
+import os
+import struct
+import time
+
+# Named partitions of the tiles into disjoint groups
+PARTITIONS = {
+    '8-44': (8, ((1, 2, 3, 4), (5, 6, 7, 8))),
+    '15-555': (15, ((1, 2, 3, 5, 6), (4, 7, 8, 11, 12), (9, 10, 13, 14, 15))),
+    '15-663': (15, ((1, 5, 6, 9, 10, 13), (7, 8, 11, 12, 14, 15), (2, 3, 4))),
+    '15-78': (15, ((1, 2, 3, 4, 5, 6, 7), (8, 9, 10, 11, 12, 13, 14, 15))),
+    '24-6666': (24, ((1, 2, 5, 6, 7, 12), (3, 4, 8, 9, 13, 14), (10, 11, 15, 16, 20, 21), (17, 18, 19, 22, 23, 24))),
+}
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdb')
+
+# File layout: header then one nibble per pattern index (two per byte, low nibble first)
+MAGIC = b'NPDB'
+VERSION = 1
+HEADER = struct.Struct('<4sBBB')
+
+
+def table_size(k: int, cells: int) -> int:
+    """Number of entries in the table of a group of k tiles (cells! / (cells-k)!)"""
+
+    return math.perm(cells, k)
+
+
+def group_path(n: int, tiles, directory: str = DEFAULT_DIRECTORY) -> str:
+    """Returns the file name used to store the table of a group of tiles"""
+
+    return os.path.join(directory, f'{n}-{"_".join(str(t) for t in tiles)}.pdb')
+
+
+def build_group(n: int, tiles, verbosity: int = 1) -> bytearray:
+    """Builds the pattern database of one group of tiles by backwards breadth first search from the goal
+
+    Only moves of the group's tiles are counted (moves of the blank through other tiles are free),
+    so the tables of disjoint groups can be added together. The states searched are (pattern, blank cell)
+    pairs, enumerated by StateSpace.breadth_first, and a pattern's distance is that of its closest state.
+    Returns a bytearray with the distance of every pattern index (indexed by rank_positions).
+    """
+
+    geo = geometry(n)
+    cells = geo.cells
+    k = len(tiles)
+    size = table_size(k, cells)
+    unset = 255
+    table = bytearray([unset]) * size
+
+    def successors(code):
+        index, blank = divmod(code, cells)
+        positions = unrank_positions(index, k, cells)
+        for move, target in enumerate(geo.neighbors[blank]):
+            if target < 0:
+                continue
+            if target in positions:
+                # a pattern tile slides into the blank cell: costs one move
+                moved = positions.copy()
+                moved[moved.index(target)] = blank
+                yield rank_positions(moved, cells) * cells + target, (move + 2) % 4, 1
+            else:
+                # the blank moves through a cell no pattern tile is in: free
+                yield index * cells + target, (move + 2) % 4, 0
+
+    def visit(code, depth, move):
+        index = code // cells
+        if table[index] == unset:
+            table[index] = depth
+
+    start = rank_positions([tile - 1 for tile in tiles], cells) * cells + (cells - 1)
+    breadth_first(size * cells, [start], successors, visit, verbosity)
+    return table
+
+
+def build_group_batched(n: int, tiles, verbosity: int = 1, chunk: int = 1 << 20) -> bytearray:
+    """NumPy version of build_group, giving the same table
+
+    Each depth is worked through in waves: the states of a wave are unranked chunk states at a time,
+    every move is made on the whole chunk at once and the successors are ranked again. States reached
+    by free moves form the next wave of the same depth, states reached by pattern moves the next depth.
+    """
+
+    geo = batch_geometry(n)
+    cells = geo.cells
+    k = len(tiles)
+    size = table_size(k, cells)
+    unset = 255
+    table = np.full(size, unset, dtype=np.uint8)
+    visited = np.zeros((size * cells + 7) // 8, dtype=np.uint8)
+
+    def unvisited(codes):
+        return codes[((visited[codes >> 3] >> (codes & 7).astype(np.uint8)) & 1) == 0]
+
+    def visit(codes, depth):
+        # codes must be distinct and not yet visited
+        np.bitwise_or.at(visited, codes >> 3, (1 << (codes & 7)).astype(np.uint8))
+        indices = codes // cells
+        table[indices[table[indices] == unset]] = depth
+
+    start = rank_positions([tile - 1 for tile in tiles], cells) * cells + (cells - 1)
+    layer = [np.array([start], dtype=np.int64)]
+    depth = 0
+    begin = time.time()
+
+    while layer:
+        next_layer = []
+        states = 0
+        # States reached by a pattern move are only visited now, since a free move may have reached them first
+        wave = unvisited(distinct(np.concatenate(layer)))
+        while len(wave):
+            visit(wave, depth)
+            states += len(wave)
+            free_codes = []
+            moved_codes = []
+            for first in range(0, len(wave), chunk):
+                indices, blanks = np.divmod(wave[first:first + chunk], cells)
+                positions = unrank_batch(indices, k, cells)
+                for move in range(4):
+                    targets = geo.neighbors[blanks, move]
+                    legal = targets >= 0
+                    hits = positions == targets[:, None]
+                    pattern = hits.any(axis=1)
+
+                    # the blank moves through a cell no pattern tile is in: free
+                    free = legal & ~pattern
+                    free_codes.append(unvisited(indices[free] * cells + targets[free]))
+
+                    # a pattern tile slides into the blank cell: costs one move
+                    moved = positions[pattern]
+                    moved[hits[pattern]] = blanks[pattern]
+                    moved_codes.append(unvisited(rank_batch(moved, cells) * cells + targets[pattern]))
+            next_layer.append(distinct(np.concatenate(moved_codes)))
+            wave = distinct(np.concatenate(free_codes))
+        if verbosity >= 1:
+            filled = int(np.count_nonzero(table != unset))
+            print(f'  depth {depth}: {states} states, {filled}/{size} patterns, {time.time() - begin:.1f}s', flush=True)
+        layer = next_layer if any(len(codes) for codes in next_layer) else []
+        depth += 1
+
+    return bytearray(table)
+
+
+def pack_table(n: int, tiles, table: bytearray) -> bytearray:
+    """Packs a table of distances into nibbles
+
+    Each entry is stored as (distance - manhatten distance of the group) / 2, which is always a
+    whole number because every pattern move changes the group's manhatten distance by one.
+    Values above 15 are stored as 15, which only makes the heuristic smaller (still admissible).
+    """
+
+    geo = geometry(n)
+    cells = geo.cells
+    k = len(tiles)
+    distances = [geo.distances[tile] for tile in tiles]
+    packed = bytearray((len(table) + 1) // 2)
+    for index, depth in enumerate(table):
+        positions = unrank_positions(index, k, cells)
+        md = 0
+        for j in range(k):
+            md += distances[j][positions[j]]
+        excess = min((depth - md) // 2, 15)
+        packed[index >> 1] |= excess << ((index & 1) * 4)
+    return packed
+
+
+def pack_table_batched(n: int, tiles, table: bytearray, chunk: int = 1 << 20) -> bytearray:
+    """NumPy version of pack_table, giving the same bytes"""
+
+    geo = batch_geometry(n)
+    k = len(tiles)
+    depths = np.frombuffer(table, dtype=np.uint8)
+    if len(depths) % 2:
+        depths = np.append(depths, np.uint8(0))
+    tile_rows = np.array(tiles, dtype=np.int64)
+    excess = np.empty(len(depths), dtype=np.uint8)
+    for begin in range(0, len(table), chunk):
+        end = min(begin + chunk, len(table))
+        positions = unrank_batch(np.arange(begin, end, dtype=np.int64), k, geo.cells)
+        md = geo.distances[tile_rows, positions].sum(axis=1)
+        excess[begin:end] = np.minimum((depths[begin:end] - md) // 2, 15)
+    excess[len(table):] = 0
+    return bytearray((excess[0::2] | (excess[1::2] << 4)).tobytes())
+
+
+def save_group(n: int, tiles, packed: bytearray, directory: str = DEFAULT_DIRECTORY) -> str:
+    """Writes a packed table to its file and returns the path"""
+
+    os.makedirs(directory, exist_ok=True)
+    path = group_path(n, tiles, directory)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, n, len(tiles)))
+        f.write(bytes(tiles))
+        f.write(packed)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+class PatternDatabase:
+    """Disjoint additive pattern database heuristic loaded from memory mapped files
+
+    The tiles are split into disjoint groups, each with a table giving the number of moves
+    of that group's tiles needed to solve them. The sum over the groups is an admissible
+    heuristic that is never less than the manhatten distance.
+
+    The tables are memory mapped read only so solver processes on the same machine share
+    one copy. Call the object on a puzzle to evaluate it: pdb(puzzle), so it can be passed
+    as the heuristic of any of the searches.
+    """
+
+    def __init__(self, n: int, groups, directory: str = DEFAULT_DIRECTORY):
+        self.n = n
+        self.groups = tuple(tuple(group) for group in groups)
+        self.cells = n + 1
+        self.files = []
+        self.tables = []
+        self.offsets = []
+        tiles = sorted(tile for group in self.groups for tile in group)
+        if tiles != list(range(1, n + 1)):
+            raise ValueError('the groups must split the tiles 1..n into disjoint sets')
+        for group in self.groups:
+            path = group_path(n, group, directory)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f'{path} does not exist, build it with: python PatternDatabase.py')
+            f = open(path, 'rb')
+            table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, file_n, k = HEADER.unpack_from(table, 0)
+            if magic != MAGIC or version != VERSION or file_n != n or tuple(table[HEADER.size:HEADER.size + k]) != group:
+                raise ValueError(f'{path} is not a pattern database for tiles {group} of the {n}-puzzle')
+            self.files.append(f)
+            self.tables.append(table)
+            self.offsets.append(HEADER.size + k)
+
+    @classmethod
+    def load(cls, name: str, directory: str = DEFAULT_DIRECTORY) -> 'PatternDatabase':
+        """Loads one of the named PARTITIONS (for example '15-555')"""
+
+        n, groups = PARTITIONS[name]
+        return cls(n, groups, directory)
+
+    def __call__(self, puzzle: NPuzzle) -> int:
+        """Returns the pattern database heuristic of the puzzle"""
+
+        cells = self.cells
+        where = [0] * cells
+        for cell, tile in enumerate(puzzle.tiles):
+            where[tile] = cell
+        h = puzzle.manhatten_distance()
+        for group, table, offset in zip(self.groups, self.tables, self.offsets):
+            index = rank_positions([where[tile] for tile in group], cells)
+            h += ((table[offset + (index >> 1)] >> ((index & 1) * 4)) & 15) * 2
+        return h
+
+    def close(self):
+        """Unmaps the tables"""
+
+        for table, f in zip(self.tables, self.files):
+            table.close()
+            f.close()
+        self.tables = []
+        self.files = []
+
+
+def build(n: int, groups, directory: str = DEFAULT_DIRECTORY, verbosity: int = 1, batched: bool = None):
+    """Builds and saves the table of every group
+
+    batched chooses the NumPy versions of the build (much faster), by default they are used if NumPy is installed
+    """
+
+    if batched is None:
+        batched = np is not None
+    for tiles in groups:
+        if verbosity >= 1:
+            print(f'Building {n}-puzzle pattern database for tiles {tiles} ({table_size(len(tiles), n + 1)} entries)', flush=True)
+        start = time.time()
+        if batched:
+            table = build_group_batched(n, tiles, verbosity)
+            packed = pack_table_batched(n, tiles, table)
+        else:
+            table = build_group(n, tiles, verbosity)
+            packed = pack_table(n, tiles, table)
+        path = save_group(n, tiles, packed, directory)
+        if verbosity >= 1:
+            print(f'Saved {path} in {time.time() - start:.1f} seconds', flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Builds disjoint additive pattern databases for the n-puzzle')
+    parser.add_argument('partition', nargs='?', default='15-555',
+                        help=f'one of {", ".join(PARTITIONS)}, or N:tiles/tiles/... (for example 8:1,2,3,4/5,6,7,8)')
+    parser.add_argument('--dir', default=DEFAULT_DIRECTORY, help='directory to write the tables to')
+    parser.add_argument('--quiet', action='store_true', help='do not print progress')
+    parser.add_argument('--no-numpy', action='store_true', help='build with plain Python even if NumPy is installed')
+    args = parser.parse_args()
+
+    if args.partition in PARTITIONS:
+        n, groups = PARTITIONS[args.partition]
+    else:
+        n, groups = args.partition.split(':')
+        n = int(n)
+        groups = [tuple(int(t) for t in group.split(',')) for group in groups.split('/')]
+    build(n, groups, args.dir, 0 if args.quiet else 1, False if args.no_numpy else None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# Author: Alex Hemmerlin
+# This file implements the priority queues that can be used as the fringe of a search
+
+import heapq
+import itertools
+from typing import Any
+
+
+class BinaryHeap:
+    """Min priority queue backed by a binary heap (heapq)
+
+    Ties on f are broken in first in, first out order. Works with any comparable f value.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+
+    def push(self, item: Any, f, h: int = 0):
+        """Adds item to the queue with priority f (h is not used)"""
+
+        heapq.heappush(self.heap, (f, next(self.counter), item))
+
+    def pop(self) -> Any:
+        """Removes and returns the item with the lowest f"""
+
+        return heapq.heappop(self.heap)[2]
+
+    def min_priority(self):
+        """Returns the lowest f in the queue without removing anything"""
+
+        return self.heap[0][0]
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class BucketQueue:
+    """Min priority queue with one bucket (list) per integer f value
+
+    Push and pop are O(1) (amortized) because f values in the n-puzzle are small
+    non-negative integers that only grow during A* search. Ties on f are broken in
+    last in, first out order, which favours the most recently generated (deepest) nodes.
+    """
+
+    def __init__(self):
+        self.buckets: list[list[Any]] = []
+        self.min_f = 0
+        self.size = 0
+
+    def push(self, item: Any, f: int, h: int = 0):
+        """Adds item to the queue with priority f (h is not used)"""
+
+        while f >= len(self.buckets):
+            self.buckets.append([])
+        self.buckets[f].append(item)
+        if f < self.min_f:
+            self.min_f = f
+        self.size += 1
+
+    def pop(self) -> Any:
+        """Removes and returns an item with the lowest f"""
+
+        if self.size == 0:
+            raise IndexError('pop from an empty queue')
+        while not self.buckets[self.min_f]:
+            self.min_f += 1
+        self.size -= 1
+        return self.buckets[self.min_f].pop()
+
+    def min_priority(self) -> int:
+        """Returns the lowest f in the queue without removing anything"""
+
+        if self.size == 0:
+            raise IndexError('peek at an empty queue')
+        while not self.buckets[self.min_f]:
+            self.min_f += 1
+        return self.min_f
+
+    def __len__(self):
+        return self.size
+
+
+class TwoLevelBucketQueue:
+    """Min priority queue with buckets indexed by integer f, then by integer h
+
+    Ties on f are broken in favour of the lowest h. Because f = g + h this is the same
+    as breaking ties in favour of the highest g (the deepest node), which lets A* reach
+    the goal as soon as the last f layer is entered.
+    """
+
+    def __init__(self):
+        self.buckets: list[list[list[Any]]] = []
+        self.min_h: list[int] = []
+        self.min_f = 0
+        self.size = 0
+
+    def push(self, item: Any, f: int, h: int):
+        """Adds item to the queue with priority f, breaking ties on h"""
+
+        while f >= len(self.buckets):
+            self.buckets.append([])
+            self.min_h.append(0)
+        layer = self.buckets[f]
+        while h >= len(layer):
+            layer.append([])
+        layer[h].append(item)
+        if h < self.min_h[f]:
+            self.min_h[f] = h
+        if f < self.min_f:
+            self.min_f = f
+        self.size += 1
+
+    def pop(self) -> Any:
+        """Removes and returns an item with the lowest f, and the lowest h of those"""
+
+        if self.size == 0:
+            raise IndexError('pop from an empty queue')
+        # find the lowest non empty f layer, resetting the h pointer of layers that are emptied
+        while True:
+            layer = self.buckets[self.min_f]
+            h = self.min_h[self.min_f]
+            while h < len(layer) and not layer[h]:
+                h += 1
+            if h < len(layer):
+                break
+            self.min_h[self.min_f] = 0
+            self.min_f += 1
+        self.min_h[self.min_f] = h
+        self.size -= 1
+        return layer[h].pop()
+
+    def min_priority(self) -> int:
+        """Returns the lowest f in the queue without removing anything"""
+
+        if self.size == 0:
+            raise IndexError('peek at an empty queue')
+        while not any(self.buckets[self.min_f]):
+            self.min_h[self.min_f] = 0
+            self.min_f += 1
+        return self.min_f
+
+    def __len__(self):
+        return self.size
@@ -1,7 +1,10 @@
 # Author: Nathan Steiger
 
 from NPuzzle import NPuzzle
+from Instrumentation import SearchStats, search_stats
+from TranspositionTable import TranspositionTable
 from typing import Any
+import time
 
 
 class Node:
@@ -69,7 +72,10 @@ def generate_successor(successor: NPuzzle, parent: Node, verbosity: int):
 
 
 def RBFS(node: Node, f_limit: int, verbosity: int, num_nodes_generated: int = 0) -> Any:
-    """Recursive Best-First Search algorithm"""
+    """Recursive Best-First Search algorithm
+
+    This is the original recursive version, RBFS_Search uses RBFS_Iterative.
+    """
 
     # If the node is a goal state
 
@@ -127,16 +133,159 @@ def RBFS(node: Node, f_limit: int, verbosity: int, num_nodes_generated: int = 0)
             return result, best.priority, num_nodes_generated
 
 
-def RBFS_Search(puzzle: NPuzzle, verbosity: int = 0) -> Node:
-    """Performs Recursive Best-First Search on the given puzzle instance using the manhattan distance heuristic"""
+def expand(puzzle: NPuzzle, moves: list[int], node_f, f_values: list, heuristic=NPuzzle.manhatten_distance,
+           on_generate=None, table: TranspositionTable = None) -> int:
+    """Fills f_values[direction] with the backed up f-value of each successor of the puzzle's state
 
-    # Initialize the root node
-    root = Node(puzzle.manhatten_distance(), puzzle, None, 0)
+    Successors are generated by making each move on the puzzle and undoing it. Moves that are
+    off the board or undo the move into this state get an f-value of infinity.
+    on_generate is the SearchStats event callback (None when not observed).
+    table is an optional TranspositionTable whose stored bounds raise the successors' heuristic values.
+    Returns the number of successors generated.
+    """
+
+    generated = 0
+    g = len(moves) + 1
+    reverse = (moves[-1] + 2) % 4 if moves else -1
+    for move in range(4):
+        if move == reverse or not puzzle.move(move):
+            f_values[move] = float('inf')
+            continue
+        generated += 1
+        h = heuristic(puzzle)
+        if table is not None:
+            stored = table.probe(puzzle, g)
+            if stored > h:
+                h = stored
+        f_values[move] = max(g + h, node_f)
+        if on_generate is not None:
+            on_generate(puzzle, g, f_values[move])
+        puzzle.move((move + 2) % 4)
+    return generated
+
+
+def RBFS_Iterative(puzzle: NPuzzle, heuristic=NPuzzle.manhatten_distance, on_expand=None,
+                   on_generate=None, table: TranspositionTable = None) -> tuple[list[int], int, int, int]:
+    """Recursive Best-First Search algorithm written with an explicit stack
+
+    Works in place on puzzle: moves are made going down and undone coming back up, so only one
+    board exists. Each level of the stack keeps the f-values of its (at most 4) successors in a
+    fixed list indexed by move instead of sorting Node objects.
+    on_expand and on_generate are the SearchStats event callbacks (None when not observed).
+    With a table (a TranspositionTable), the value backed up from a state is stored for it, and
+    successors are given the stored value when it is higher than their heuristic.
+
+    Returns a tuple of (the moves to the goal or None, number of nodes generated, number of nodes
+    expanded, the deepest the stack got)
+    """
 
-    # Call RBFS algorithm
-    result, _, ng = RBFS(root, float('inf'), verbosity)
+    if puzzle.is_solved:
+        return [], 0, 0, 0
+
+    # Per depth: the successor f-values, the f-limit and the move into the state (moves[depth - 1])
+    f_values = [[0, 0, 0, 0]]
+    f_limits = [float('inf')]
+    moves = []
+    h = heuristic(puzzle)
+    if on_expand is not None:
+        on_expand(puzzle, 0, h)
+    num_nodes_generated = expand(puzzle, moves, h, f_values[0], heuristic, on_generate, table)
+    num_nodes_expanded = 1
+    max_depth = 0
+
+    while True:
+        depth = len(moves)
+        values = f_values[depth]
+
+        # Best and second best successor
+        best_move = 0
+        for move in range(1, 4):
+            if values[move] < values[best_move]:
+                best_move = move
+        best = values[best_move]
+        alternative = min(values[move] for move in range(4) if move != best_move)
+
+        # If best's priority is greater than the f-limit back its value up to the parent
+        if best > f_limits[depth] or best == float('inf'):
+            if depth == 0:
+                return None, num_nodes_generated, num_nodes_expanded, max_depth
+            if table is not None and best != float('inf'):
+                table.store(puzzle, depth, best - depth)
+            move = moves.pop()
+            puzzle.move((move + 2) % 4)
+            f_values[depth - 1][move] = best
+            continue
+
+        # Go down to the best successor
+        puzzle.move(best_move)
+        moves.append(best_move)
+        if on_expand is not None:
+            on_expand(puzzle, len(moves), best)
+        if puzzle.is_solved:
+            return moves, num_nodes_generated, num_nodes_expanded, max(max_depth, len(moves))
+
+        depth += 1
+        if depth == len(f_values):
+            f_values.append([0, 0, 0, 0])
+            f_limits.append(0)
+            max_depth = depth
+        f_limits[depth] = min(f_limits[depth - 1], alternative)
+        num_nodes_generated += expand(puzzle, moves, best, f_values[depth], heuristic, on_generate, table)
+        num_nodes_expanded += 1
+
+
+def RBFS_Search(puzzle: NPuzzle, verbosity: int = 0, heuristic=NPuzzle.manhatten_distance,
+                stats: SearchStats = None, table: TranspositionTable = None) -> Node:
+    """Performs Recursive Best-First Search on the given puzzle instance using the manhattan distance heuristic by default
+
+    Uses the explicit stack version (RBFS_Iterative) on a copy of the puzzle, so deep solutions do not
+    hit Python's recursion limit. Returns a tuple of (the solution node, number of nodes generated)
+    heuristic is any function taking an NPuzzle and returning an admissible estimate of its distance
+    to the goal, such as NPuzzle.manhatten_distance or a PatternDatabase
+    stats is an optional Instrumentation.SearchStats to fill with counters, timers and events
+    table is an optional TranspositionTable for the puzzle's size, which cuts down
+    the states RBFS expands again when it comes back to a subtree it left
+    If the provided puzzle instance is not solvable, returns (None, 0) without searching.
+    """
 
-    return result, ng
+    if not puzzle.is_solvable:
+        return None, 0
+
+    # Instrumentation is only set up (heuristic wrapped, events bound) when there are stats
+    stats = search_stats(stats, verbosity)
+    search_heuristic = heuristic
+    on_expand = on_generate = None
+    if stats is not None:
+        start_time = time.perf_counter()
+        search_heuristic = stats.wrap_heuristic(heuristic)
+        on_expand, on_generate = stats.on_expand, stats.on_generate
+
+    if table is not None:
+        table.begin(puzzle)
+
+    ng = expanded = depth = 0
+    try:
+        # Search on a copy so the given puzzle is not changed
+        moves, ng, expanded, depth = RBFS_Iterative(puzzle.copy(), search_heuristic, on_expand, on_generate,
+                                                    table)
+    finally:
+        if stats is not None:
+            stats.record(expanded, ng, 0, depth, time.perf_counter() - start_time)
+    if moves is None:
+        return None, ng
+
+    return build_path(puzzle, moves, heuristic), ng
+
+
+def build_path(puzzle: NPuzzle, moves: list[int], heuristic=NPuzzle.manhatten_distance) -> Node:
+    """Replays the moves on a copy of the puzzle and returns the Node chain ending in the last state"""
+
+    node = Node(heuristic(puzzle), puzzle.copy(), None, 0)
+    for move in moves:
+        successor = node.puzzle.copy()
+        successor.move(move)
+        node = Node(heuristic(successor) + node.moves + 1, successor, node, node.moves + 1)
+    return node
 
 
 def get_path(result: Node):
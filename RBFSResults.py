@@ -4,8 +4,8 @@ from NPuzzle import NPuzzle
 from RBFS import RBFS_Search
 import time
 
-# Changed from 50 to 10 because 50 takes forever lol (also adjusted time)
-num_problem_instances = 10
+# Back to 50 now that RBFS_Search uses the iterative in place version (10 when it was recursive)
+num_problem_instances = 50
 max_total_time = 1000 # time in seconds allotted to run the algorithm (may go over, only checks between puzzles)
 
 runtimes = []
@@ -0,0 +1,213 @@
+# Author: Alex Hemmerlin
+# This file implements a cache of optimal solutions keyed by canonical state, in memory and optionally on disk
+
+from NPuzzle import NPuzzle, TRANSPOSED_MOVES
+from RBFS import build_path
+from collections import OrderedDict
+import sqlite3
+
+
+def canonical(puzzle: NPuzzle) -> tuple[int, bool]:
+    """Returns (the canonical packed state of the puzzle, whether it is the transposed board)
+
+    A puzzle and its transpose (see NPuzzle.transposed) have the same solutions up to TRANSPOSED_MOVES,
+    so both are stored under the smaller of their two packed states.
+    """
+
+    transposed = puzzle.transposed().packed
+    if transposed < puzzle.packed:
+        return transposed, True
+    return puzzle.packed, False
+
+
+class SolutionCache:
+    """Optimal solutions of puzzles seen before, in a least recently used memory tier and an optional SQLite file
+
+    Solutions are stored by the canonical state of the puzzle (see canonical), so a board and its transpose
+    share an entry. Each state on a stored solution keeps its distance to the goal and the next move of the
+    solution, since the end of a shortest path is a shortest path too, so later puzzles that reach one of those
+    states reuse it and a lookup follows the moves state by state to rebuild the whole solution.
+    Only shortest solutions may be stored, which is what every search in this project returns.
+
+    - capacity: the most states kept in memory, the least recently used are dropped first
+    - path: a SQLite database file to also keep every solution in (shared between processes and runs), or None
+    - hits/misses: lookups that found (did not find) a solution, disk_hits: the hits that came from the file
+    """
+
+    def __init__(self, capacity: int = 100000, path: str = None):
+        self.capacity = capacity
+        # (n, canonical state) -> (distance to the goal, next move on the canonical board, 0 at the goal)
+        self.memory: OrderedDict[tuple[int, int], tuple[int, int]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.db = None
+        if path is not None:
+            # the timeout lets several worker processes write to the same file
+            self.db = sqlite3.connect(path, timeout=60)
+            self.db.execute('CREATE TABLE IF NOT EXISTS steps '
+                            '(n INTEGER, state BLOB, distance INTEGER, move INTEGER, PRIMARY KEY (n, state))')
+            self.db.commit()
+
+    def __remember__(self, key: tuple[int, int], step: tuple[int, int]):
+        """Puts an entry in the memory tier as the most recently used, dropping the oldest if it is full"""
+
+        self.memory[key] = step
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+    def __state_blob__(self, packed: int) -> bytes:
+        return packed.to_bytes((packed.bit_length() + 7) // 8, 'little')
+
+    def __step__(self, n: int, packed: int) -> tuple[tuple[int, int], bool]:
+        """Returns ((distance, next move) of a canonical state or None, whether it was read from the file)"""
+
+        key = (n, packed)
+        step = self.memory.get(key)
+        if step is not None:
+            self.memory.move_to_end(key)
+            return step, False
+        if self.db is None:
+            return None, False
+        row = self.db.execute('SELECT distance, move FROM steps WHERE n = ? AND state = ?',
+                              (n, self.__state_blob__(packed))).fetchone()
+        if row is None:
+            return None, False
+        step = (row[0], row[1])
+        self.__remember__(key, step)
+        return step, True
+
+    def get(self, puzzle: NPuzzle) -> list[int]:
+        """Returns a shortest list of moves solving the puzzle if it is cached, None if not"""
+
+        state = puzzle.copy()
+        moves = []
+        distance = None
+        from_disk = False
+        while distance != 0:
+            packed, transposed = canonical(state)
+            step, read = self.__step__(puzzle.n, packed)
+            from_disk |= read
+            # a state dropped from the memory tier (and not in the file) breaks the chain
+            if step is None or (distance is not None and step[0] != distance - 1):
+                self.misses += 1
+                return None
+            distance = step[0]
+            if distance > 0:
+                move = TRANSPOSED_MOVES[step[1]] if transposed else step[1]
+                moves.append(move)
+                state.move(move)
+        self.hits += 1
+        if from_disk:
+            self.disk_hits += 1
+        return moves
+
+    def distance(self, puzzle: NPuzzle) -> int:
+        """Returns the length of a shortest solution of the puzzle if it is in the memory tier, None if not
+
+        Made to be called for every node of a search, so it does not go to the file or change the counters.
+        """
+
+        step = self.memory.get((puzzle.n, canonical(puzzle)[0]))
+        return step[0] if step is not None else None
+
+    def put(self, puzzle: NPuzzle, moves: list[int]):
+        """Stores a shortest solution of the puzzle as the distance and next move of every state along it"""
+
+        rows = []
+        state = puzzle.copy()
+        for i in range(len(moves) + 1):
+            packed, transposed = canonical(state)
+            move = 0
+            if i < len(moves):
+                move = TRANSPOSED_MOVES[moves[i]] if transposed else moves[i]
+            step = (len(moves) - i, move)
+            self.__remember__((puzzle.n, packed), step)
+            rows.append((puzzle.n, self.__state_blob__(packed)) + step)
+            if i < len(moves):
+                state.move(moves[i])
+        if self.db is not None:
+            self.db.executemany('INSERT OR IGNORE INTO steps VALUES (?, ?, ?, ?)', rows)
+            self.db.commit()
+
+    def heuristic(self, heuristic=NPuzzle.manhatten_distance):
+        """Returns heuristic made exact for the states with a cached solution
+
+        The result is still admissible but not consistent, so use it with IDAStar_Search or RBFS_Search
+        (AStarSearch never reopens a closed state). Every call canonicalises the state, which costs about
+        as much as a full manhatten distance.
+        """
+
+        cache = self
+
+        def cached(puzzle: NPuzzle) -> int:
+            distance = cache.distance(puzzle)
+            return distance if distance is not None else heuristic(puzzle)
+        return cached
+
+    def solve(self, puzzle: NPuzzle, search, heuristic=NPuzzle.manhatten_distance, **kwargs):
+        """Returns (the solution node, True) from the cache, or solves the puzzle with search and stores the
+        solution, returning (the solution node, False). The node is None if the puzzle has no solution.
+
+        search is any search of this project, such as AStarSearch or IDAStar_Search, and kwargs are passed to it.
+        """
+
+        moves = self.get(puzzle)
+        if moves is not None:
+            return build_path(puzzle, moves, heuristic), True
+        result = search(puzzle, heuristic=heuristic, **kwargs)
+        node = result[0] if result else None
+        if node is not None:
+            self.put(puzzle, moves_of(node))
+        return node, False
+
+    def report(self) -> dict:
+        """Returns the hit and miss counters by name"""
+
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'disk_hits': self.disk_hits,
+            'hit_rate': self.hits / lookups if lookups else None,
+            'memory_entries': len(self.memory),
+        }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def moves_of(node) -> list[int]:
+    """Returns the moves from the start to a solution node, found from the blank cell of each state on the path"""
+
+    states = []
+    while node is not None:
+        states.append(node.puzzle)
+        node = node.parent
+    states.reverse()
+    moves = []
+    for before, after in zip(states, states[1:]):
+        moves.append(before.geometry.neighbors[before.blank].index(after.blank))
+    return moves
+
+
+def main():
+    from IDAStar import IDAStar_Search
+    import random
+
+    random.seed(1)
+    cache = SolutionCache()
+    puzzles = [NPuzzle(8) for i in range(20)]
+    # the transposes are solved again, and should come from the cache
+    puzzles += [p.transposed() for p in puzzles[:10]]
+    for puzzle in puzzles:
+        node, hit = cache.solve(puzzle, IDAStar_Search)
+        print(f'{node.moves} moves {"(cached)" if hit else ""}')
+    print(cache.report())
+
+
+if __name__ == '__main__':
+    main()
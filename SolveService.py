@@ -0,0 +1,442 @@
+# Author: Alex Hemmerlin
+# This file implements an asyncio solve service over HTTP, sharing searches between identical requests
+
+from NPuzzle import HEURISTICS
+from BatchSolver import ENGINES, SearchLimitExceeded, load_heuristic, parse_board, solve_one
+from SolutionCache import moves_of
+from Instrumentation import SearchStats
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+# How many expansions a search makes between looks at its cancel flag (the sampling of its on_expand events)
+CHECK_EVERY = 1000
+
+# The least time between two progress events of one search, in seconds
+PROGRESS_INTERVAL = 0.25
+
+# The largest request body read, in bytes
+MAX_BODY = 1 << 16
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+               503: 'Service Unavailable'}
+
+
+# Set in each worker process by __init_service_worker__
+_cancel_flags = None
+_progress = None
+_heuristics = {}
+
+
+def __init_service_worker__(cancel_flags, progress):
+    global _cancel_flags, _progress
+    _cancel_flags = cancel_flags
+    _progress = progress
+
+
+class SearchWatch:
+    """Search observer run inside a worker: stops the search once its cancel flag is set and posts its progress
+
+    It is added to a SearchStats with sample_every = check_every, so it sees every check_every-th expansion
+    and the check costs nothing in between. Progress is (slot, search number, f bound, nodes expanded) put
+    on the progress queue at most every PROGRESS_INTERVAL seconds (the search number keeps a late event from
+    being taken for the next search in the slot). The f bound is the highest f expanded so far, which is
+    the current f limit of A* and IDA*.
+    """
+
+    def __init__(self, slot: int, search: int, check_every: int):
+        self.slot = slot
+        self.search = search
+        self.check_every = check_every
+        self.expanded = 0
+        self.f_bound = 0
+        self.next_report = time.time() + PROGRESS_INTERVAL
+
+    def on_expand(self, puzzle, g: int, f):
+        self.expanded += self.check_every
+        if f > self.f_bound:
+            self.f_bound = f
+        if _cancel_flags[self.slot]:
+            raise SearchLimitExceeded('cancelled')
+        now = time.time()
+        if now >= self.next_report:
+            self.next_report = now + PROGRESS_INTERVAL
+            _progress.put((self.slot, self.search, self.f_bound, self.expanded))
+
+
+def __service_solve__(slot: int, search: int, puzzle, engine: str, heuristic: str, timeout: float, check_every: int) -> dict:
+    """Solves one puzzle in a worker process and returns the reply sent to its clients"""
+
+    if heuristic not in _heuristics:
+        _heuristics[heuristic] = load_heuristic(heuristic)
+    stats = SearchStats(sample_every=check_every)
+    stats.add_observer(SearchWatch(slot, search, check_every))
+    result = solve_one(0, puzzle, engine, _heuristics[heuristic], timeout, stats=stats)
+    reply = {'status': result.status, 'expanded': stats.expanded, 'generated': stats.generated,
+             'wall_time': result.wall_time}
+    if result.status == 'solved':
+        moves = moves_of(result.result[0])
+        reply['moves'] = moves
+        reply['length'] = len(moves)
+    return reply
+
+
+class ServiceBusy(Exception):
+    """Raised by SolveService.solve when too many searches are already waiting for a worker"""
+
+
+class SolveJob:
+    """One search run for every request for the same board, engine and heuristic while it is in flight
+
+    - waiters: the requests still waiting for it (it is cancelled when this drops to 0)
+    - listeners: callbacks given each progress event
+    - slot: its cancel flag while it runs on a worker, None while it waits for one
+    """
+
+    def __init__(self, key: tuple, puzzle, engine: str, heuristic: str, timeout: float):
+        self.key = key
+        self.puzzle = puzzle
+        self.engine = engine
+        self.heuristic = heuristic
+        self.timeout = timeout
+        self.future = asyncio.get_running_loop().create_future()
+        self.waiters = 0
+        self.listeners = []
+        self.slot = None
+        self.number = None
+        self.task = None
+        self.cancelled = False
+        self.started = time.time()
+        self.progress = {'f_bound': 0, 'expanded': 0}
+
+
+class SolveService:
+    """Solves puzzles on a bounded pool of worker processes for many concurrent requests
+
+    Requests for the same board with the same engine and heuristic that arrive while its search is in
+    flight join that search instead of starting another. At most workers searches run at once and at
+    most max_queued more wait for a worker; past that solve() raises ServiceBusy, so a burst of requests
+    is turned away at once rather than making every request behind it wait. A search nobody waits for
+    any more is cancelled: a waiting one is dropped before it starts, and a running one has its flag
+    in shared memory set, which the search looks at every check_every expansions.
+
+    - counts: requests, coalesced (joined a search in flight), searches, completed, cancelled and rejected
+    """
+
+    def __init__(self, workers: int = None, max_queued: int = 64, check_every: int = CHECK_EVERY):
+        self.workers = workers or os.cpu_count()
+        self.max_queued = max_queued
+        self.check_every = check_every
+        self.jobs: dict[tuple, SolveJob] = {}
+        self.running: dict[int, SolveJob] = {}
+        self.queued = 0
+        self.counts = {'requests': 0, 'coalesced': 0, 'searches': 0, 'completed': 0, 'cancelled': 0, 'rejected': 0}
+        self.pool = None
+
+    async def start(self):
+        """Starts the worker processes and the thread passing their progress to the event loop"""
+
+        self.loop = asyncio.get_running_loop()
+        self.free_slots = list(range(self.workers))
+        self.slots_free = asyncio.Semaphore(self.workers)
+        # Workers are spawned rather than forked: the pool starts them when work arrives, and a forked worker
+        # would hold a copy of every client connection open at the time, keeping it from ever closing.
+        context = multiprocessing.get_context('spawn')
+        self.cancel_flags = context.Array('b', self.workers, lock=False)
+        self.progress = context.Queue()
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=context, initializer=__init_service_worker__,
+                                        initargs=(self.cancel_flags, self.progress))
+        self.reader = threading.Thread(target=self.__read_progress__, daemon=True)
+        self.reader.start()
+
+    async def close(self):
+        """Cancels every search and stops the workers"""
+
+        for job in list(self.jobs.values()):
+            self.__cancel__(job)
+        await self.loop.run_in_executor(None, self.pool.shutdown)
+        self.progress.put(None)
+        self.reader.join()
+
+    def __read_progress__(self):
+        while True:
+            event = self.progress.get()
+            if event is None:
+                break
+            self.loop.call_soon_threadsafe(self.__on_progress__, *event)
+
+    def __on_progress__(self, slot: int, search: int, f_bound, expanded: int):
+        job = self.running.get(slot)
+        if job is None or job.number != search:
+            return
+        job.progress = {'f_bound': f_bound, 'expanded': expanded}
+        event = {'event': 'progress', 'f_bound': f_bound, 'expanded': expanded,
+                 'elapsed': time.time() - job.started}
+        for listener in job.listeners:
+            listener(event)
+
+    async def solve(self, board: str, engine: str = 'idastar', heuristic: str = 'manhatten', timeout: float = None,
+                    on_progress=None) -> dict:
+        """Solves a board (see BatchSolver.parse_board), sharing the search with identical requests in flight
+
+        on_progress is an optional callback given each progress event ({'event': 'progress', 'f_bound',
+        'expanded', 'elapsed'}) of the search.
+        timeout is the most seconds this request waits. A request that joins a search in flight waits for
+        at most its own timeout, but the search keeps the timeout of the request that started it.
+        Returns a dict with the status (see BatchSolver.BatchResult), expanded, generated and wall_time,
+        the moves and length if solved, and whether the request joined a search in flight (coalesced).
+        Raises ValueError for an unknown engine or heuristic or an illegal board and ServiceBusy when full.
+        """
+
+        if engine not in ENGINES:
+            raise ValueError(f'unknown engine {engine!r}')
+        if heuristic not in HEURISTICS and not heuristic.startswith('pdb:'):
+            raise ValueError(f'unknown heuristic {heuristic!r}')
+        puzzle = parse_board(board)
+        self.counts['requests'] += 1
+        if not puzzle.is_solvable:
+            return {'status': 'unsolvable', 'expanded': 0, 'generated': 0, 'wall_time': 0.0, 'coalesced': False}
+
+        key = (puzzle.n, puzzle.packed, engine, heuristic)
+        job = self.jobs.get(key)
+        coalesced = job is not None
+        if coalesced:
+            self.counts['coalesced'] += 1
+        else:
+            if self.waiting >= self.max_queued:
+                self.counts['rejected'] += 1
+                raise ServiceBusy(f'{self.waiting} searches are waiting for a worker')
+            job = SolveJob(key, puzzle, engine, heuristic, timeout)
+            self.jobs[key] = job
+            self.queued += 1
+            job.task = asyncio.ensure_future(self.__run__(job))
+
+        job.waiters += 1
+        if on_progress is not None:
+            job.listeners.append(on_progress)
+        try:
+            reply = await asyncio.wait_for(asyncio.shield(job.future), timeout)
+        except asyncio.TimeoutError:
+            reply = {'status': 'timeout', 'expanded': job.progress['expanded'], 'generated': None,
+                     'wall_time': time.time() - job.started}
+        finally:
+            job.waiters -= 1
+            if on_progress is not None:
+                job.listeners.remove(on_progress)
+            if job.waiters == 0 and not job.future.done():
+                self.__cancel__(job)
+        return dict(reply, coalesced=coalesced)
+
+    def __cancel__(self, job: SolveJob):
+        """Stops a search: drops it if it is waiting for a worker, else sets its cancel flag"""
+
+        if job.cancelled:
+            return
+        job.cancelled = True
+        self.counts['cancelled'] += 1
+        if self.jobs.get(job.key) is job:
+            # a request arriving now starts a new search rather than joining one being stopped
+            del self.jobs[job.key]
+        if job.slot is None:
+            job.task.cancel()
+        else:
+            self.cancel_flags[job.slot] = 1
+
+    async def __run__(self, job: SolveJob):
+        try:
+            await self.slots_free.acquire()
+        except asyncio.CancelledError:
+            # dropped while waiting for a worker
+            self.queued -= 1
+            job.future.cancel()
+            return
+        self.queued -= 1
+        job.slot = self.free_slots.pop()
+        self.cancel_flags[job.slot] = 0
+        self.running[job.slot] = job
+        self.counts['searches'] += 1
+        job.number = self.counts['searches']
+        try:
+            reply = await self.loop.run_in_executor(self.pool, __service_solve__, job.slot, job.number, job.puzzle,
+                                                    job.engine, job.heuristic, job.timeout, self.check_every)
+        except Exception as e:
+            reply = {'status': f'error: {e!r}', 'expanded': 0, 'generated': 0, 'wall_time': 0.0}
+        finally:
+            del self.running[job.slot]
+            self.free_slots.append(job.slot)
+            self.slots_free.release()
+        if reply['status'] != 'cancelled':
+            self.counts['completed'] += 1
+        if self.jobs.get(job.key) is job:
+            del self.jobs[job.key]
+        if not job.future.done():
+            job.future.set_result(reply)
+
+    @property
+    def waiting(self) -> int:
+        """The searches that will have to wait for a worker (ones not started yet, less the free workers)"""
+
+        return max(self.queued - len(self.free_slots), 0)
+
+    def status(self) -> dict:
+        """Returns the workers, the searches running and waiting, and the counts"""
+
+        return dict(self.counts, workers=self.workers, running=len(self.running), queued=self.waiting)
+
+
+async def __read_request__(reader: asyncio.StreamReader):
+    """Reads an HTTP/1.1 request, returns (method, path, body) or raises ValueError"""
+
+    line = await reader.readline()
+    parts = line.decode('latin-1').split()
+    if len(parts) != 3:
+        raise ValueError('malformed request line')
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = header.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    if length > MAX_BODY:
+        raise OverflowError(f'request body of {length} bytes')
+    body = await reader.readexactly(length) if length else b''
+    return parts[0], parts[1], body
+
+
+def __head__(code: int, content_type: str, length: int = None) -> bytes:
+    head = f'HTTP/1.1 {code} {STATUS_TEXT[code]}\r\nContent-Type: {content_type}\r\nConnection: close\r\n'
+    if length is not None:
+        head += f'Content-Length: {length}\r\n'
+    return (head + '\r\n').encode()
+
+
+async def __send_json__(writer: asyncio.StreamWriter, code: int, value: dict):
+    body = json.dumps(value).encode() + b'\n'
+    writer.write(__head__(code, 'application/json', len(body)) + body)
+    await writer.drain()
+
+
+async def handle_client(service: SolveService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Serves one HTTP connection (one request, then the connection is closed)
+
+    POST /solve with a JSON body {"board": "1 2 3 4 5 6 0 7 8", "engine", "heuristic", "timeout", "stream"}
+    replies with the result JSON of SolveService.solve. With "stream": true the reply is instead one JSON
+    object per line (application/x-ndjson): progress events while the search runs and then the result,
+    with "event": "result". GET /status replies with SolveService.status().
+    A client that closes its connection before the reply stops waiting, which cancels a search no one
+    else is waiting for.
+    """
+
+    try:
+        try:
+            method, path, body = await __read_request__(reader)
+        except OverflowError as e:
+            await __send_json__(writer, 413, {'error': str(e)})
+            return
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            await __send_json__(writer, 400, {'error': str(e)})
+            return
+
+        if path == '/status':
+            await __send_json__(writer, 200, service.status())
+            return
+        if path != '/solve':
+            await __send_json__(writer, 404, {'error': f'no such path {path}'})
+            return
+        if method != 'POST':
+            await __send_json__(writer, 405, {'error': 'use POST'})
+            return
+        try:
+            request = json.loads(body)
+            board = request['board']
+            if isinstance(board, list):
+                board = ' '.join(str(tile) for row in board for tile in (row if isinstance(row, list) else [row]))
+            stream = bool(request.get('stream', False))
+            options = {'engine': request.get('engine', 'idastar'), 'heuristic': request.get('heuristic', 'manhatten'),
+                       'timeout': request.get('timeout')}
+        except (ValueError, KeyError, TypeError) as e:
+            await __send_json__(writer, 400, {'error': f'bad request body: {e!r}'})
+            return
+
+        on_progress = None
+        if stream:
+            writer.write(__head__(200, 'application/x-ndjson'))
+
+            def on_progress(event):
+                writer.write(json.dumps(event).encode() + b'\n')
+
+        solving = asyncio.ensure_future(service.solve(board, on_progress=on_progress, **options))
+        # any read finishing means the client has closed the connection (it has nothing more to send)
+        closed = asyncio.ensure_future(reader.read(1))
+        await asyncio.wait({solving, closed}, return_when=asyncio.FIRST_COMPLETED)
+        if not solving.done():
+            solving.cancel()
+            return
+        closed.cancel()
+        try:
+            reply = solving.result()
+        except ServiceBusy as e:
+            reply, code = {'status': 'busy', 'error': str(e)}, 503
+        except ValueError as e:
+            reply, code = {'status': 'invalid', 'error': str(e)}, 400
+        else:
+            code = 200
+        if stream:
+            writer.write(json.dumps(dict(reply, event='result')).encode() + b'\n')
+            await writer.drain()
+        else:
+            await __send_json__(writer, code, reply)
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str = '127.0.0.1', port: int = 8080, unix: str = None, workers: int = None,
+                max_queued: int = 64, check_every: int = CHECK_EVERY):
+    """Runs the service until cancelled, on a Unix socket at unix if given, else on host:port"""
+
+    service = SolveService(workers, max_queued, check_every)
+    await service.start()
+
+    async def client(reader, writer):
+        await handle_client(service, reader, writer)
+
+    if unix is not None:
+        server = await asyncio.start_unix_server(client, path=unix)
+    else:
+        server = await asyncio.start_server(client, host, port)
+    print(f'Serving on {unix or f"http://{host}:{port}"} with {service.workers} workers', flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves n-puzzle solutions over HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', default=None, help='path of a Unix socket to serve on instead of host and port')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: one per core)')
+    parser.add_argument('--max-queued', type=int, default=64, help='searches that may wait for a worker')
+    parser.add_argument('--check-every', type=int, default=CHECK_EVERY,
+                        help='expansions between checks for cancellation')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.max_queued, args.check_every))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+# Author: Alex Hemmerlin
+# This file implements breadth first enumeration of whole state spaces and the solved 8-puzzle space it builds
+
+from NPuzzle import NPuzzle, geometry
+from RBFS import Node, build_path
+from Instrumentation import SearchStats
+from array import array
+import argparse
+import math
+import mmap
+import os
+import struct
+import time
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdb')
+
+# The move stored for a start state, and for both arrays of a rank that is not a reachable board
+NO_MOVE = 4
+UNREACHED = 255
+
+# File layout: header, one distance byte per board rank, then one move byte per board rank
+MAGIC = b'NSSP'
+VERSION = 1
+HEADER = struct.Struct('<4sBB')
+
+
+def rank_positions(positions, cells: int) -> int:
+    """Returns the rank of a list of distinct cells in [0, cells!/(cells-k)!)
+
+    The rank of the i-th position is the number of cells smaller than it that are not
+    already used by an earlier position, so every k-permutation of cells gets a unique index.
+    With k = cells this is the Lehmer code of a permutation.
+    """
+
+    r = 0
+    for i, p in enumerate(positions):
+        smaller = 0
+        for q in positions[:i]:
+            if q < p:
+                smaller += 1
+        r = r * (cells - i) + p - smaller
+    return r
+
+
+def unrank_positions(index: int, k: int, cells: int) -> list[int]:
+    """Inverse of rank_positions: returns the k distinct cells with the given rank"""
+
+    digits = [0] * k
+    for i in range(k - 1, -1, -1):
+        index, digits[i] = divmod(index, cells - i)
+    free = list(range(cells))
+    return [free.pop(digit) for digit in digits]
+
+
+def breadth_first(size: int, starts, successors, on_visit, verbosity: int = 0) -> int:
+    """Visits every state reachable from starts in order of distance, without keeping anything but the frontier
+
+    States are ints in [0, size). successors(state) yields (successor, move back, cost) for each move out of
+    state, where move back (0 to 3) is the move that returns from the successor to state and cost is 1,
+    or 0 for a free move (a successor reached by a free move is as far from the starts as state).
+    on_visit(state, depth, move back) is called exactly once for each state, with its final depth and the
+    move back toward the starts it was first reached with (NO_MOVE for a start).
+
+    The visited set is one bit per state and each depth's frontier is an array of 64 bit ints, so this
+    is the enumeration used both for the full 8-puzzle space (build_space) and for pattern databases.
+    Returns the number of states visited.
+    """
+
+    visited = bytearray((size + 7) // 8)
+    # each frontier entry is state << 3 | move back
+    layer = array('Q', (start << 3 | NO_MOVE for start in starts))
+    depth = 0
+    count = 0
+    begin = time.time()
+
+    while layer:
+        next_layer = array('Q')
+        # The first states in the layer were reached by a move costing 1 from the previous layer and are
+        # only marked visited here, since a free move may have reached them at a lower depth. States
+        # after them were reached by free moves in this layer and were marked when added.
+        reached = len(layer)
+        i = 0
+        while i < len(layer):
+            entry = layer[i]
+            i += 1
+            state = entry >> 3
+            if i <= reached:
+                bit = 1 << (state & 7)
+                if visited[state >> 3] & bit:
+                    continue
+                visited[state >> 3] |= bit
+            on_visit(state, depth, entry & 7)
+            count += 1
+            for successor, move, cost in successors(state):
+                bit = 1 << (successor & 7)
+                if visited[successor >> 3] & bit:
+                    continue
+                if cost:
+                    next_layer.append(successor << 3 | move)
+                else:
+                    visited[successor >> 3] |= bit
+                    layer.append(successor << 3 | move)
+        if verbosity >= 1:
+            print(f'  depth {depth}: {len(layer)} states, {count} visited, {time.time() - begin:.1f}s', flush=True)
+        layer = next_layer
+        depth += 1
+
+    return count
+
+
+def space_size(n: int) -> int:
+    """Returns the number of board ranks of the n-puzzle ((n + 1)!, half of them reachable)"""
+
+    return math.factorial(n + 1)
+
+
+def build_space(n: int = 8, verbosity: int = 1) -> tuple[bytearray, bytearray]:
+    """Enumerates every board of the n-puzzle reachable from the goal (181,440 for the 8-puzzle)
+
+    Boards are numbered by the Lehmer code of their tiles in row major order (rank_positions).
+    Returns (distances, moves): byte arrays indexed by rank holding the number of moves to solve
+    each board and a move of the blank space that starts a shortest solution (UNREACHED for the
+    ranks of unsolvable boards, and NO_MOVE as the move of the goal).
+    """
+
+    geo = geometry(n)
+    cells = geo.cells
+    size = space_size(n)
+    distances = bytearray([UNREACHED]) * size
+    moves = bytearray([UNREACHED]) * size
+
+    def successors(rank):
+        tiles = unrank_positions(rank, cells, cells)
+        blank = tiles.index(0)
+        for move, target in enumerate(geo.neighbors[blank]):
+            if target < 0:
+                continue
+            tiles[blank], tiles[target] = tiles[target], 0
+            yield rank_positions(tiles, cells), (move + 2) % 4, 1
+            tiles[target], tiles[blank] = tiles[blank], 0
+
+    def visit(rank, depth, move):
+        distances[rank] = depth
+        moves[rank] = move
+
+    if size > 2 ** 32:
+        raise ValueError(f'the {n}-puzzle has too many states to enumerate')
+    breadth_first(size, [rank_positions(geo.goal_tiles, cells)], successors, visit, verbosity)
+    return distances, moves
+
+
+def space_path(n: int, directory: str = DEFAULT_DIRECTORY) -> str:
+    """Returns the file name used to store the state space of the n-puzzle"""
+
+    return os.path.join(directory, f'{n}.space')
+
+
+def save_space(n: int, distances: bytearray, moves: bytearray, directory: str = DEFAULT_DIRECTORY) -> str:
+    """Writes a built state space to its file and returns the path"""
+
+    os.makedirs(directory, exist_ok=True)
+    path = space_path(n, directory)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, n))
+        f.write(distances)
+        f.write(moves)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+class StateSpace:
+    """The distance and a shortest solution move of every board of a small n-puzzle, memory mapped from the
+    file written by save_space
+
+    Solves any board in O(solution length) with no search by following the stored moves (solve), and
+    calling it on a puzzle returns the exact distance, so it can be passed as the heuristic of any search.
+    The file is mapped read only, so solver processes on the same machine share one copy.
+    """
+
+    def __init__(self, n: int = 8, directory: str = DEFAULT_DIRECTORY):
+        path = space_path(n, directory)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f'{path} does not exist, build it with: python StateSpace.py {n}')
+        self.n = n
+        self.cells = n + 1
+        self.size = space_size(n)
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, file_n = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION or file_n != n or len(self.data) != HEADER.size + 2 * self.size:
+            raise ValueError(f'{path} is not a state space of the {n}-puzzle')
+        self.distances = HEADER.size
+        self.moves = HEADER.size + self.size
+
+    def rank(self, puzzle: NPuzzle) -> int:
+        """Returns the index of the puzzle's board in the arrays"""
+
+        return rank_positions(puzzle.tiles, self.cells)
+
+    def distance(self, puzzle: NPuzzle) -> int:
+        """Returns the number of moves in a shortest solution of the puzzle, None if it is not solvable"""
+
+        distance = self.data[self.distances + self.rank(puzzle)]
+        return None if distance == UNREACHED else distance
+
+    def __call__(self, puzzle: NPuzzle) -> int:
+        """Returns the exact distance of the puzzle to the goal (the perfect heuristic)"""
+
+        return self.data[self.distances + self.rank(puzzle)]
+
+    def best_move(self, puzzle: NPuzzle) -> int:
+        """Returns a move (UP, RIGHT, DOWN or LEFT) that starts a shortest solution of the puzzle,
+        NO_MOVE if it is solved and None if it is not solvable"""
+
+        move = self.data[self.moves + self.rank(puzzle)]
+        return None if move == UNREACHED else move
+
+    def solve(self, puzzle: NPuzzle) -> list[int]:
+        """Returns the moves of a shortest solution of the puzzle, found by following the best moves
+
+        Returns None if the puzzle is not solvable.
+        """
+
+        if puzzle.n != self.n:
+            raise ValueError(f'this is the state space of the {self.n}-puzzle, not the {puzzle.n}-puzzle')
+        board = puzzle.copy()
+        moves = []
+        move = self.best_move(board)
+        if move is None:
+            return None
+        while move != NO_MOVE:
+            moves.append(move)
+            board.move(move)
+            move = self.best_move(board)
+        return moves
+
+    def close(self):
+        """Unmaps the file"""
+
+        self.data.close()
+        self.file.close()
+
+
+# The StateSpace of each puzzle size loaded by OracleSearch so far
+_spaces: dict[int, StateSpace] = {}
+
+
+def OracleSearch(puzzle: NPuzzle, verbosity: int = 0, heuristic=NPuzzle.manhatten_distance,
+                 stats: SearchStats = None, space: StateSpace = None) -> Node:
+    """Solves the puzzle with no search by following the best moves of its StateSpace
+
+    space is the StateSpace to use, by default the one saved for the puzzle's size (loaded once per process)
+    heuristic is only used for the priorities of the returned nodes, like build_path
+    Returns a tuple of (the solution node, number of boards looked up), the same as RBFS_Search.
+    If the provided puzzle instance is not solvable, returns (None, 0).
+    """
+
+    if not puzzle.is_solvable:
+        return None, 0
+    start_time = time.perf_counter()
+    if space is None:
+        space = _spaces.get(puzzle.n)
+        if space is None:
+            space = StateSpace(puzzle.n)
+            _spaces[puzzle.n] = space
+    moves = space.solve(puzzle)
+    if verbosity >= 1:
+        print(f'{len(moves)} moves looked up')
+    if stats is not None:
+        stats.record(len(moves), len(moves) + 1, 0, 0, time.perf_counter() - start_time)
+    return build_path(puzzle, moves, heuristic), len(moves) + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Enumerates every board of a small n-puzzle by breadth first search')
+    parser.add_argument('n', nargs='?', type=int, default=8)
+    parser.add_argument('--dir', default=DEFAULT_DIRECTORY, help='directory to write the state space to')
+    parser.add_argument('--quiet', action='store_true', help='do not print progress')
+    args = parser.parse_args()
+
+    print(f'Building the {args.n}-puzzle state space ({space_size(args.n)} ranks)', flush=True)
+    start = time.time()
+    distances, moves = build_space(args.n, 0 if args.quiet else 1)
+    path = save_space(args.n, distances, moves, args.dir)
+    print(f'Saved {path} in {time.time() - start:.1f} seconds')
+
+    space = StateSpace(args.n, args.dir)
+    p1 = NPuzzle(args.n)
+    print('STARTING STATE:')
+    print(p1.string())
+    start = time.perf_counter()
+    moves = space.solve(p1)
+    print(f'PATH LENGTH: {len(moves)} FOUND IN {(time.perf_counter() - start) * 1000:.2f} MILLISECONDS')
+
+
+if __name__ == '__main__':
+    main()
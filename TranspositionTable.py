@@ -0,0 +1,150 @@
+# Author: Alex Hemmerlin
+# This file implements a fixed size transposition table of distance lower bounds for the depth first searches
+
+from NPuzzle import NPuzzle, geometry
+from array import array
+
+# The largest lower bound or depth an entry can hold
+MAX_VALUE = 2 ** 16 - 1
+
+
+class TranspositionTable:
+    """Lower bounds on the distance to the goal learned by IDA* and RBFS, in preallocated arrays of slots
+
+    A state goes in slot zobrist % slots (see NPuzzle.zobrist) with the number of moves it was reached in (g)
+    and the lowest f found below it, less g, once its successors have been searched. The successors searched
+    leave out the move back to the parent, so the bound only holds for paths that reach the state in at least
+    g moves (a path that reaches it in fewer could go on through that parent). probe() only returns it then.
+    The g values only mean something for one start state, so a table is emptied when a search from another
+    start begins (see begin).
+
+    When two states want the same slot the one found with the deeper search below it (the higher bound)
+    stays (replace by depth), so the entries that save the most work are kept.
+
+    - slots: the number of entries, from the memory given
+    - start: the packed board of the start state the entries were found from
+    - keys/depths/bounds: the packed board (0 for an empty slot), g and lower bound of each entry
+    - probes/hits: lookups and the lookups that returned a bound
+    - collisions: lookups that found another state in the slot
+    - stores/replacements/rejections: entries written, the writes that dropped another state and the
+      writes not made because the slot held a deeper entry
+    """
+
+    def __init__(self, n: int, max_bytes: int = 64 * 2 ** 20):
+        geo = geometry(n)
+        self.n = n
+        wide = geo.cells * geo.bits > 64
+        # a list holds a reference per slot, the ints themselves are only made when stored
+        entry_bytes = (8 if wide else array('Q').itemsize) + 2 * array('H').itemsize
+        self.slots = max(max_bytes // entry_bytes, 1)
+        self.keys = [0] * self.slots if wide else array('Q', bytes(8 * self.slots))
+        self.depths = array('H', bytes(2 * self.slots))
+        self.bounds = array('H', bytes(2 * self.slots))
+        self.start = None
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0
+        self.stores = 0
+        self.replacements = 0
+        self.rejections = 0
+
+    def begin(self, puzzle: NPuzzle):
+        """Gets the table ready for a search from puzzle, emptying it if its entries came from another start"""
+
+        if puzzle.n != self.n:
+            raise ValueError(f'the table is for the {self.n}-puzzle, not the {puzzle.n}-puzzle')
+        if self.start != puzzle.packed:
+            self.clear()
+            self.start = puzzle.packed
+
+    def probe(self, puzzle: NPuzzle, g: int) -> int:
+        """Returns the lower bound stored for the puzzle's state if it was stored with at most g moves, else 0"""
+
+        self.probes += 1
+        slot = puzzle.zobrist % self.slots
+        key = self.keys[slot]
+        if key != puzzle.packed:
+            if key:
+                self.collisions += 1
+            return 0
+        if self.depths[slot] > g:
+            return 0
+        self.hits += 1
+        return self.bounds[slot]
+
+    def store(self, puzzle: NPuzzle, g: int, bound: int):
+        """Stores a lower bound on the distance to the goal of the puzzle's state, found after reaching it in g moves
+
+        An entry for the same state is kept if it was stored with fewer moves, or as many and a higher bound.
+        """
+
+        bound = min(bound, MAX_VALUE)
+        g = min(g, MAX_VALUE)
+        slot = puzzle.zobrist % self.slots
+        key = self.keys[slot]
+        if key == puzzle.packed:
+            if self.depths[slot] < g or (self.depths[slot] == g and self.bounds[slot] >= bound):
+                self.rejections += 1
+                return
+        elif key:
+            if self.bounds[slot] > bound:
+                self.rejections += 1
+                return
+            self.replacements += 1
+        self.keys[slot] = puzzle.packed
+        self.depths[slot] = g
+        self.bounds[slot] = bound
+        self.stores += 1
+
+    def clear(self):
+        """Empties every slot (the counters are kept)"""
+
+        self.keys = [0] * self.slots if isinstance(self.keys, list) else array('Q', bytes(8 * self.slots))
+
+    def bytes_used(self) -> int:
+        """Returns the bytes taken by the slots (for a list of keys only the references are counted)"""
+
+        keys = self.keys.itemsize if isinstance(self.keys, array) else 8
+        return self.slots * (keys + self.depths.itemsize + self.bounds.itemsize)
+
+    def report(self) -> dict:
+        """Returns the counters by name"""
+
+        return {
+            'slots': self.slots,
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.probes if self.probes else None,
+            'collisions': self.collisions,
+            'stores': self.stores,
+            'replacements': self.replacements,
+            'rejections': self.rejections,
+            'filled': sum(1 for key in self.keys if key) / self.slots,
+        }
+
+
+def main():
+    from IDAStar import IDAStar_Search
+    from RBFS import RBFS_Search
+    from Instrumentation import SearchStats
+    import random
+
+    random.seed(1)
+    p1 = NPuzzle(15, [[1,2,3,4],[5,6,7,8],[9,10,11,12],[13,14,15,0]])
+    for i in range(300):
+        p1.move(random.randrange(4))
+    print('STARTING STATE:')
+    print(p1.string())
+
+    for search in (IDAStar_Search, RBFS_Search):
+        for table in (None, TranspositionTable(15, 16 * 2 ** 20)):
+            stats = SearchStats()
+            result = search(p1, stats=stats, table=table)
+            print(f'{search.__name__} {"WITHOUT" if table is None else "WITH"} A TRANSPOSITION TABLE: PATH LENGTH '
+                  f'{result[0].moves}, {stats.expanded} NODES EXPANDED IN {stats.wall_time:.2f} SECONDS')
+            if table is not None:
+                print(table.report())
+
+
+if __name__ == '__main__':
+    main()